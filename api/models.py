@@ -0,0 +1 @@
+# The API serves models from the other apps, and has none of its own.
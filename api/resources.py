@@ -0,0 +1,184 @@
+"""
+The kinds of objects served by the JSON API, and how each is serialized.
+
+Each :py:class:`Resource` names the fields it can serialize. Simple fields
+come from the object's own row (and rows joined with ``select_related``);
+related fields, such as a recipe's ingredients, are loaded for a whole list of
+objects at once by the resource's `prefetch` method, and only when they were
+asked for. Serializing any number of objects therefore takes a fixed number of
+queries.
+"""
+
+from core.models import Food, Unit, FoodNutritionInfo
+from core.helpers import prefetch_one_to_one
+from cookbook.models import Recipe, Ingredient
+from diet.models import Meal
+from nutrition.vector import NutritionVector
+
+
+def _name(obj):
+    """Return the name of `obj`, or None if there is no `obj`.
+    """
+    return obj.name if obj else None
+
+
+def _nutrition(nutrition_info):
+    """Return a dict of all nutrients in `nutrition_info`, which may be None.
+    """
+    if nutrition_info is None:
+        return NutritionVector().fields()
+    return nutrition_info.vector().fields()
+
+
+class Resource (object):
+    """A kind of object served by the API.
+
+    `fields` maps each field name to a function returning its value for an
+    object; `default_fields` are those returned when none are asked for.
+    """
+    name = None
+    model = None
+    fields = {}
+    default_fields = ()
+
+    def queryset(self):
+        """Return a queryset of all objects, with what the simple fields need
+        joined in.
+        """
+        return self.model.objects.all()
+
+
+    def prefetch(self, objects, fields):
+        """Load whatever the given `fields` need for all of `objects` at once.
+        """
+        pass
+
+
+    def serialize(self, objects, fields):
+        """Return a list of dicts with the given `fields` of each object.
+        """
+        self.prefetch(objects, fields)
+        return [
+            dict((field, self.fields[field](obj)) for field in fields)
+            for obj in objects
+        ]
+
+
+class UnitResource (Resource):
+    name = 'units'
+    model = Unit
+    fields = {
+        'id': lambda unit: unit.id,
+        'name': lambda unit: unit.name,
+        'abbreviation': lambda unit: unit.abbreviation,
+        'kind': lambda unit: unit.kind,
+    }
+    default_fields = ('id', 'name', 'abbreviation', 'kind')
+
+
+class FoodResource (Resource):
+    name = 'foods'
+    model = Food
+    fields = {
+        'id': lambda food: food.id,
+        'name': lambda food: food.name,
+        'food_group': lambda food: _name(food.food_group),
+        'grams_per_ml': lambda food: food.grams_per_ml,
+        'nutrition': lambda food: [
+            dict(quantity=info.quantity, unit=_name(info.unit), **_nutrition(info))
+            for info in food._api_nutrition
+        ],
+    }
+    default_fields = ('id', 'name', 'food_group', 'grams_per_ml', 'nutrition')
+
+    def queryset(self):
+        return Food.objects.select_related('food_group')
+
+
+    def prefetch(self, objects, fields):
+        if 'nutrition' in fields:
+            by_food = dict((food.id, []) for food in objects)
+            for info in FoodNutritionInfo.objects.filter(food__in=by_food.keys()) \
+                    .select_related('unit').order_by('pk'):
+                by_food[info.food_id].append(info)
+            for food in objects:
+                food._api_nutrition = by_food[food.id]
+
+
+class RecipeResource (Resource):
+    name = 'recipes'
+    model = Recipe
+    fields = {
+        'id': lambda recipe: recipe.id,
+        'name': lambda recipe: recipe.name,
+        'url': lambda recipe: recipe.get_absolute_url(),
+        'category': lambda recipe: _name(recipe.category),
+        'num_portions': lambda recipe: recipe.num_portions,
+        'portion': lambda recipe: _name(recipe.portion),
+        'source': lambda recipe: recipe.source,
+        'rating': lambda recipe: recipe.rating,
+        'preheat': lambda recipe: recipe.preheat,
+        'prep_minutes': lambda recipe: recipe.prep_minutes,
+        'inactive_prep_minutes': lambda recipe: recipe.inactive_prep_minutes,
+        'cook_minutes': lambda recipe: recipe.cook_minutes,
+        'directions': lambda recipe: recipe.directions,
+        'modified': lambda recipe: recipe.modified,
+        'ingredients': lambda recipe: [
+            {
+                'id': ingredient.id,
+                'quantity': ingredient.quantity,
+                'unit': _name(ingredient.unit),
+                'food': ingredient.food.name,
+                'food_id': ingredient.food_id,
+                'preparation': _name(ingredient.preparation),
+                'category': _name(ingredient.category),
+                'optional': ingredient.optional,
+                'text': unicode(ingredient),
+            }
+            for ingredient in recipe._api_ingredients
+        ],
+        'nutrition': lambda recipe: _nutrition(
+            getattr(recipe, '_nutrition_info_cache', None)),
+    }
+    default_fields = ('id', 'name', 'url', 'category', 'num_portions', 'portion',
+                      'source', 'rating', 'ingredients', 'nutrition')
+
+    def queryset(self):
+        return Recipe.objects.select_related('category', 'portion')
+
+
+    def prefetch(self, objects, fields):
+        if 'ingredients' in fields:
+            by_recipe = dict((recipe.id, []) for recipe in objects)
+            ingredients = Ingredient.objects.filter(recipe__in=by_recipe.keys()) \
+                    .select_related('unit', 'food', 'preparation', 'category') \
+                    .order_by('pk')
+            for ingredient in ingredients:
+                by_recipe[ingredient.recipe_id].append(ingredient)
+            for recipe in objects:
+                recipe._api_ingredients = by_recipe[recipe.id]
+        if 'nutrition' in fields:
+            prefetch_one_to_one(objects, 'nutrition_info')
+
+
+class MealResource (Resource):
+    name = 'meals'
+    model = Meal
+    fields = {
+        'id': lambda meal: meal.id,
+        'date': lambda meal: meal.date,
+        'kind': lambda meal: meal.kind,
+        'recipe': lambda meal: meal.recipe_id,
+        'recipe_name': lambda meal: meal.recipe.name,
+    }
+    default_fields = ('id', 'date', 'kind', 'recipe', 'recipe_name')
+
+    def queryset(self):
+        return Meal.objects.select_related('recipe')
+
+
+# All resources, by name
+RESOURCES = dict(
+    (resource.name, resource)
+    for resource in (UnitResource(), FoodResource(), RecipeResource(), MealResource())
+)
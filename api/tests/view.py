@@ -0,0 +1,124 @@
+from datetime import date
+from django.test import TestCase
+from django.test.client import Client
+from django.core.urlresolvers import reverse
+from django.utils import simplejson
+from core.middleware import run_after_request
+from core.models import Food, Unit
+from cookbook.models import Recipe
+from diet.models import Meal
+
+class ApiTest (TestCase):
+    fixtures = [
+        'test_food',
+        'test_unit',
+        'test_equivalence',
+        'test_food_nutrition_info',
+        'test_nutrition_info',
+        'test_recipe',
+        'test_recipe_nutrition_info',
+    ]
+    def setUp(self):
+        self.client = Client()
+        self.pancakes = Recipe.objects.get(name='Pancakes')
+        self.egg = Food.objects.get(name='egg')
+        self.cup = Unit.objects.get(name='cup')
+        self.flour = Food.objects.get(name='all-purpose flour')
+
+
+    def get(self, resource_name, object_id=None, **params):
+        """Get the given resource (or one object of it), and return the
+        decoded JSON response.
+        """
+        if object_id is None:
+            url = reverse('api_list', args=[resource_name])
+        else:
+            url = reverse('api_show', args=[resource_name, object_id])
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return simplejson.loads(response.content)
+
+
+    def test_recipe(self):
+        """Get a recipe with its ingredients and nutrition.
+        """
+        self.pancakes.ingredients.create(quantity=2, food=self.egg)
+        self.pancakes.ingredients.create(quantity=0.5, unit=self.cup, food=self.flour)
+        recipe = self.get('recipes', self.pancakes.id)
+        self.assertEqual(recipe['name'], 'Pancakes')
+        self.assertEqual(recipe['url'], self.pancakes.get_absolute_url())
+        self.assertEqual([i['text'] for i in recipe['ingredients']],
+                         ['2 eggs', '1/2 cup all-purpose flour'])
+        self.assertEqual(recipe['nutrition']['calories'],
+                         self.pancakes.nutrition_info.calories)
+        self.assertTrue('fiber' in recipe['nutrition'])
+
+
+    def test_fields(self):
+        """Only the fields asked for are returned; unknown ones are an error.
+        """
+        recipe = self.get('recipes', self.pancakes.id, fields='name,rating')
+        self.assertEqual(recipe, {'name': 'Pancakes', 'rating': 5})
+        response = self.client.get(reverse('api_list', args=['recipes']),
+                                   {'fields': 'name,flavor'})
+        self.assertEqual(response.status_code, 400)
+
+
+    def test_batch_and_query_count(self):
+        """Many recipes are fetched by id in a fixed number of queries.
+        """
+        recipes = [Recipe.objects.create(name='Recipe %d' % i) for i in range(5)]
+        for recipe in recipes:
+            recipe.ingredients.create(quantity=1, food=self.egg)
+        ids = ','.join(str(recipe.id) for recipe in recipes[1:4])
+        # Catch up on the changes above, as the end of a request would
+        run_after_request()
+        # Recipes, ingredients and nutrition
+        with self.assertNumQueries(3):
+            data = self.get('recipes', ids=ids)
+        self.assertEqual([r['id'] for r in data['objects']],
+                         [recipe.id for recipe in recipes[1:4]])
+        with self.assertNumQueries(1):
+            self.get('recipes', ids=ids, fields='id,name,category')
+
+
+    def test_cursor_pagination(self):
+        """Listing follows the `next` cursor until there are no more.
+        """
+        expected = list(Unit.objects.order_by('pk').values_list('name', flat=True))
+        names = []
+        params = {'limit': 7}
+        while True:
+            data = self.get('units', **params)
+            self.assertTrue(len(data['objects']) <= 7)
+            names += [unit['name'] for unit in data['objects']]
+            if not data['next']:
+                break
+            params['after'] = data['next']
+        self.assertEqual(names, expected)
+
+
+    def test_foods_and_meals(self):
+        """Get foods with their nutrition, and meals.
+        """
+        food = self.get('foods', self.flour.id)
+        self.assertEqual(food['name'], 'all-purpose flour')
+        self.assertEqual(food['nutrition'][0]['unit'], 'cup')
+
+        meal = Meal.objects.create(date=date(2011, 6, 1), kind='lunch',
+                                   recipe=self.pancakes)
+        data = self.get('meals')
+        self.assertEqual(data['objects'], [{
+            'id': meal.id, 'date': '2011-06-01', 'kind': 'lunch',
+            'recipe': self.pancakes.id, 'recipe_name': 'Pancakes',
+        }])
+
+
+    def test_not_found(self):
+        """Unknown resources and objects give a 404.
+        """
+        self.assertEqual(self.client.get('/api/spoons/').status_code, 404)
+        self.assertEqual(
+            self.client.get(reverse('api_show', args=['recipes', 999])).status_code,
+            404)
@@ -0,0 +1,7 @@
+from django.conf.urls.defaults import patterns, url
+
+urlpatterns = patterns(
+    'api.views',
+    url(r'^(?P<resource_name>\w+)/$', 'list_objects', name='api_list'),
+    url(r'^(?P<resource_name>\w+)/(?P<object_id>\d+)/$', 'show_object', name='api_show'),
+)
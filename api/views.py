@@ -0,0 +1,110 @@
+"""
+Read-only JSON API for recipes, foods, units and meals.
+
+``/api/<resource>/`` lists objects in order of id, `DEFAULT_LIMIT` at a time
+(or ``?limit=``, up to `MAX_LIMIT`). The response includes a ``next`` cursor
+when there are more; pass it back as ``?after=`` for the following page.
+``?ids=1,2,3`` fetches the objects with the given ids instead.
+``/api/<resource>/<id>/`` fetches a single object.
+
+All of these accept ``?fields=name,category`` to return only the given
+fields; see :py:mod:`api.resources` for the fields of each resource.
+"""
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseBadRequest, Http404
+from django.utils import simplejson
+from api.resources import RESOURCES
+
+# Number of objects listed per page by default
+DEFAULT_LIMIT = 100
+
+# Most objects that may be listed or fetched at once
+MAX_LIMIT = 500
+
+
+class BadRequest (Exception):
+    """A request with invalid parameters.
+    """
+    pass
+
+
+def _json(data):
+    return HttpResponse(simplejson.dumps(data, cls=DjangoJSONEncoder),
+                        mimetype='application/json')
+
+
+def _resource(name):
+    """Return the resource with the given name, or raise Http404.
+    """
+    try:
+        return RESOURCES[name]
+    except KeyError:
+        raise Http404
+
+
+def _fields(request, resource):
+    """Return the fields asked for in `request`, or the resource's defaults.
+    """
+    if not request.GET.get('fields'):
+        return resource.default_fields
+    fields = request.GET['fields'].split(',')
+    unknown = [field for field in fields if field not in resource.fields]
+    if unknown:
+        raise BadRequest("Unknown fields: %s" % ', '.join(unknown))
+    return fields
+
+
+def _int(text, name):
+    try:
+        return int(text)
+    except ValueError:
+        raise BadRequest("%s must be a number" % name)
+
+
+def list_objects(request, resource_name):
+    """List one page of objects, or those with the given ids.
+    """
+    resource = _resource(resource_name)
+    try:
+        fields = _fields(request, resource)
+        objects = resource.queryset().order_by('pk')
+        next_cursor = None
+        if request.GET.get('ids'):
+            ids = [_int(pk, 'ids') for pk in request.GET['ids'].split(',')]
+            if len(ids) > MAX_LIMIT:
+                raise BadRequest("At most %d ids may be fetched at once" % MAX_LIMIT)
+            objects = list(objects.filter(pk__in=ids))
+        else:
+            limit = min(_int(request.GET.get('limit', DEFAULT_LIMIT), 'limit'), MAX_LIMIT)
+            if limit < 1:
+                raise BadRequest("limit must be positive")
+            if request.GET.get('after'):
+                objects = objects.filter(pk__gt=_int(request.GET['after'], 'after'))
+            # One more than needed, to see whether there are more
+            objects = list(objects[:limit + 1])
+            if len(objects) > limit:
+                objects = objects[:limit]
+                next_cursor = objects[-1].pk
+    except BadRequest, error:
+        return HttpResponseBadRequest(str(error))
+
+    return _json({
+        'objects': resource.serialize(objects, fields),
+        'next': next_cursor,
+    })
+
+
+def show_object(request, resource_name, object_id):
+    """Show a single object.
+    """
+    resource = _resource(resource_name)
+    try:
+        fields = _fields(request, resource)
+    except BadRequest, error:
+        return HttpResponseBadRequest(str(error))
+    try:
+        obj = resource.queryset().get(pk=object_id)
+    except resource.model.DoesNotExist:
+        raise Http404
+    return _json(resource.serialize([obj], fields)[0])
@@ -1,6 +1,8 @@
 from django import forms
 from django.contrib import admin
-from cookbook.models import Ingredient, Recipe, Portion, IngredientCategory, RecipeCategory
+from cookbook.models import Ingredient, Recipe, Portion, IngredientCategory, RecipeCategory, \
+        RecalculationJob
+from cookbook import jobs
 from core.utils import fraction_to_float
 
 # Custom forms and fields
@@ -47,12 +49,12 @@ class RecipeAdmin (admin.ModelAdmin):
     actions = ['refresh_nutrition_info']
 
     def refresh_nutrition_info(self, request, queryset):
-        """Custom action to recalculate the `RecipeNutritionInfo`
+        """Custom action to queue recalculation of the `RecipeNutritionInfo`
         for the selected recipes.
         """
-        for recipe in queryset:
-            recipe.nutrition_info.recalculate()
-            recipe.save()
+        count = jobs.enqueue(queryset.values_list('pk', flat=True))
+        self.message_user(request,
+            "%d recipes queued for nutrition recalculation." % count)
 
     refresh_nutrition_info.short_description = "Recalculate nutrition information"
 
@@ -60,8 +62,13 @@ class RecipeAdmin (admin.ModelAdmin):
 class PortionAdmin (admin.ModelAdmin):
     list_display = ('name',)
 
+class RecalculationJobAdmin (admin.ModelAdmin):
+    list_display = ('recipe', 'queued_at')
+    date_hierarchy = 'queued_at'
+
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Portion, PortionAdmin)
 admin.site.register(IngredientCategory)
 admin.site.register(RecipeCategory)
+admin.site.register(RecalculationJob, RecalculationJobAdmin)
 
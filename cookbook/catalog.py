@@ -0,0 +1,88 @@
+"""
+Listing the whole catalog of recipes, a page at a time.
+
+Recipes are listed in index order: those with no category first, then by
+category name, each by name (and id, to break ties). Pages use keyset
+pagination: rather than an offset, a page starts after a *position*, the
+``(category name, recipe name, recipe id)`` of the last recipe on the previous
+page. Finding any page takes the same, small number of indexed queries, no
+matter how far into the catalog it is, and recipes added or removed elsewhere
+in the catalog do not shift the pages.
+"""
+
+import base64
+from django.db.models import Q
+from django.utils import simplejson
+from cookbook.models import Recipe
+
+# Number of recipes on each page of the index
+PAGE_SIZE = 100
+
+
+def position(recipe):
+    """Return the position of `recipe` in index order.
+    """
+    return (recipe.category.name if recipe.category else None, recipe.name, recipe.id)
+
+
+def encode_position(position):
+    """Return `position` encoded for use in a URL.
+    """
+    return base64.urlsafe_b64encode(simplejson.dumps(position))
+
+
+def decode_position(text):
+    """Return the position encoded in `text` by `encode_position`, or None if
+    `text` is empty or not a valid position.
+    """
+    try:
+        category, name, pk = simplejson.loads(base64.urlsafe_b64decode(str(text)))
+        return (category, name, int(pk))
+    except (TypeError, ValueError, UnicodeError):
+        return None
+
+
+def page(after=None, size=None):
+    """Return ``(recipes, more)``: a list of up to `size` (default
+    `PAGE_SIZE`) recipes in index order starting after the position `after`
+    (or from the beginning if `after` is None), and whether there are any more
+    recipes after them. Each recipe's category and portion are loaded along
+    with it.
+    """
+    size = size or PAGE_SIZE
+    recipes = Recipe.objects.select_related('category', 'portion')
+    uncategorized = recipes.filter(category__isnull=True).order_by('name', 'id')
+    categorized = recipes.filter(category__isnull=False) \
+            .order_by('category__name', 'name', 'id')
+
+    if after is not None:
+        category, name, pk = after
+        if category is None:
+            uncategorized = uncategorized.filter(
+                Q(name__gt=name) | Q(name=name, id__gt=pk))
+        else:
+            uncategorized = uncategorized.none()
+            categorized = categorized.filter(
+                Q(category__name__gt=category) |
+                Q(category__name=category, name__gt=name) |
+                Q(category__name=category, name=name, id__gt=pk))
+
+    # One more than needed, to see whether there are more
+    found = list(uncategorized[:size + 1])
+    if len(found) <= size:
+        found += list(categorized[:size + 1 - len(found)])
+    return found[:size], len(found) > size
+
+
+def pages(size=None):
+    """Yield lists of up to `size` (default `PAGE_SIZE`) recipes, in index
+    order, until the whole catalog has been listed.
+    """
+    after = None
+    while True:
+        recipes, more = page(after, size)
+        if recipes:
+            yield recipes
+        if not more:
+            return
+        after = position(recipes[-1])
@@ -0,0 +1,183 @@
+"""
+Tracking of which recipes' nutrition is made stale by changes to foods, food
+nutrition, units and equivalences.
+
+When one of those is saved or deleted, the recipes it affects are marked dirty,
+and at the end of the request (see :py:mod:`core.middleware`) all dirty
+recipes are queued together for recalculation (see :py:mod:`cookbook.jobs`),
+so editing many foods in one request (or one food many times) costs a single
+recalculation. Saves made
+while loading fixtures (``raw=True``) are ignored.
+
+Outside of a request (in a script or management command), call
+``tracker.flush()`` to queue whatever is dirty.
+"""
+
+from django.db import models
+from django.db.models import Q
+from django.dispatch import receiver
+from core.helpers import unit_graph
+from core.middleware import after_request
+from core.models import Food, FoodNutritionInfo, Unit, Equivalence
+from cookbook.models import Ingredient
+
+# Units that nutrition is computed in; only a unit's factors to these matter
+BASE_UNITS = ('gram', 'milliliter')
+
+
+def base_factors():
+    """Return a dict of ``{unit_name: (grams, milliliters)}`` with each unit's
+    factor to the `BASE_UNITS` (None where it can't be converted).
+    """
+    return dict(
+        (name, tuple(row.get(base) for base in BASE_UNITS))
+        for name, row in unit_graph.factors().iteritems()
+    )
+
+
+class DependencyTracker (object):
+    """Collects the ids of recipes whose nutrition needs recalculating.
+    """
+    def __init__(self):
+        self._recipes = set()
+        self._units = set()
+        self._factors = None
+
+
+    def dirty(self):
+        """Return the set of dirty recipe ids, including any affected by
+        unit or equivalence changes.
+        """
+        self._resolve_units()
+        return set(self._recipes)
+
+
+    def mark_recipes(self, recipe_ids):
+        """Mark the recipes with the given ids dirty.
+        """
+        self._recipes.update(recipe_ids)
+
+
+    def mark_foods(self, food_ids):
+        """Mark all recipes using any of the given foods dirty.
+        """
+        self.mark_recipes(
+            Ingredient.objects.filter(food__in=food_ids)
+            .values_list('recipe', flat=True).distinct())
+
+
+    def mark_units(self, unit_ids):
+        """Mark all recipes dirty that use any of the given units, either
+        directly or through their foods' nutrition information.
+        """
+        self._units.update(unit_ids)
+
+
+    def mark_equivalences(self):
+        """Note that the equivalences between units are about to change. Once
+        they have, every unit whose factor to grams or milliliters changed is
+        marked; other conversions don't affect nutrition.
+        """
+        if self._factors is None:
+            self._factors = base_factors()
+
+
+    def _resolve_units(self):
+        """Find the recipes affected by the marked units, and by any units
+        whose factors to grams or milliliters changed since `mark_equivalences`.
+        """
+        if self._factors is not None:
+            old, new = self._factors, base_factors()
+            self._factors = None
+            changed = [
+                name for name in set(old) | set(new)
+                if old.get(name) != new.get(name)
+            ]
+            if changed:
+                self._units.update(
+                    Unit.objects.filter(name__in=changed).values_list('id', flat=True))
+
+        if self._units:
+            units, self._units = list(self._units), set()
+            self.mark_recipes(
+                Ingredient.objects.filter(
+                    Q(unit__in=units) | Q(food__nutrition_infos__unit__in=units))
+                .values_list('recipe', flat=True).distinct())
+
+
+    def clear(self):
+        """Forget all dirty recipes.
+        """
+        self._recipes.clear()
+        self._units.clear()
+        self._factors = None
+
+
+    def flush(self):
+        """Queue all dirty recipes for recalculation, and return how many
+        were queued.
+        """
+        from cookbook import jobs
+        recipe_ids = self.dirty()
+        self.clear()
+        return jobs.enqueue(sorted(recipe_ids))
+
+
+# Process-wide tracker, fed by the signals below
+tracker = DependencyTracker()
+
+
+# Signals
+
+@receiver(models.signals.post_save, sender=Food)
+@receiver(models.signals.post_delete, sender=Food)
+def food_changed(sender, instance, **kwargs):
+    """After a `Food`'s density is changed, or it is deleted, mark the recipes
+    using it. Other edits, like renaming it, leave their nutrition alone.
+    """
+    # `_density_changed` is set by `core.models.food_saving`
+    saved = kwargs['signal'] is models.signals.post_save
+    if saved and not getattr(instance, '_density_changed', True):
+        return
+    if not kwargs.get('raw'):
+        tracker.mark_foods([instance.pk])
+
+
+@receiver(models.signals.post_save, sender=FoodNutritionInfo)
+@receiver(models.signals.post_delete, sender=FoodNutritionInfo)
+def food_nutrition_changed(sender, instance, **kwargs):
+    """After a `FoodNutritionInfo` is edited, mark the recipes using its food.
+    """
+    if not kwargs.get('raw'):
+        tracker.mark_foods([instance.food_id])
+
+
+@receiver(models.signals.post_save, sender=Unit)
+def unit_changed(sender, instance, **kwargs):
+    """After a `Unit` is edited, mark the recipes using it.
+    """
+    if not kwargs.get('raw'):
+        tracker.mark_units([instance.pk])
+
+
+@receiver(models.signals.pre_save, sender=Equivalence)
+@receiver(models.signals.pre_delete, sender=Equivalence)
+def equivalence_changing(sender, **kwargs):
+    """Before an `Equivalence` is edited, remember the current conversions.
+    """
+    if not kwargs.get('raw'):
+        tracker.mark_equivalences()
+
+
+@receiver(models.signals.post_delete, sender=Ingredient)
+def ingredient_deleted(sender, instance, **kwargs):
+    """After an `Ingredient` is deleted, mark its recipe.
+    """
+    tracker.mark_recipes([instance.recipe_id])
+
+
+@after_request
+def queue_dirty_recipes():
+    """At the end of a request, queue everything it made dirty.
+    """
+    tracker.flush()
@@ -0,0 +1,192 @@
+"""
+Importing large catalogs of recipes in bulk.
+
+Saving a `Recipe` or `Ingredient` one at a time does much more than insert a
+row: it creates the object's `NutritionInfo`, queues its recipe for
+recalculation, re-indexes the recipe for searching (once per ingredient) and
+invalidates caches. For a catalog of tens of thousands of recipes, that work
+dominates. :py:func:`import_catalog` skips all of it while loading, then does
+it once, in bulk, at the end:
+
+1. Objects are read from YAML (as written by :py:mod:`core.better_yaml`) one
+   at a time, and inserted with one batched ``INSERT`` per `BATCH_SIZE` objects
+   of a model, inside a single transaction. No ``save`` methods or signals are
+   run. Only this app's models are inserted this way, since the work their
+   signals do is done below; other objects (and those with parent models or
+   many-to-many fields) are saved as ``loaddata`` would.
+2. Missing `RecipeNutritionInfo` and `IngredientNutritionInfo` rows are
+   inserted in batches, with ids reserved ahead (see :py:func:`_reserve_ids`).
+3. The nutrition of every recipe imported (or with ingredients imported) is
+   computed with :py:func:`cookbook.recalculation.recalculate_recipes`, and
+   the recipes are indexed for searching.
+4. Cache generations changed by the objects saved as ``loaddata`` would are
+   bumped, and `catalog_imported` is sent, so that caches and rollups built
+   from the imported objects elsewhere are brought up to date.
+
+Objects must not already exist. To import from the command line:
+
+    $ ./manage.py import_catalog catalog.yaml.gz
+"""
+
+from django.core.management.color import no_style
+from django.core.serializers.python import Deserializer as PythonDeserializer
+from django.db import connection, transaction
+from django.db.models import Max
+from django.dispatch import Signal
+from core.better_yaml import iter_entries
+from core.models import CacheGeneration
+from nutrition.models import NutritionInfo
+from nutrition.nutrients import COLUMNS
+from cookbook.models import Recipe, Ingredient, RecipeNutritionInfo, IngredientNutritionInfo
+from cookbook.recalculation import batches, recalculate_recipes
+from cookbook import search
+
+# Number of objects inserted per query
+BATCH_SIZE = 500
+
+# Sent with the list of `recipe_ids` whose recipes or ingredients were just
+# imported in bulk, without any of the usual per-save signals, and the dict of
+# ``{model: [pk, ...]}`` of all objects `loaded` (some saved with ``raw=True``)
+catalog_imported = Signal(providing_args=['recipe_ids', 'loaded'])
+
+
+def _can_insert(model):
+    """Return True if objects of `model` can be inserted with a plain
+    ``INSERT`` into its own table. Other apps' models are left to their
+    signals, which keep their caches up to date.
+    """
+    meta = model._meta
+    return meta.app_label == Recipe._meta.app_label and \
+            not meta.parents and not meta.many_to_many
+
+
+def _insert(model, objects):
+    """Insert the given unsaved instances of `model` with one query, as they
+    are (without calling ``save`` or sending signals).
+    """
+    qn = connection.ops.quote_name
+    fields = model._meta.local_fields
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        qn(model._meta.db_table),
+        ', '.join(qn(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)))
+    rows = [
+        [field.get_db_prep_save(getattr(obj, field.attname), connection=connection)
+         for field in fields]
+        for obj in objects
+    ]
+    connection.cursor().executemany(sql, rows)
+
+
+def _reserve_ids(count):
+    """Return `count` unused `NutritionInfo` ids.
+
+    On PostgreSQL, they are taken from the table's sequence, so nutrition
+    saved by other processes during an import gets other ids. Elsewhere they
+    follow the largest id in use. That is safe on SQLite, which keeps the
+    whole database locked until the import's transaction ends. On other
+    databases, nothing else may save nutrition while an import runs.
+    """
+    meta = NutritionInfo._meta
+    if connection.vendor == 'postgresql':
+        cursor = connection.cursor()
+        cursor.execute(
+            'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+            [connection.ops.quote_name(meta.db_table), meta.pk.column, count])
+        return [row[0] for row in cursor.fetchall()]
+    first = (NutritionInfo.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+    return range(first, first + count)
+
+
+def _insert_nutrition(model, owner, owner_ids):
+    """Insert an empty `model` (a `NutritionInfo` subclass) for each of the
+    `owner` ids that doesn't have one.
+    """
+    qn = connection.ops.quote_name
+    info_meta = NutritionInfo._meta
+    meta = model._meta
+    info_sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        qn(info_meta.db_table),
+        ', '.join(qn(info_meta.get_field(field).column)
+                  for field in ('id',) + COLUMNS + ('packed_nutrients',)),
+        ', '.join(['%s'] * (len(COLUMNS) + 2)))
+    sql = 'INSERT INTO %s (%s, %s) VALUES (%%s, %%s)' % (
+        qn(meta.db_table), qn(meta.pk.column), qn(meta.get_field(owner).column))
+
+    for batch in batches(owner_ids, BATCH_SIZE):
+        existing = set(model.objects.filter(**{'%s__in' % owner: batch})
+                       .values_list(owner, flat=True))
+        missing = [owner_id for owner_id in batch if owner_id not in existing]
+        if not missing:
+            continue
+        # Ids are assigned here, so the rows can be inserted in bulk
+        ids = _reserve_ids(len(missing))
+        cursor = connection.cursor()
+        cursor.executemany(info_sql, [
+            [pk] + [0.0] * len(COLUMNS) + [''] for pk in ids])
+        cursor.executemany(sql, zip(ids, missing))
+
+
+def _reset_sequences(models):
+    """Move the primary key sequences of `models` past the ids inserted.
+    """
+    cursor = connection.cursor()
+    for sql in connection.ops.sequence_reset_sql(no_style(), models):
+        cursor.execute(sql)
+
+
+def load_objects(stream, batch_size=None):
+    """Insert the objects in the YAML `stream`, and return a dict of
+    ``{model: [pk, ...]}`` with the primary keys of those inserted.
+    """
+    batch_size = batch_size or BATCH_SIZE
+    loaded = {}
+    pending = []
+
+    def flush():
+        if pending:
+            model = pending[0].__class__
+            _insert(model, pending)
+            loaded.setdefault(model, []).extend(obj.pk for obj in pending)
+            del pending[:]
+
+    for entry in iter_entries(stream):
+        for deserialized in PythonDeserializer([entry]):
+            obj = deserialized.object
+            model = obj.__class__
+            if not _can_insert(model):
+                flush()
+                deserialized.save()
+                loaded.setdefault(model, []).append(obj.pk)
+                continue
+            if pending and (pending[0].__class__ is not model or len(pending) >= batch_size):
+                flush()
+            pending.append(obj)
+    flush()
+    return loaded
+
+
+def import_catalog(stream, batch_size=None):
+    """Import the objects in the YAML `stream`, then compute the nutrition and
+    search index of the recipes imported all at once. Return a dict of
+    ``{model: count}`` of the objects imported.
+    """
+    with transaction.commit_on_success():
+        loaded = load_objects(stream, batch_size)
+        recipe_ids = set(loaded.get(Recipe, []))
+        ingredient_ids = loaded.get(Ingredient, [])
+        for batch in batches(ingredient_ids, BATCH_SIZE):
+            recipe_ids.update(Ingredient.objects.filter(pk__in=batch)
+                              .values_list('recipe', flat=True))
+        recipe_ids = sorted(recipe_ids)
+
+        _insert_nutrition(RecipeNutritionInfo, 'recipe', recipe_ids)
+        _insert_nutrition(IngredientNutritionInfo, 'ingredient', ingredient_ids)
+        _reset_sequences(loaded.keys())
+        transaction.set_dirty()
+
+    recalculate_recipes(recipe_ids)
+    search.index_recipes(recipe_ids)
+    CacheGeneration.bump_loaded()
+    catalog_imported.send(sender=Recipe, recipe_ids=recipe_ids, loaded=loaded)
+    return dict((model, len(pks)) for model, pks in loaded.iteritems())
@@ -0,0 +1,86 @@
+"""
+A queue of recipes waiting for their nutrition to be recalculated.
+
+Saving a `Recipe` or `Ingredient` (or editing anything tracked by
+:py:mod:`cookbook.dependencies`) only queues the recipe, so the request returns
+right away. The queue is the `RecalculationJob` table, holding at most one job
+per recipe; queuing a recipe that is already waiting merges the two.
+
+Queued recipes are recalculated by a separate worker process:
+
+    $ ./manage.py process_nutrition_queue
+
+which pulls jobs in batches, oldest first, and recalculates each batch with
+:py:func:`cookbook.recalculation.recalculate_recipes`. Until then,
+:py:meth:`Recipe.nutrition_pending` is True.
+"""
+
+import operator
+from datetime import datetime
+from django.db import transaction, IntegrityError
+from django.db.models import Q
+from cookbook.models import RecalculationJob
+from cookbook.recalculation import expire_caches, recalculate_recipes
+from cookbook.page_cache import touch
+
+# Number of jobs handled per batch
+BATCH_SIZE = 100
+
+
+def enqueue(recipe_ids):
+    """Queue the recipes with the given ids for recalculation, and return the
+    number of recipes queued. Recipes already in the queue are not duplicated.
+    """
+    recipe_ids = set(recipe_ids)
+    if not recipe_ids:
+        return 0
+    now = datetime.now()
+
+    queued = RecalculationJob.objects.filter(recipe__in=recipe_ids)
+    existing = set(queued.values_list('recipe', flat=True))
+    queued.update(queued_at=now)
+
+    for recipe_id in recipe_ids - existing:
+        # Another process may queue the same recipe at the same time
+        sid = transaction.savepoint()
+        try:
+            RecalculationJob.objects.create(recipe_id=recipe_id, queued_at=now)
+        except IntegrityError:
+            transaction.savepoint_rollback(sid)
+        else:
+            transaction.savepoint_commit(sid)
+
+    # Pages for these recipes now show their nutrition as pending
+    touch(recipe_ids)
+    return len(recipe_ids)
+
+
+def queue_depth():
+    """Return the number of recipes waiting to be recalculated.
+    """
+    return RecalculationJob.objects.count()
+
+
+def process_queue(batch_size=BATCH_SIZE, max_batches=None):
+    """Recalculate queued recipes, oldest first, `batch_size` at a time, until
+    the queue is empty or `max_batches` batches have been done. Return the
+    number of jobs processed.
+    """
+    count = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        # The worker never sees a request, nor the signals sent by edits in
+        # web processes
+        expire_caches()
+        jobs = list(RecalculationJob.objects.values_list(
+            'pk', 'recipe', 'queued_at')[:batch_size])
+        if not jobs:
+            break
+        recalculate_recipes([recipe_id for pk, recipe_id, queued_at in jobs])
+        # Jobs queued again since they were read must be done again
+        RecalculationJob.objects.filter(reduce(operator.or_, [
+            Q(pk=pk, queued_at=queued_at) for pk, recipe_id, queued_at in jobs
+        ])).delete()
+        count += len(jobs)
+        batches += 1
+    return count
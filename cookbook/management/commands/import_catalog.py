@@ -0,0 +1,46 @@
+import gzip
+import time
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, IntegrityError
+from core.better_yaml import lzma
+from cookbook.importer import import_catalog, BATCH_SIZE
+
+class Command (BaseCommand):
+    args = "<file.yaml[.gz|.xz]> ..."
+    help = "Import recipes, ingredients and anything else in the given YAML " \
+           "files in bulk, computing nutrition once at the end."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', default=BATCH_SIZE,
+            help="Number of objects inserted per query."),
+    )
+
+    def handle(self, *paths, **options):
+        verbosity = int(options.get('verbosity', 1))
+        if not paths:
+            raise CommandError("Give the files to import")
+
+        for path in paths:
+            started = time.time()
+            if path.endswith('.gz'):
+                stream = gzip.open(path, 'rb')
+            elif path.endswith('.xz'):
+                if lzma is None:
+                    raise CommandError("Importing xz files needs the lzma module")
+                stream = lzma.LZMAFile(path, 'rb')
+            else:
+                stream = open(path, 'rb')
+            try:
+                counts = import_catalog(stream, options['batch_size'])
+            except (DatabaseError, IntegrityError), e:
+                raise CommandError("Could not import %s: %s" % (path, e))
+            finally:
+                stream.close()
+
+            if verbosity > 0:
+                self.stdout.write("Imported %d objects from %s in %.1f seconds\n" % (
+                    sum(counts.values()), path, time.time() - started))
+                if verbosity > 1:
+                    for model, count in sorted(counts.items(), key=lambda item: unicode(item[0]._meta)):
+                        self.stdout.write("  %s: %d\n" % (model._meta, count))
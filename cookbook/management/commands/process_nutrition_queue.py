@@ -0,0 +1,27 @@
+import time
+from optparse import make_option
+from django.core.management.base import NoArgsCommand
+from cookbook import jobs
+
+class Command (NoArgsCommand):
+    help = "Recalculate nutrition for recipes queued by saves and edits."
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', type='int', default=jobs.BATCH_SIZE,
+            help="Number of recipes to recalculate at a time."),
+        make_option('--interval', type='float', default=5.0,
+            help="Seconds to wait before checking an empty queue again."),
+        make_option('--once', action='store_true', default=False,
+            help="Stop once the queue is empty."),
+    )
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        while True:
+            count = jobs.process_queue(batch_size=options['batch_size'])
+            if count and verbosity > 0:
+                self.stdout.write("Recalculated %d recipes; %d queued\n" %
+                                  (count, jobs.queue_depth()))
+            if options['once']:
+                break
+            time.sleep(options['interval'])
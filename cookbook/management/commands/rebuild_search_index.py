@@ -0,0 +1,16 @@
+import time
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+from cookbook import search
+
+class Command (NoArgsCommand):
+    help = "Rebuild the recipe search index from scratch."
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        started = time.time()
+        with transaction.commit_on_success():
+            count = search.rebuild_index()
+        if verbosity > 0:
+            self.stdout.write("Indexed %d recipes in %.1f seconds\n" %
+                              (count, time.time() - started))
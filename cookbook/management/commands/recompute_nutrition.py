@@ -0,0 +1,84 @@
+import time
+from datetime import datetime
+from itertools import imap
+from multiprocessing import Pool, cpu_count
+from optparse import make_option
+from django.core.management.base import NoArgsCommand, CommandError
+from django.db import connection
+from cookbook.models import Recipe
+from cookbook.recalculation import recalculate_recipes, batches
+
+
+def _recompute(recipe_ids):
+    """Recalculate the recipes with the given ids, and return how many there
+    were. Runs in a worker process, using that process's own connection.
+    """
+    recalculate_recipes(recipe_ids)
+    return len(recipe_ids)
+
+
+class Command (NoArgsCommand):
+    help = "Recalculate nutrition for all recipes (or those selected), " \
+           "spread across several processes."
+
+    option_list = NoArgsCommand.option_list + (
+        make_option('--processes', type='int', default=cpu_count(),
+            help="Number of worker processes (default: one per CPU)."),
+        make_option('--chunk-size', type='int', default=1000,
+            help="Number of recipes given to a worker at a time."),
+        make_option('--since', default=None,
+            help="Only recipes modified on or after this date (YYYY-MM-DD)."),
+        make_option('--ids', default=None,
+            help="Only recipes with these comma-separated ids."),
+    )
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+
+        recipes = Recipe.objects.order_by('pk')
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError("--since must be a date like 2011-06-01")
+            recipes = recipes.filter(modified__gte=since)
+        if options['ids']:
+            try:
+                ids = [int(pk) for pk in options['ids'].split(',')]
+            except ValueError:
+                raise CommandError("--ids must be a comma-separated list of ids")
+            recipes = recipes.filter(pk__in=ids)
+        total = recipes.count()
+
+        # Consecutive ranges of primary keys, read in chunks
+        chunks = batches(recipes.values_list('pk', flat=True).iterator(),
+                         options['chunk_size'])
+
+        pool = None
+        if options['processes'] > 1:
+            # Workers must not share this process's connection; each one
+            # opens its own on first use
+            connection.close()
+            pool = Pool(options['processes'])
+            results = pool.imap_unordered(_recompute, chunks)
+        else:
+            results = imap(_recompute, chunks)
+
+        done = 0
+        started = time.time()
+        try:
+            for count in results:
+                done += count
+                if verbosity > 0:
+                    elapsed = time.time() - started
+                    self.stdout.write("%d/%d recipes (%.1f recipes/s)\n" %
+                                      (done, total, done / max(elapsed, 0.001)))
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+
+        if verbosity > 0:
+            elapsed = time.time() - started
+            self.stdout.write("Recalculated %d recipes in %.1f seconds\n" %
+                              (done, elapsed))
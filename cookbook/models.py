@@ -1,7 +1,9 @@
 from django.db import models
-from core.models import ModelWrapper, Food, Preparation, Unit, FoodNutritionInfo
-from core.helpers import NoEquivalence, group_by_category
+from core.models import ModelWrapper, Food, Preparation, Unit
+from core.helpers import group_by_category, prefetch_one_to_one
+from core import nutrition_index
 from nutrition.models import NutritionInfo
+from nutrition.vector import NutritionVector
 from core.utils import format_food_unit, pluralize
 
 class Portion (ModelWrapper):
@@ -59,6 +61,9 @@ class Recipe (ModelWrapper):
     prep_minutes = models.IntegerField(blank=True, null=True)
     inactive_prep_minutes = models.IntegerField(blank=True, null=True)
     cook_minutes = models.IntegerField(blank=True, null=True)
+    modified     = models.DateTimeField(auto_now=True, null=True, editable=False)
+    # Version of the recipe's rendered page; see `cookbook.page_cache`
+    page_stamp   = models.DateTimeField(null=True, editable=False)
 
     def __unicode__(self):
         string = u"%s" % self.name
@@ -73,12 +78,20 @@ class Recipe (ModelWrapper):
 
 
     def save(self, *args, **kwargs):
-        """Customized save method; creates and (if possible) calculates
-        `NutritionInfo` for the Ingredient.
+        """Customized save method; creates `NutritionInfo` for the Recipe, and
+        queues it to be calculated in the background.
         """
         super(Recipe, self).save(*args, **kwargs)
         RecipeNutritionInfo.objects.get_or_create(recipe=self)
-        self.nutrition_info.recalculate()
+        from cookbook import jobs
+        jobs.enqueue([self.pk])
+
+
+    def nutrition_pending(self):
+        """Return True if this recipe's nutrition is waiting to be
+        recalculated.
+        """
+        return RecalculationJob.objects.filter(recipe=self).exists()
 
 
     def servings(self):
@@ -104,7 +117,9 @@ class Recipe (ModelWrapper):
         """Return a list of ``(category, [ingredients])`` for this recipe.
         ``category`` is ``None`` for any ingredients without a defined category.
         """
-        return group_by_category(self.ingredients.all())
+        ingredients = self.ingredients.select_related(
+            'category', 'unit', 'food', 'preparation')
+        return group_by_category(prefetch_one_to_one(ingredients, 'nutrition_info'))
 
 
 class RecipeNutritionInfo (NutritionInfo):
@@ -129,16 +144,42 @@ class RecipeNutritionInfo (NutritionInfo):
             ingredient.nutrition_info.recalculate()
 
         # Sum them up
-        nutritions = [
+        total = NutritionVector.sum(
             ingredient.nutrition_info
             for ingredient in recipe.ingredients.all()
-        ]
-        total = sum(nutritions[1:], nutritions[0])
+        )
         # Divide by servings
         total = total * (1.0 / recipe.num_portions)
         self.set_equal(total)
 
 
+class RecalculationJob (ModelWrapper):
+    """A queued recalculation of a `Recipe`'s nutrition. There is at most one
+    job per recipe; queuing a recipe again only updates `queued_at`. See
+    `cookbook.jobs`.
+    """
+    recipe    = models.OneToOneField(Recipe, related_name='recalculation_job')
+    queued_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['queued_at']
+
+    def __unicode__(self):
+        return u"%s (queued %s)" % (self.recipe.name, self.queued_at)
+
+
+class RecipeSearchTerm (ModelWrapper):
+    """A word found in a `Recipe`, with a `weight` for how much it counts
+    towards the recipe's search ranking. See `cookbook.search`.
+    """
+    recipe = models.ForeignKey(Recipe, related_name='search_terms')
+    term   = models.CharField(max_length=50, db_index=True)
+    weight = models.IntegerField(default=1)
+
+    def __unicode__(self):
+        return u"%s: %s (%d)" % (self.recipe_id, self.term, self.weight)
+
+
 class Ingredient (ModelWrapper):
     """A quantity of food used in a recipe.
     """
@@ -160,12 +201,13 @@ class Ingredient (ModelWrapper):
 
 
     def save(self, *args, **kwargs):
-        """Customized save method; creates and (if possible) calculates
-        `NutritionInfo` for the Ingredient.
+        """Customized save method; creates `NutritionInfo` for the Ingredient,
+        and queues its recipe to be calculated in the background.
         """
         super(Ingredient, self).save(*args, **kwargs)
         IngredientNutritionInfo.objects.get_or_create(ingredient=self)
-        self.nutrition_info.recalculate()
+        from cookbook import jobs
+        jobs.enqueue([self.recipe_id])
 
 
 class IngredientNutritionInfo (NutritionInfo):
@@ -181,52 +223,27 @@ class IngredientNutritionInfo (NutritionInfo):
         # See: https://code.djangoproject.com/ticket/901
         ingredient = Ingredient.objects.get(pk=self.ingredient.id)
 
-        # Find all nutritions for this food (maybe none)
-        nutritions = FoodNutritionInfo.objects.filter(food=ingredient.food)
-
-        # Is there any nutrition info in terms of the current unit?
-        matches = nutritions.filter(unit=ingredient.unit)
-        if matches.count() > 0:
-            info = matches[0].for_amount(ingredient.quantity, ingredient.unit)
+        # Nutrition from the food's reference in the same unit, or the first
+        # one that can be converted (None if there is no such reference)
+        index = nutrition_index.food_indexes.get(ingredient.food_id)
+        info = index.vector(ingredient.quantity, ingredient.unit_id)
+        if info is not None:
             self.set_equal(info)
             return
 
-        # No matching units. Any other non-null unit that can be converted?
-        for nutrition in nutritions.filter(unit__isnull=False):
-            try:
-                info = nutrition.for_amount(ingredient.quantity, ingredient.unit)
-            except NoEquivalence:
-                pass
-            # Success
-            else:
-                self.set_equal(info)
-                return
-
         # If we get here, no attempts at conversion succeeded. Leave the
         # nutrition info at zero.
 
 
 # Signals
 
-# FIXME: This is commented out, pending a better solution. Turns out the
-# pre_save signal is also emitted when loading fixture data, causing every
-# single Food object loaded to have its Recipe recalculated. Not good.
-# Would be better to have a signal that only prompts recalculation when a
-# user actually modifies a Food instance through the admin site.
-
-#from django.dispatch import receiver
-
-#@receiver(models.signals.post_save, sender=Food)
-#def model_updated(sender, **kwargs):
-    #"""After a Food is saved, recalculate `NutritionInfo` for related
-    #`Recipe`\s.
-    #"""
-    #recipes = set([
-        #ingredient.recipe
-        #for ingredient in kwargs['instance'].ingredient_set.all()
-    #])
-    #for recipe in recipes:
-        #print("Recalculating: %s" % recipe)
-        #recipe.nutrition_info.recalculate()
+# Recipes are recalculated when the foods, food nutrition, units or
+# equivalences they depend on change; see `cookbook.dependencies`.
+from cookbook import dependencies
 
+# Cached recipe pages are versioned by `Recipe.page_stamp`, which is moved
+# forward whenever anything on the page changes; see `cookbook.page_cache`.
+from cookbook import page_cache
 
+# Recipes are indexed for searching as they change; see `cookbook.search`.
+from cookbook import search
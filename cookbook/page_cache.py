@@ -0,0 +1,181 @@
+"""
+Caching of rendered recipe pages, keyed by a per-recipe version stamp.
+
+A recipe's stamp is its `Recipe.page_stamp` time, which is moved forward
+(:py:func:`touch`) whenever anything shown on the recipe page changes: the
+recipe itself, its ingredients, its nutrition, whether its nutrition is
+pending, or the names of the portions, categories and preparations it uses.
+Rendered pages are stored in the Django cache along with the stamp they were
+rendered for; a page is served from the cache as long as the stamp matches.
+The stamp is kept apart from `Recipe.modified`, which only changes when the
+recipe itself is edited.
+
+The stamp also gives each page an ``ETag`` and ``Last-Modified`` header, so a
+client asking for a page it already has gets a ``304 Not Modified`` after a
+single query. HTTP dates only count whole seconds, so ``Last-Modified`` is
+left out until the second the stamp falls in is over; until then, another
+change would get the same date.
+
+When a popular recipe changes, only one process re-renders it; the others
+keep serving the previous page until the new one is ready (or, if there is no
+previous page, wait briefly for it).
+"""
+
+import time
+from datetime import datetime
+from django.core.cache import cache
+from django.db import models
+from django.dispatch import receiver
+from django.utils.http import http_date, parse_http_date_safe, parse_etags, quote_etag
+from core.models import Preparation
+from cookbook.models import Recipe, RecipeCategory, Portion, IngredientCategory, \
+        Ingredient, RecipeNutritionInfo
+
+# Seconds to keep a rendered page
+CACHE_TIMEOUT = 60 * 60 * 24
+
+# Seconds one process may spend rendering a page before others stop waiting
+RENDER_TIMEOUT = 10
+
+# Seconds between checks while waiting for another process to render a page
+POLL_INTERVAL = 0.05
+
+
+def touch(recipe_ids):
+    """Give the recipes with the given ids a new version stamp, so their
+    cached pages are no longer used.
+    """
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        Recipe.objects.filter(pk__in=recipe_ids).update(page_stamp=datetime.now())
+
+
+def recipe_stamp(recipe_id):
+    """Return the version stamp of the recipe with the given id, or None if
+    there is no such recipe.
+    """
+    try:
+        stamp = Recipe.objects.values_list('page_stamp', flat=True).get(pk=recipe_id)
+    except Recipe.DoesNotExist:
+        return None
+    # Recipes saved before stamps were kept get one now
+    if stamp is None:
+        touch([recipe_id])
+        stamp = Recipe.objects.values_list('page_stamp', flat=True).get(pk=recipe_id)
+    return stamp
+
+
+def _seconds(stamp):
+    """Return the time of `stamp`, truncated to whole seconds since the epoch.
+    """
+    return int(time.mktime(stamp.timetuple()))
+
+
+def etag(recipe_id, stamp):
+    """Return the quoted ``ETag`` for a recipe page with the given stamp.
+    """
+    return quote_etag('recipe-%s-%s' % (recipe_id, stamp.strftime('%Y%m%d%H%M%S%f')))
+
+
+def not_modified(request, recipe_id, stamp):
+    """Return True if the client making `request` already has the page for
+    the given stamp.
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag(recipe_id, stamp) in [quote_etag(e) for e in etags]
+    if_modified_since = parse_http_date_safe(
+        request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    if if_modified_since:
+        return _seconds(stamp) <= if_modified_since
+    return False
+
+
+def set_headers(response, recipe_id, stamp):
+    """Add ``ETag`` and ``Last-Modified`` headers for the given stamp.
+    """
+    response['ETag'] = etag(recipe_id, stamp)
+    # A later change within the same second would have the same date
+    seconds = _seconds(stamp)
+    if seconds < int(time.time()):
+        response['Last-Modified'] = http_date(seconds)
+    return response
+
+
+def cached_page(recipe_id, stamp, render):
+    """Return ``(stamp, html)`` for the recipe page with the given id. The
+    page is taken from the cache if it was rendered for `stamp`, or else
+    rendered by calling `render()` and cached.
+
+    While another process is rendering the page, the previously cached page
+    (and its older stamp) is returned instead if there is one.
+    """
+    key = 'cookbook.recipe_page.%s' % recipe_id
+    cached = cache.get(key)
+    if cached and cached[0] == stamp:
+        return cached
+
+    lock = key + '.lock'
+    if cache.add(lock, stamp, RENDER_TIMEOUT):
+        try:
+            html = render()
+            # Don't replace a page rendered for a newer stamp in the meantime
+            latest = cache.get(key)
+            if not latest or latest[0] <= stamp:
+                cache.set(key, (stamp, html), CACHE_TIMEOUT)
+        finally:
+            cache.delete(lock)
+        return stamp, html
+
+    if cached:
+        return cached
+
+    # Nothing to serve; give the other process a chance to finish
+    deadline = time.time() + RENDER_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(POLL_INTERVAL)
+        cached = cache.get(key)
+        if cached and cached[0] >= stamp:
+            return cached
+        if cache.get(lock) is None:
+            break
+    return stamp, render()
+
+
+# Signals
+
+@receiver(models.signals.post_delete, sender=Ingredient)
+def ingredient_deleted(sender, instance, **kwargs):
+    """After an `Ingredient` is deleted, give its recipe a new stamp.
+    """
+    touch([instance.recipe_id])
+
+
+@receiver(models.signals.post_save, sender=RecipeNutritionInfo)
+def nutrition_saved(sender, instance, **kwargs):
+    """After a `RecipeNutritionInfo` is saved, give its recipe a new stamp.
+    """
+    if not kwargs.get('raw'):
+        touch([instance.recipe_id])
+
+
+@receiver(models.signals.post_save, sender=Portion)
+@receiver(models.signals.post_save, sender=RecipeCategory)
+def recipe_lookup_changed(sender, instance, **kwargs):
+    """After a `Portion` or `RecipeCategory` is renamed, give the recipes
+    using it a new stamp.
+    """
+    field = 'portion' if sender is Portion else 'category'
+    touch(Recipe.objects.filter(**{field: instance}).values_list('pk', flat=True))
+
+
+@receiver(models.signals.post_save, sender=Preparation)
+@receiver(models.signals.post_save, sender=IngredientCategory)
+def ingredient_lookup_changed(sender, instance, **kwargs):
+    """After a `Preparation` or `IngredientCategory` is renamed, give the
+    recipes using it a new stamp.
+    """
+    field = 'preparation' if sender is Preparation else 'category'
+    touch(Ingredient.objects.filter(**{field: instance})
+          .values_list('recipe', flat=True).distinct())
@@ -0,0 +1,140 @@
+"""
+Bulk recalculation of recipe and ingredient nutrition.
+
+:py:meth:`RecipeNutritionInfo.recalculate` reloads each ingredient, queries its
+food's nutrition, converts units and saves, one ingredient at a time. The
+functions here do the same work for any number of recipes with a fixed number
+of queries per batch of recipes: all ingredients for a batch are loaded at
+once, each ingredient's nutrition is found from its food's
+:py:class:`core.nutrition_index.FoodNutritionIndex` (loaded once per food, and
+cached between batches), and results are written back with one batched
+``UPDATE`` per table.
+"""
+
+from itertools import islice
+from django.db import connection, transaction
+from django.dispatch import Signal
+from core.helpers import unit_graph
+from core.conversion_table import shared_table
+from core.nutrition_index import food_indexes
+from nutrition.models import NutritionInfo
+from nutrition.nutrients import COLUMNS
+from nutrition.vector import NutritionVector
+from cookbook.models import Recipe, Ingredient, RecipeNutritionInfo, IngredientNutritionInfo
+from cookbook.page_cache import touch
+
+# Number of recipes handled per batch; keeps the number of parameters in each
+# query within database limits
+BATCH_SIZE = 250
+
+# Sent with a dict of ``{recipe_id: NutritionVector}`` just before the new
+# nutrition of those recipes is written, while the old is still in place
+recipe_nutrition_changing = Signal(providing_args=['vectors'])
+
+
+def batches(items, size):
+    """Yield lists of up to `size` items from `items`.
+    """
+    items = iter(items)
+    while True:
+        batch = list(islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _save_vectors(model, owner, queryset, vectors):
+    """Write each ``{owner_id: NutritionVector}`` in `vectors` to the `model`
+    instance whose `owner` field has that id, creating any that are missing.
+    `queryset` must select the existing instances.
+    """
+    existing = dict(queryset.values_list(owner, 'pk'))
+    rows = []
+    for owner_id, vector in vectors.iteritems():
+        if owner_id in existing:
+            rows.append(vector.columns() + [vector.packed(), existing[owner_id]])
+        else:
+            fields = vector.fields()
+            fields[owner + '_id'] = owner_id
+            model.objects.create(**fields)
+
+    if rows:
+        qn = connection.ops.quote_name
+        meta = NutritionInfo._meta
+        columns = ', '.join(
+            '%s = %%s' % qn(meta.get_field(field).column)
+            for field in COLUMNS + ('packed_nutrients',))
+        sql = 'UPDATE %s SET %s WHERE %s = %%s' % (
+            qn(meta.db_table), columns, qn(meta.pk.column))
+        connection.cursor().executemany(sql, rows)
+
+
+def _recalculate_batch(recipe_ids):
+    """Recalculate nutrition for the recipes with the given ids, and return
+    the number of recipes that have ingredients.
+    """
+    portions = dict(
+        Recipe.objects.filter(pk__in=recipe_ids).values_list('id', 'num_portions'))
+    ingredients = list(Ingredient.objects.filter(recipe__in=recipe_ids).values_list(
+        'id', 'recipe', 'quantity', 'unit', 'food'))
+    indexes = food_indexes.get_many(set(row[4] for row in ingredients))
+
+    ingredient_vectors = {}
+    recipe_vectors = {}
+    for ingredient_id, recipe_id, quantity, unit_id, food_id in ingredients:
+        vector = indexes[food_id].vector(quantity, unit_id)
+        # If no conversion succeeds, the nutrition is zero
+        if vector is None:
+            vector = NutritionVector()
+        ingredient_vectors[ingredient_id] = vector
+        recipe_vectors.setdefault(recipe_id, []).append(vector)
+
+    # Recipes without ingredients are left alone, as by `recalculate`
+    recipe_totals = {}
+    for recipe_id, vectors in recipe_vectors.iteritems():
+        recipe_totals[recipe_id] = \
+                NutritionVector.sum(vectors) * (1.0 / (portions[recipe_id] or 1))
+
+    _save_vectors(IngredientNutritionInfo, 'ingredient',
+        IngredientNutritionInfo.objects.filter(ingredient__recipe__in=recipe_ids),
+        ingredient_vectors)
+    if recipe_totals:
+        recipe_nutrition_changing.send(sender=RecipeNutritionInfo, vectors=recipe_totals)
+    _save_vectors(RecipeNutritionInfo, 'recipe',
+        RecipeNutritionInfo.objects.filter(recipe__in=recipe_ids),
+        recipe_totals)
+    return len(recipe_totals)
+
+
+def expire_caches():
+    """Make the conversion and food nutrition caches check for changes made
+    by other processes on next use. Long-running processes that never see a
+    request must call this before each unit of work.
+    """
+    unit_graph.expire()
+    shared_table.expire()
+    food_indexes.expire()
+
+
+def recalculate_recipes(recipes, batch_size=BATCH_SIZE):
+    """Recalculate `IngredientNutritionInfo` and `RecipeNutritionInfo` for all
+    the given recipes, which may be a queryset, or any sequence of `Recipe`
+    instances or primary keys. Return the number of recipes recalculated.
+
+    Each batch of `batch_size` recipes takes a fixed number of queries, and is
+    written in its own transaction.
+    """
+    # Pick up any food or conversion changes made by other processes
+    expire_caches()
+
+    count = 0
+    if hasattr(recipes, 'values_list'):
+        recipe_ids = recipes.values_list('pk', flat=True).iterator()
+    else:
+        recipe_ids = (getattr(recipe, 'pk', recipe) for recipe in recipes)
+    for batch in batches(recipe_ids, batch_size):
+        with transaction.commit_on_success():
+            count += _recalculate_batch(batch)
+            touch(batch)
+            transaction.set_dirty()
+    return count
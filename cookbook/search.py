@@ -0,0 +1,199 @@
+"""
+Searching recipes by name, source, directions and ingredient foods.
+
+Each recipe's words are kept in an inverted index, the `RecipeSearchTerm`
+table, with one row per distinct word in the recipe. A word's weight is the
+sum of the weights of the fields it appears in (`FIELD_WEIGHTS`), so a word
+in the recipe name counts for more than one only found in the directions.
+
+:py:func:`search` finds the recipes containing every word of a query (words
+of `PREFIX_LENGTH` letters or more also match longer words starting with
+them), ranked by their total weight. Saving a recipe, ingredient or food
+marks the recipes it touches, and at the end of the request (see
+:py:mod:`core.middleware`) each of them is indexed once, however many of its
+ingredients were saved. Outside of a request, call :py:func:`index_pending`.
+Saves made while loading fixtures (``raw=True``) are ignored. To rebuild the
+index from scratch, run:
+
+    $ ./manage.py rebuild_search_index
+"""
+
+import re
+from django.db import connection, models, transaction
+from django.dispatch import receiver
+from core.middleware import after_request
+from core.models import Food
+from cookbook.models import Recipe, Ingredient, RecipeSearchTerm
+from cookbook.recalculation import batches
+
+# How much a word counts for in each field it is found in
+FIELD_WEIGHTS = (
+    ('name', 10),
+    ('food', 4),
+    ('source', 2),
+    ('directions', 1),
+)
+
+# Query words at least this long also match words they are a prefix of
+PREFIX_LENGTH = 3
+
+# Number of recipes indexed per batch
+BATCH_SIZE = 250
+
+_word = re.compile(r'\w+', re.UNICODE)
+
+# Ids of recipes changed since the index was last updated
+_pending = set()
+
+
+def tokenize(text):
+    """Return the set of distinct lowercase words in `text`.
+
+        >>> sorted(tokenize(u"Mom's Apple-Pie, apple pie!"))
+        [u'apple', u'mom', u'pie', u's']
+    """
+    if not text:
+        return set()
+    max_length = RecipeSearchTerm._meta.get_field('term').max_length
+    return set(word[:max_length] for word in _word.findall(text.lower()))
+
+
+def recipe_terms(fields):
+    """Return a dict of ``{term: weight}`` for a recipe, given a dict of its
+    searchable text by field name (see `FIELD_WEIGHTS`).
+    """
+    terms = {}
+    for field, weight in FIELD_WEIGHTS:
+        for term in tokenize(fields.get(field)):
+            terms[term] = terms.get(term, 0) + weight
+    return terms
+
+
+def index_recipes(recipe_ids):
+    """Replace the index entries for the recipes with the given ids. Each
+    batch of `BATCH_SIZE` recipes takes a fixed number of queries, and is
+    replaced in the caller's transaction if it manages one, or else in its
+    own, so recipes are never left out of the index by a failure.
+    """
+    for batch in batches(recipe_ids, BATCH_SIZE):
+        if transaction.is_managed():
+            _index_batch(batch)
+        else:
+            with transaction.commit_on_success():
+                _index_batch(batch)
+
+
+@after_request
+def index_pending():
+    """Index the recipes changed since the last call.
+    """
+    recipe_ids = sorted(_pending)
+    _pending.clear()
+    index_recipes(recipe_ids)
+
+
+def _index_batch(recipe_ids):
+    """Replace the index entries for a batch of recipes, in the current
+    transaction.
+    """
+    fields = {}
+    for recipe_id, name, source, directions in Recipe.objects.filter(
+            pk__in=recipe_ids).values_list('id', 'name', 'source', 'directions'):
+        fields[recipe_id] = {'name': name, 'source': source,
+                             'directions': directions, 'food': u''}
+    ingredients = Ingredient.objects.filter(recipe__in=recipe_ids) \
+            .values_list('recipe', 'food__name')
+    for recipe_id, food_name in ingredients:
+        if recipe_id in fields:
+            fields[recipe_id]['food'] += u' ' + food_name
+
+    RecipeSearchTerm.objects.filter(recipe__in=recipe_ids).delete()
+    rows = []
+    for recipe_id, recipe_fields in fields.iteritems():
+        for term, weight in recipe_terms(recipe_fields).iteritems():
+            rows.append((recipe_id, term, weight))
+    if rows:
+        qn = connection.ops.quote_name
+        meta = RecipeSearchTerm._meta
+        sql = 'INSERT INTO %s (%s, %s, %s) VALUES (%%s, %%s, %%s)' % (
+            qn(meta.db_table), qn(meta.get_field('recipe').column),
+            qn(meta.get_field('term').column), qn(meta.get_field('weight').column))
+        connection.cursor().executemany(sql, rows)
+    transaction.set_dirty()
+
+
+def rebuild_index():
+    """Index all recipes from scratch, and return how many there are.
+    """
+    recipe_ids = list(Recipe.objects.values_list('pk', flat=True))
+    RecipeSearchTerm.objects.all().delete()
+    index_recipes(recipe_ids)
+    return len(recipe_ids)
+
+
+def _matches(word):
+    """Return a dict of ``{recipe_id: weight}`` for recipes containing `word`,
+    or a word it is a prefix of.
+    """
+    terms = RecipeSearchTerm.objects.all()
+    if len(word) >= PREFIX_LENGTH:
+        # A range rather than LIKE, so the index on `term` is used
+        terms = terms.filter(term__gte=word, term__lt=word + u'\uffff')
+    else:
+        terms = terms.filter(term=word)
+    matches = {}
+    for recipe_id, weight in terms.values_list('recipe', 'weight'):
+        # A prefix may match several words in the same recipe; count the best
+        matches[recipe_id] = max(weight, matches.get(recipe_id, 0))
+    return matches
+
+
+def search(query):
+    """Return a list of ``(recipe_id, score)`` for recipes matching every word
+    in `query`, best first.
+    """
+    scores = None
+    # Rarer words first would narrow faster, but the longest is a good guess
+    for word in sorted(tokenize(query), key=len, reverse=True):
+        matches = _matches(word)
+        if scores is None:
+            scores = matches
+        else:
+            scores = dict(
+                (recipe_id, score + matches[recipe_id])
+                for recipe_id, score in scores.iteritems() if recipe_id in matches)
+        if not scores:
+            return []
+    if scores is None:
+        return []
+    return sorted(scores.iteritems(), key=lambda (recipe_id, score): (-score, recipe_id))
+
+
+# Signals
+
+@receiver(models.signals.post_save, sender=Recipe)
+def recipe_saved(sender, instance, **kwargs):
+    """After a `Recipe` is saved, mark it for indexing.
+    """
+    if not kwargs.get('raw'):
+        _pending.add(instance.pk)
+
+
+@receiver(models.signals.post_save, sender=Ingredient)
+@receiver(models.signals.post_delete, sender=Ingredient)
+def ingredient_changed(sender, instance, **kwargs):
+    """After an `Ingredient` is saved or deleted, mark its recipe for
+    indexing.
+    """
+    if not kwargs.get('raw'):
+        _pending.add(instance.recipe_id)
+
+
+@receiver(models.signals.post_save, sender=Food)
+def food_saved(sender, instance, **kwargs):
+    """After a `Food` is saved (and possibly renamed), mark the recipes using
+    it for indexing.
+    """
+    if not kwargs.get('raw'):
+        _pending.update(Ingredient.objects.filter(food=instance)
+                        .values_list('recipe', flat=True).distinct())
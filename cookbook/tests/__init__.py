@@ -2,4 +2,9 @@ from ingredient import *
 from recipe import *
 from view import *
 from formatting import *
-
+from recalculation import *
+from dependencies import *
+from jobs import *
+from page_cache import *
+from search import *
+from importer import *
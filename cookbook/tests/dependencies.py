@@ -0,0 +1,106 @@
+from django.test import TestCase
+from django.core.urlresolvers import reverse
+from core.models import Food, Unit, Equivalence, FoodNutritionInfo
+from cookbook.models import Recipe
+from cookbook.dependencies import tracker
+from cookbook.jobs import process_queue, queue_depth
+
+class DependencyTrackerTest (TestCase):
+    fixtures = [
+        'test_food',
+        'test_unit',
+        'test_equivalence',
+        'test_food_nutrition_info',
+        'test_nutrition_info',
+        'test_recipe',
+    ]
+    def setUp(self):
+        self.egg = Food.objects.get(name='egg')
+        self.butter = Food.objects.get(name='butter')
+        self.ounce = Unit.objects.get(name='ounce')
+        self.tablespoon = Unit.objects.get(name='tablespoon')
+        self.pancakes = Recipe.objects.get(name='Pancakes')
+        self.omelette = Recipe(name='Omelette')
+        self.omelette.save()
+        self.omelette.ingredients.create(quantity=3, food=self.egg)
+        self.pancakes.ingredients.create(quantity=2, unit=self.tablespoon, food=self.butter)
+        process_queue()
+        tracker.clear()
+
+
+    def tearDown(self):
+        tracker.clear()
+
+
+    def test_food_nutrition_change_marks_recipes(self):
+        """Editing a food's nutrition marks only the recipes using it.
+        """
+        egg_NI = FoodNutritionInfo.objects.get(food=self.egg)
+        egg_NI.calories = 70
+        egg_NI.save()
+        egg_NI.calories = 80
+        egg_NI.save()
+        self.assertEqual(tracker.dirty(), set([self.omelette.id]))
+
+        # Both edits result in one recalculation
+        self.assertEqual(tracker.flush(), 1)
+        self.assertEqual(tracker.dirty(), set())
+        self.assertEqual(process_queue(), 1)
+        omelette = Recipe.objects.get(pk=self.omelette.id)
+        self.assertEqual(omelette.nutrition_info.calories, 240)
+
+
+    def test_food_change_marks_recipes(self):
+        """Editing a food marks the recipes using it.
+        """
+        self.butter.grams_per_ml = 0.9
+        self.butter.save()
+        self.assertEqual(tracker.dirty(), set([self.pancakes.id]))
+
+
+    def test_food_rename_marks_nothing(self):
+        """Editing a food without changing its density marks nothing.
+        """
+        self.butter.name = 'salted butter'
+        self.butter.save()
+        self.assertEqual(tracker.dirty(), set())
+
+
+    def test_queued_after_request(self):
+        """Dirty recipes are queued at the end of a request.
+        """
+        tracker.mark_recipes([self.omelette.id])
+        self.client.get(reverse('cookbook_index'))
+        self.assertEqual(tracker.dirty(), set())
+        self.assertEqual(queue_depth(), 1)
+
+
+    def test_equivalence_change_marks_recipes(self):
+        """Changing an equivalence marks recipes whose conversions changed.
+        """
+        # Butter nutrition is per ounce, used by the tablespoon
+        equivalence = Equivalence.objects.get(
+            unit=self.tablespoon, to_unit__name='milliliter')
+        equivalence.to_quantity = 15.0
+        equivalence.save()
+        self.assertEqual(tracker.dirty(), set([self.pancakes.id]))
+
+
+    def test_equivalence_change_between_volumes(self):
+        """Changing an equivalence that leaves every unit's factors to grams
+        and milliliters alone marks nothing.
+        """
+        # Both units convert to milliliters directly
+        equivalence = Equivalence.objects.get(
+            unit=self.tablespoon, to_unit__name='teaspoon')
+        equivalence.to_quantity = 3.5
+        equivalence.save()
+        self.assertEqual(tracker.dirty(), set())
+
+
+    def test_raw_saves_ignored(self):
+        """Saves while loading fixtures do not mark recipes.
+        """
+        from django.core import management
+        management.call_command('loaddata', 'test_food_nutrition_info', verbosity=0)
+        self.assertEqual(tracker.dirty(), set())
@@ -0,0 +1,141 @@
+import os
+import gzip
+import tempfile
+from datetime import date
+from StringIO import StringIO
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase
+from django.core import management
+from core.models import Food, CacheGeneration
+from core.helpers import convert_unit
+from core.conversion_table import GENERATION as CONVERSIONS
+from cookbook.models import Recipe, Ingredient, RecipeNutritionInfo, \
+        IngredientNutritionInfo, RecalculationJob
+from cookbook.importer import import_catalog
+from cookbook.search import search
+from inventory.matching import match_recipes
+from diet.models import Meal
+from diet.rollups import intake
+from diet.meal_calendar import GENERATION as MEALS
+
+class CatalogImportTest (TestCase):
+    fixtures = [
+        'test_food',
+        'test_unit',
+        'test_equivalence',
+        'test_food_nutrition_info',
+        'test_nutrition_info',
+        'test_recipe',
+    ]
+    def catalog(self, count, first=100):
+        """Return the YAML text of `count` recipes, each with two ingredients.
+        """
+        lines = ['cookbook.recipecategory:', '  %d: {name: Breakfast %d}' % (first, first), 'cookbook.recipe:']
+        for pk in range(first, first + count):
+            lines.append('  %d: {name: Omelet %d, directions: Whisk the eggs., '
+                         'num_portions: 2, category: %d, portion: null, preheat: "", '
+                         'rating: 4, source: null, prep_minutes: 5, cook_minutes: 5, '
+                         'inactive_prep_minutes: null}' % (pk, pk, first))
+        lines.append('cookbook.ingredient:')
+        for pk in range(first, first + count):
+            lines.append('  %d: {recipe: %d, quantity: 3, unit: null, food: 2, '
+                         'category: null, preparation: null, optional: false}' % (pk * 2, pk))
+            lines.append('  %d: {recipe: %d, quantity: 0.5, unit: 1, food: 3, '
+                         'category: null, preparation: null, optional: false}' % (pk * 2 + 1, pk))
+        return '\n'.join(lines) + '\n'
+
+
+    def test_import(self):
+        """Imported recipes get nutrition, are searchable and matchable, and
+        aren't left in the recalculation queue.
+        """
+        counts = import_catalog(StringIO(self.catalog(3)))
+        self.assertEqual(counts[Recipe], 3)
+        self.assertEqual(counts[Ingredient], 6)
+        omelet = Recipe.objects.get(pk=101)
+        self.assertEqual(omelet.category.name, 'Breakfast 100')
+        self.assertEqual(omelet.ingredients.count(), 2)
+        self.assertEqual(RecalculationJob.objects.count(), 0)
+
+        # Same nutrition as saving the recipe the usual way
+        imported = omelet.nutrition_info.vector()
+        self.assertTrue(imported.calories > 0)
+        self.assertTrue(omelet.page_stamp is not None)
+        omelet.nutrition_info.recalculate()
+        self.assertTrue(RecipeNutritionInfo.objects.get(recipe=omelet).is_equal(imported))
+        self.assertEqual(IngredientNutritionInfo.objects.filter(
+            ingredient__recipe__pk__gte=100).count(), 6)
+
+        self.assertEqual([recipe_id for recipe_id, score in search('omelet 102')], [102])
+        from inventory.models import Provision
+        Provision.objects.create(quantity=12, food=Food.objects.get(name='egg'))
+        self.assertEqual(len(match_recipes()), 3)
+
+        # New objects still get new ids
+        recipe = Recipe.objects.create(name='Toast')
+        self.assertTrue(recipe.pk > 102)
+        self.assertTrue(recipe.nutrition_info.pk > omelet.nutrition_info.pk)
+
+
+    def test_import_other_apps(self):
+        """Objects of other apps are saved with their signals, so their
+        caches and rollups are brought up to date once the import is done.
+        """
+        conversions = CacheGeneration.current(CONVERSIONS)
+        meals = CacheGeneration.current(MEALS)
+        text = ('core.unit:\n'
+                '  500: {abbreviation: "", kind: volume, name: smidgen}\n'
+                'core.equivalence:\n'
+                '  500: {to_quantity: 0.1, to_unit: 14, unit: 500}\n'
+                + self.catalog(1) +
+                'diet.meal:\n'
+                '  500: {date: 2011-06-01, kind: dinner, recipe: 100}\n')
+        counts = import_catalog(StringIO(text))
+        self.assertEqual(counts[Meal], 1)
+        self.assertEqual(CacheGeneration.current(CONVERSIONS), conversions + 1)
+        self.assertEqual(CacheGeneration.current(MEALS), meals + 1)
+        self.assertEqual(convert_unit('smidgen', 'milliliter'), 0.1)
+
+        calories = Recipe.objects.get(pk=100).nutrition_info.calories
+        self.assertTrue(calories > 0)
+        [(day, count, vector)] = intake('day', date(2011, 6, 1), date(2011, 6, 1))
+        self.assertEqual(count, 1)
+        self.assertAlmostEqual(vector.calories, calories)
+
+
+    def test_import_queries(self):
+        """The number of queries does not grow with the number of recipes.
+        """
+        import_catalog(StringIO(self.catalog(1, first=2000)))
+        self.assertEqual(self.count_queries(self.catalog(5)),
+                         self.count_queries(self.catalog(50, first=1000)))
+
+
+    def count_queries(self, text):
+        """Return the number of queries run to import `text`.
+        """
+        debug, settings.DEBUG = settings.DEBUG, True
+        try:
+            start = len(connection.queries)
+            import_catalog(StringIO(text))
+            return len(connection.queries) - start
+        finally:
+            settings.DEBUG = debug
+
+
+    def test_command(self):
+        """Import compressed files with the management command.
+        """
+        handle, path = tempfile.mkstemp(suffix='.yaml.gz')
+        os.close(handle)
+        try:
+            output = gzip.open(path, 'wb')
+            output.write(self.catalog(2))
+            output.close()
+            stdout = StringIO()
+            management.call_command('import_catalog', path, stdout=stdout)
+        finally:
+            os.remove(path)
+        self.assertTrue('Imported 7 objects' in stdout.getvalue())
+        self.assertEqual(Recipe.objects.filter(pk__gte=100).count(), 2)
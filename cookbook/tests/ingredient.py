@@ -1,6 +1,7 @@
 from django.test import TestCase
 from core.models import Food, Unit, FoodNutritionInfo
 from cookbook.models import Recipe, Ingredient
+from cookbook.jobs import process_queue
 
 class IngredientNutritionTest (TestCase):
     fixtures = [
@@ -20,6 +21,8 @@ class IngredientNutritionTest (TestCase):
         # Create an ingredient
         eggs = Ingredient(recipe=pancakes, quantity=2, food=egg)
         eggs.save()
+        process_queue()
+        eggs = Ingredient.objects.get(pk=eggs.id)
 
         egg_NI = FoodNutritionInfo.objects.get(food=egg, quantity=1, unit=None)
 
@@ -30,6 +33,8 @@ class IngredientNutritionTest (TestCase):
         # Make it 3 eggs
         eggs.quantity = 3
         eggs.save()
+        process_queue()
+        eggs = Ingredient.objects.get(pk=eggs.id)
 
         # Ensure nutrition reflects 3 eggs now
         total_NI = egg_NI * 3.0
@@ -50,6 +55,8 @@ class IngredientNutritionTest (TestCase):
         # Create an ingredient
         tablespoon_nuts = Ingredient(recipe=pancakes, quantity=1, unit=tablespoon, food=nuts)
         tablespoon_nuts.save()
+        process_queue()
+        tablespoon_nuts = Ingredient.objects.get(pk=tablespoon_nuts.id)
         # Ensure correct nutrition was calculated
         self.assertTrue(tablespoon_nuts.nutrition_info.is_equal(nuts_NI * 3.0))
 
@@ -0,0 +1,110 @@
+from datetime import timedelta
+from django.test import TestCase
+from django.core import management
+from core.models import Food, Unit, Equivalence, FoodNutritionInfo, CacheGeneration
+from cookbook.models import Recipe, Ingredient, RecalculationJob
+from cookbook.jobs import enqueue, queue_depth, process_queue
+from cookbook.recalculation import recipe_nutrition_changing
+
+class RecalculationQueueTest (TestCase):
+    fixtures = [
+        'test_food',
+        'test_unit',
+        'test_equivalence',
+        'test_food_nutrition_info',
+        'test_nutrition_info',
+        'test_recipe',
+    ]
+    def setUp(self):
+        self.egg = Food.objects.get(name='egg')
+        self.pancakes = Recipe.objects.get(name='Pancakes')
+        process_queue()
+
+
+    def test_enqueue_merges_duplicates(self):
+        """Queuing a recipe more than once makes only one job.
+        """
+        self.assertEqual(queue_depth(), 0)
+        enqueue([self.pancakes.id])
+        enqueue([self.pancakes.id, self.pancakes.id])
+        self.pancakes.ingredients.create(quantity=2, food=self.egg)
+        self.assertEqual(queue_depth(), 1)
+
+
+    def test_process_queue_in_batches(self):
+        """Queued recipes are recalculated in batches.
+        """
+        recipes = []
+        for i in range(5):
+            recipe = Recipe(name='Eggs %d' % i)
+            recipe.save()
+            recipe.ingredients.create(quantity=i + 1, food=self.egg)
+            recipes.append(recipe)
+        self.assertEqual(queue_depth(), 5)
+
+        self.assertEqual(process_queue(batch_size=2, max_batches=1), 2)
+        self.assertEqual(queue_depth(), 3)
+        self.assertEqual(process_queue(batch_size=2), 3)
+        self.assertEqual(queue_depth(), 0)
+
+        egg_calories = self.egg.nutrition_infos.get().calories
+        for i, recipe in enumerate(recipes):
+            info = Recipe.objects.get(pk=recipe.id).nutrition_info
+            self.assertEqual(info.calories, (i + 1) * egg_calories)
+
+
+    def test_requeued_while_processing(self):
+        """A recipe queued again while its batch is being processed stays in
+        the queue, whatever its new time.
+        """
+        self.pancakes.ingredients.create(quantity=2, food=self.egg)
+        job = RecalculationJob.objects.get(recipe=self.pancakes)
+
+        def requeue(sender, **kwargs):
+            # As if by another process, with a clock running behind
+            RecalculationJob.objects.filter(pk=job.pk).update(
+                queued_at=job.queued_at - timedelta(minutes=1))
+        recipe_nutrition_changing.connect(requeue)
+        try:
+            self.assertEqual(process_queue(max_batches=1), 1)
+        finally:
+            recipe_nutrition_changing.disconnect(requeue)
+        self.assertEqual(queue_depth(), 1)
+        self.assertEqual(process_queue(), 1)
+        self.assertEqual(queue_depth(), 0)
+
+
+    def test_process_queue_sees_other_processes(self):
+        """Conversions changed by another process are used once the queue is
+        processed, though this process got no signal or request.
+        """
+        nuts = Food.objects.create(name='nuts')
+        teaspoon = Unit.objects.get(name='teaspoon')
+        tablespoon = Unit.objects.get(name='tablespoon')
+        FoodNutritionInfo.objects.create(food=nuts, quantity=1, unit=teaspoon, calories=50)
+        nut_ingredient = self.pancakes.ingredients.create(
+            quantity=1, unit=tablespoon, food=nuts)
+        process_queue()
+        nut_ingredient = Ingredient.objects.get(pk=nut_ingredient.id)
+        self.assertAlmostEqual(nut_ingredient.nutrition_info.calories, 150, 3)
+
+        # Another process makes a tablespoon four teaspoons; updating the rows
+        # directly sends no signals here
+        milliliters = Equivalence.objects.get(
+            unit=teaspoon, to_unit__name='milliliter').to_quantity
+        Equivalence.objects.filter(unit=tablespoon, to_unit__name='milliliter') \
+                .update(to_quantity=4 * milliliters)
+        CacheGeneration.bump('conversions')
+
+        enqueue([self.pancakes.id])
+        process_queue()
+        nut_ingredient = Ingredient.objects.get(pk=nut_ingredient.id)
+        self.assertAlmostEqual(nut_ingredient.nutrition_info.calories, 200, 3)
+
+
+    def test_process_queue_command(self):
+        """The management command empties the queue.
+        """
+        enqueue([self.pancakes.id])
+        management.call_command('process_nutrition_queue', once=True, verbosity=0)
+        self.assertEqual(RecalculationJob.objects.count(), 0)
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+from django.test import TestCase
+from django.test.client import Client
+from django.core.urlresolvers import reverse
+from django.core.cache import cache
+from core.models import Food, Preparation
+from cookbook.models import Recipe
+from cookbook import page_cache
+from cookbook.jobs import enqueue, process_queue
+
+class RecipePageCacheTest (TestCase):
+    fixtures = [
+        'test_food',
+        'test_unit',
+        'test_equivalence',
+        'test_food_nutrition_info',
+        'test_nutrition_info',
+        'test_recipe',
+        'test_recipe_nutrition_info',
+    ]
+    def setUp(self):
+        self.client = Client()
+        cache.clear()
+        self.pancakes = Recipe.objects.get(name='Pancakes')
+        self.egg = Food.objects.get(name='egg')
+        self.url = reverse('cookbook_show_recipe',
+                           kwargs={'recipe_id': self.pancakes.id})
+
+
+    def test_conditional_get(self):
+        """A client with the current page gets a 304 response.
+        """
+        Recipe.objects.filter(pk=self.pancakes.id).update(
+            page_stamp=datetime.now() - timedelta(seconds=5))
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        last_modified = response['Last-Modified']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, '')
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        # Once the recipe changes, the old ETag no longer matches
+        self.pancakes.ingredients.create(quantity=2, food=self.egg)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+    def test_last_modified_same_second(self):
+        """A page changed within the current second has no Last-Modified
+        date, since a change later in that second would have the same date.
+        """
+        # Later in the current second, however long the request takes
+        Recipe.objects.filter(pk=self.pancakes.id).update(
+            page_stamp=datetime.now().replace(microsecond=999999))
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertTrue(response.has_header('ETag'))
+
+
+    def test_changes_invalidate_page(self):
+        """Changes to a recipe's ingredients or their preparations are shown.
+        """
+        self.client.get(self.url)
+        ingredient = self.pancakes.ingredients.create(quantity=2, food=self.egg)
+        self.assertContains(self.client.get(self.url), '2 eggs')
+
+        beaten = Preparation.objects.create(name='beaten')
+        ingredient.preparation = beaten
+        ingredient.save()
+        self.assertContains(self.client.get(self.url), '2 eggs, beaten')
+
+        beaten.name = 'whisked'
+        beaten.save()
+        self.assertContains(self.client.get(self.url), '2 eggs, whisked')
+
+        ingredient.delete()
+        self.assertNotContains(self.client.get(self.url), '2 eggs')
+
+
+    def test_stamp_leaves_modified_alone(self):
+        """Recalculating a recipe gives it a new page stamp, but does not
+        change when it was last modified.
+        """
+        self.pancakes.save()
+        process_queue()
+        pancakes = Recipe.objects.get(pk=self.pancakes.id)
+        stamp = page_cache.recipe_stamp(pancakes.id)
+        enqueue([pancakes.id])
+        process_queue()
+        self.assertTrue(page_cache.recipe_stamp(pancakes.id) > stamp)
+        self.assertEqual(Recipe.objects.get(pk=pancakes.id).modified, pancakes.modified)
+
+
+    def test_stale_page_served_while_rendering(self):
+        """While another process renders a changed page, the previous page
+        is served rather than rendering it again.
+        """
+        stamp = page_cache.recipe_stamp(self.pancakes.id)
+        page_cache.cached_page(self.pancakes.id, stamp, lambda: 'old page')
+
+        page_cache.touch([self.pancakes.id])
+        new_stamp = page_cache.recipe_stamp(self.pancakes.id)
+        self.assertTrue(new_stamp > stamp)
+
+        # Pretend another process holds the render lock
+        cache.add('cookbook.recipe_page.%s.lock' % self.pancakes.id, new_stamp)
+        self.assertEqual(
+            page_cache.cached_page(self.pancakes.id, new_stamp, lambda: 'new page'),
+            (stamp, 'old page'))
+
+        # Once the lock is released, the page is rendered again
+        cache.delete('cookbook.recipe_page.%s.lock' % self.pancakes.id)
+        self.assertEqual(
+            page_cache.cached_page(self.pancakes.id, new_stamp, lambda: 'new page'),
+            (new_stamp, 'new page'))
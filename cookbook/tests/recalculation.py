@@ -0,0 +1,109 @@
+from StringIO import StringIO
+from django.test import TestCase
+from django.core import management
+from core.models import Food, Unit
+from core.helpers import unit_graph
+from core.nutrition_index import food_indexes
+from cookbook.models import Recipe, RecipeNutritionInfo, IngredientNutritionInfo
+from cookbook.recalculation import recalculate_recipes
+
+class BulkRecalculationTest (TestCase):
+    fixtures = [
+        'test_food',
+        'test_unit',
+        'test_equivalence',
+        'test_food_nutrition_info',
+        'test_nutrition_info',
+        'test_recipe',
+    ]
+    def setUp(self):
+        self.egg = Food.objects.get(name='egg')
+        self.flour = Food.objects.get(name='all-purpose flour')
+        self.butter = Food.objects.get(name='butter')
+        self.cup = Unit.objects.get(name='cup')
+        self.ounce = Unit.objects.get(name='ounce')
+        self.tablespoon = Unit.objects.get(name='tablespoon')
+        self.pancakes = Recipe.objects.get(name='Pancakes')
+
+
+    def add_ingredients(self, recipe):
+        """Add ingredients to `recipe` needing every kind of conversion.
+        """
+        recipe.ingredients.create(quantity=2, food=self.egg)
+        recipe.ingredients.create(quantity=0.5, unit=self.cup, food=self.flour)
+        recipe.ingredients.create(quantity=3, unit=self.tablespoon, food=self.butter)
+        recipe.num_portions = 4
+        recipe.save()
+
+
+    def make_recipe(self, name):
+        recipe = Recipe(name=name)
+        recipe.save()
+        self.add_ingredients(recipe)
+        return recipe
+
+
+    def test_bulk_recalculation_matches_recalculate(self):
+        """Bulk recalculation gives the same nutrition as `recalculate`.
+        """
+        self.add_ingredients(self.pancakes)
+        self.pancakes.nutrition_info.recalculate()
+        expected = self.pancakes.nutrition_info.vector()
+        expected_ingredients = dict(
+            (info.ingredient_id, info.vector())
+            for info in IngredientNutritionInfo.objects.all())
+        self.assertFalse(expected.is_empty())
+
+        # Clear out the nutrition and recalculate it in bulk
+        for info in IngredientNutritionInfo.objects.all():
+            info.delete()
+        RecipeNutritionInfo.objects.update(calories=0, fat=0)
+
+        self.assertEqual(recalculate_recipes(Recipe.objects.all()), 1)
+        actual = RecipeNutritionInfo.objects.get(recipe=self.pancakes)
+        for field, value in expected.fields().items():
+            self.assertAlmostEqual(getattr(actual, field), value)
+        for info in IngredientNutritionInfo.objects.all():
+            for field, value in expected_ingredients[info.ingredient_id].fields().items():
+                self.assertAlmostEqual(getattr(info, field), value)
+
+
+    def test_bulk_recalculation_query_count(self):
+        """Bulk recalculation takes the same number of queries for any number
+        of recipes, and fewer once the foods' nutrition indexes are cached.
+        """
+        recipes = [self.make_recipe('Recipe %d' % i) for i in range(5)]
+        unit_graph.factors()
+        food_indexes.invalidate()
+        with self.assertNumQueries(12):
+            recalculate_recipes(recipes[:1])
+        food_indexes.invalidate()
+        with self.assertNumQueries(12):
+            recalculate_recipes(recipes)
+        with self.assertNumQueries(9):
+            recalculate_recipes(recipes)
+
+
+    def test_recompute_nutrition_command(self):
+        """Recalculate selected recipes with the management command.
+        """
+        recipes = [self.make_recipe('Recipe %d' % i) for i in range(3)]
+        RecipeNutritionInfo.objects.update(calories=0)
+
+        output = StringIO()
+        ids = ','.join(str(recipe.id) for recipe in recipes[:2])
+        management.call_command('recompute_nutrition',
+            processes=1, chunk_size=1, ids=ids, stdout=output)
+        self.assertTrue('Recalculated 2 recipes' in output.getvalue())
+
+        calories = [Recipe.objects.get(pk=recipe.id).nutrition_info.calories
+                    for recipe in recipes]
+        self.assertTrue(calories[0] > 0)
+        self.assertEqual(calories[0], calories[1])
+        self.assertEqual(calories[2], 0)
+
+        # Nothing has been modified since tomorrow
+        output = StringIO()
+        management.call_command('recompute_nutrition',
+            processes=1, since='2999-01-01', stdout=output)
+        self.assertTrue('Recalculated 0 recipes' in output.getvalue())
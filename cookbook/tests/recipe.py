@@ -1,6 +1,7 @@
 from django.test import TestCase
 from core.models import Food, Unit, FoodNutritionInfo
 from cookbook.models import Recipe, IngredientCategory
+from cookbook.jobs import process_queue
 
 class RecipeTest (TestCase):
     fixtures = [
@@ -25,6 +26,13 @@ class RecipeTest (TestCase):
         self.pancakes = Recipe.objects.get(name='Pancakes')
 
 
+    def recalculate(self):
+        """Run queued recalculations, and reload the recipe.
+        """
+        process_queue()
+        self.pancakes = Recipe.objects.get(pk=self.pancakes.id)
+
+
 class RecipeNutritionTest (RecipeTest):
     def setUp(self):
         super(RecipeNutritionTest, self).setUp()
@@ -32,6 +40,7 @@ class RecipeNutritionTest (RecipeTest):
         self.pancakes.ingredients.create(quantity=1, food=self.egg)
         self.pancakes.ingredients.create(quantity=1, unit=self.cup, food=self.flour)
         self.pancakes.save()
+        self.recalculate()
 
         self.egg_NI = FoodNutritionInfo.objects.get(
             food=self.egg, quantity=1, unit=None)
@@ -51,24 +60,40 @@ class RecipeNutritionTest (RecipeTest):
         # Add 1 oz. butter to recipe
         self.pancakes.ingredients.create(quantity=1, unit=self.ounce, food=self.butter)
         self.pancakes.save()
+        self.recalculate()
 
         # Ensure that butter nutrition is now included in the total
         total_NI = self.egg_NI + self.flour_NI + self.butter_NI
         self.assertTrue(self.pancakes.nutrition_info.is_equal(total_NI))
 
 
+    def test_recipe_nutrition_pending_until_recalculated(self):
+        """RecipeNutritionInfo is pending until the queue is processed.
+        """
+        self.assertFalse(self.pancakes.nutrition_pending())
+        self.pancakes.ingredients.create(quantity=1, unit=self.ounce, food=self.butter)
+        self.assertTrue(self.pancakes.nutrition_pending())
+        # Nutrition is unchanged until recalculation
+        total_NI = self.egg_NI + self.flour_NI
+        self.assertTrue(self.pancakes.nutrition_info.is_equal(total_NI))
+        self.recalculate()
+        self.assertFalse(self.pancakes.nutrition_pending())
+
+
     def test_recipe_nutrition_info_after_changing_servings(self):
         """Recalculate RecipeNutritionInfo after changing number of servings.
         """
         # If the recipe serves 2, nutrition information should be halved
         self.pancakes.num_portions = 2.0
         self.pancakes.save()
+        self.recalculate()
         total_NI = (self.egg_NI + self.flour_NI) * 0.5
         self.assertTrue(self.pancakes.nutrition_info.is_equal(total_NI))
 
         # If the recipe serves 4, nutrition information should be quartered
         self.pancakes.num_portions = 4.0
         self.pancakes.save()
+        self.recalculate()
         total_NI = (self.egg_NI + self.flour_NI) * 0.25
         self.assertTrue(self.pancakes.nutrition_info.is_equal(total_NI))
 
@@ -0,0 +1,157 @@
+from StringIO import StringIO
+from django.test import TestCase, TransactionTestCase
+from django.test.client import Client
+from django.core import management
+from django.core.urlresolvers import reverse
+from django.utils import simplejson
+from core.models import Food
+from cookbook.models import Recipe, RecipeSearchTerm
+from cookbook import search as search_module
+from cookbook.search import search, tokenize, index_pending, index_recipes
+
+class RecipeSearchTest (TestCase):
+    fixtures = [
+        'test_food',
+        'test_unit',
+        'test_equivalence',
+        'test_food_nutrition_info',
+        'test_nutrition_info',
+        'test_recipe',
+    ]
+    def setUp(self):
+        search_module._pending.clear()
+        self.egg = Food.objects.get(name='egg')
+        self.flour = Food.objects.get(name='all-purpose flour')
+        self.omelet = Recipe.objects.create(name='Omelet', source='Grandma',
+            directions='Whisk the eggs and cook them gently.')
+        self.omelet.ingredients.create(quantity=3, food=self.egg)
+        self.bread = Recipe.objects.create(name='Egg Bread',
+            directions='Knead the dough.')
+        self.bread.ingredients.create(quantity=2, food=self.egg)
+        self.bread.ingredients.create(quantity=3, food=self.flour)
+        index_pending()
+
+
+    def ids(self, query):
+        return [recipe_id for recipe_id, score in search(query)]
+
+
+    def test_tokenize(self):
+        """Text is split into distinct lowercase words.
+        """
+        self.assertEqual(tokenize(u"Mom's Apple-Pie, apple pie!"),
+                         set([u'mom', u's', u'apple', u'pie']))
+        self.assertEqual(tokenize(None), set())
+
+
+    def test_search_fields(self):
+        """Recipes are found by name, source, directions and ingredient food.
+        """
+        self.assertEqual(self.ids('omelet'), [self.omelet.id])
+        self.assertEqual(self.ids('grandma'), [self.omelet.id])
+        self.assertEqual(self.ids('knead'), [self.bread.id])
+        self.assertEqual(self.ids('flour'), [self.bread.id])
+        self.assertEqual(self.ids('nothing'), [])
+        self.assertEqual(self.ids(''), [])
+
+
+    def test_search_ranking(self):
+        """Every word must match, and matches in the name rank first.
+        """
+        # Both use egg, but only the bread has it in its name
+        self.assertEqual(self.ids('egg'), [self.bread.id, self.omelet.id])
+        self.assertEqual(self.ids('egg gently'), [self.omelet.id])
+        # Longer words match as prefixes
+        self.assertEqual(self.ids('whis'), [self.omelet.id])
+        self.assertEqual(self.ids('om'), [])
+
+
+    def test_index_follows_changes(self):
+        """The index is updated when recipes, ingredients and foods change.
+        """
+        self.omelet.name = 'Frittata'
+        self.omelet.save()
+        index_pending()
+        self.assertEqual(self.ids('omelet'), [])
+        self.assertEqual(self.ids('frittata'), [self.omelet.id])
+
+        self.flour.name = 'rye flour'
+        self.flour.save()
+        index_pending()
+        self.assertEqual(self.ids('rye'), [self.bread.id])
+
+        self.bread.ingredients.get(food=self.flour).delete()
+        index_pending()
+        self.assertEqual(self.ids('rye'), [])
+
+        self.bread.delete()
+        self.assertFalse(RecipeSearchTerm.objects.filter(recipe=self.bread.id).exists())
+
+
+    def test_indexed_once(self):
+        """Recipes are indexed once, however many of their ingredients were
+        saved, and not at all for fixtures.
+        """
+        for i in range(3):
+            self.bread.ingredients.create(quantity=1, food=self.egg)
+        self.assertEqual(search_module._pending, set([self.bread.id]))
+        with self.assertNumQueries(5):
+            index_pending()
+        self.assertEqual(search_module._pending, set())
+
+        management.call_command('loaddata', 'test_recipe', verbosity=0, commit=False)
+        self.assertEqual(search_module._pending, set())
+
+
+    def test_rebuild_search_index_command(self):
+        """Rebuild the index with the management command.
+        """
+        RecipeSearchTerm.objects.all().delete()
+        self.assertEqual(self.ids('omelet'), [])
+        output = StringIO()
+        management.call_command('rebuild_search_index', stdout=output)
+        self.assertTrue('Indexed %d recipes' % Recipe.objects.count()
+                        in output.getvalue())
+        self.assertEqual(self.ids('omelet'), [self.omelet.id])
+
+
+    def test_search_view(self):
+        """The search view returns a page of ranked results as JSON.
+        """
+        client = Client()
+        response = client.get(reverse('cookbook_search'), {'q': 'egg'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = simplejson.loads(response.content)
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(data['num_pages'], 1)
+        self.assertEqual([r['name'] for r in data['results']], ['Egg Bread', 'Omelet'])
+        self.assertEqual(data['results'][1]['url'], self.omelet.get_absolute_url())
+
+        # Pages past the end give the last page
+        response = client.get(reverse('cookbook_search'), {'q': 'egg', 'page': 5})
+        self.assertEqual(simplejson.loads(response.content)['page'], 1)
+
+
+class IndexTransactionTest (TransactionTestCase):
+    def tearDown(self):
+        # Nothing is rolled back after these tests
+        management.call_command('flush', verbosity=0, interactive=False)
+
+
+    def test_failed_index(self):
+        """A recipe whose indexing fails keeps its old index entries.
+        """
+        search_module._pending.clear()
+        omelet = Recipe.objects.create(name='Omelet')
+        index_pending()
+
+        def fail(fields):
+            raise RuntimeError("Failed partway through")
+        recipe_terms = search_module.recipe_terms
+        search_module.recipe_terms = fail
+        try:
+            self.assertRaises(RuntimeError, index_recipes, [omelet.id])
+        finally:
+            search_module.recipe_terms = recipe_terms
+        self.assertEqual([recipe_id for recipe_id, score in search('omelet')], [omelet.id])
@@ -1,7 +1,13 @@
 from django.test import TestCase
 from django.test.client import Client
 from django.core.urlresolvers import reverse
-from cookbook.models import Recipe
+from django.core.cache import cache
+from django.utils import simplejson
+from core.middleware import run_after_request
+from core.models import Food, Unit, Preparation
+from cookbook.models import Recipe, RecipeCategory, IngredientCategory
+from cookbook import catalog, views
+from nutrition.nutrients import COLUMNS
 
 class CookbookViewTest (TestCase):
     fixtures = [
@@ -15,6 +21,7 @@ class CookbookViewTest (TestCase):
     ]
     def setUp(self):
         self.client = Client()
+        cache.clear()
 
 
     def test_view_cookbook_index(self):
@@ -42,6 +49,140 @@ class CookbookViewTest (TestCase):
         self.assertEqual(response.context['nutrition_info'], pancakes.nutrition_info)
 
 
+    def test_cookbook_index_query_count(self):
+        """The Cookbook index page takes the same number of queries however
+        many recipes and categories there are.
+        """
+        for category_name in ('Bread', 'Dessert'):
+            category = RecipeCategory.objects.create(name=category_name)
+            for i in range(3):
+                Recipe.objects.create(name='%s %d' % (category_name, i),
+                                      category=category, num_portions=2)
+        # Catch up on the changes above, as the end of a request would
+        run_after_request()
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('cookbook_index'))
+        categories = response.context['recipe_categories']
+        self.assertEqual([name for name, recipes in categories],
+                         [None, 'Bread', 'Dessert'])
+        self.assertEqual([recipe.name for recipe in categories[1][1]],
+                         ['Bread 0', 'Bread 1', 'Bread 2'])
+
+
+    def make_catalog(self):
+        """Add recipes in two categories, and return the names of all recipes
+        in index order.
+        """
+        for category_name in ('Dessert', 'Bread'):
+            category = RecipeCategory.objects.create(name=category_name)
+            for name in ('Roll', 'Bun', 'Bun'):
+                Recipe.objects.create(name='%s %s' % (category_name, name),
+                                      category=category)
+        Recipe.objects.create(name='Apple')
+        return ['Apple', 'Pancakes',
+                'Bread Bun', 'Bread Bun', 'Bread Roll',
+                'Dessert Bun', 'Dessert Bun', 'Dessert Roll']
+
+
+    def test_cookbook_index_pages(self):
+        """The Cookbook index is split into pages, each following the last.
+        """
+        expected = self.make_catalog()
+        page_size, catalog.PAGE_SIZE = catalog.PAGE_SIZE, 3
+        try:
+            names = []
+            url = reverse('cookbook_index')
+            while url:
+                response = self.client.get(url)
+                recipes = [recipe for category, group
+                           in response.context['recipe_categories']
+                           for recipe in group]
+                self.assertTrue(len(recipes) <= 3)
+                names += [recipe.name for recipe in recipes]
+                next_page = response.context['next_page']
+                url = next_page and reverse('cookbook_index') + '?after=' + next_page
+        finally:
+            catalog.PAGE_SIZE = page_size
+        self.assertEqual(names, expected)
+
+        # A bad position gives the first page
+        response = self.client.get(reverse('cookbook_index'), {'after': 'junk'})
+        self.assertEqual(response.context['after'], None)
+
+
+    def test_all_recipes_streamed(self):
+        """All recipes are listed on one page, rendered in chunks.
+        """
+        expected = self.make_catalog()
+        chunk_size, views.STREAM_CHUNK_SIZE = views.STREAM_CHUNK_SIZE, 2
+        try:
+            response = self.client.get(reverse('cookbook_all_recipes'))
+        finally:
+            views.STREAM_CHUNK_SIZE = chunk_size
+        self.assertEqual(response.status_code, 200)
+        content = response.content
+        positions = [content.index('>%s<' % name) for name in expected[:3]]
+        self.assertEqual(positions, sorted(positions))
+        self.assertEqual(content.count('<span class="recipe-name">'), len(expected))
+        # Each category heading appears once, though split between chunks
+        self.assertEqual(content.count('<h2>Bread</h2>'), 1)
+        self.assertTrue(content.rstrip().endswith('</html>'))
+
+
+    def test_recipe_query_count(self):
+        """A Recipe page takes the same number of queries however many
+        ingredients and ingredient categories there are, and only one when
+        served from the cache.
+        """
+        pancakes = Recipe.objects.get(name='Pancakes')
+        flour = Food.objects.get(name='all-purpose flour')
+        cup = Unit.objects.get(name='cup')
+        sifted = Preparation.objects.create(name='sifted')
+        for category_name in ('dry', 'wet'):
+            category = IngredientCategory.objects.create(name=category_name)
+            for i in range(3):
+                pancakes.ingredients.create(quantity=i + 1, unit=cup, food=flour,
+                                            preparation=sifted, category=category)
+        # Catch up on the changes above, as the end of a request would
+        run_after_request()
+        url = reverse('cookbook_show_recipe', kwargs={'recipe_id': pancakes.id})
+        with self.assertNumQueries(6):
+            response = self.client.get(url)
+        self.assertContains(response, '3 cups all-purpose flour, sifted')
+        self.assertContains(response, '<h3>wet</h3>')
+        with self.assertNumQueries(1):
+            cached = self.client.get(url)
+        self.assertEqual(cached.content, response.content)
+
+
+    def test_nutrition_summaries(self):
+        """Nutrition summaries for many recipes and ingredients are fetched
+        at once, with one query for each kind.
+        """
+        pancakes = Recipe.objects.get(name='Pancakes')
+        flour = Food.objects.get(name='all-purpose flour')
+        ingredient = pancakes.ingredients.create(quantity=1, food=flour)
+        # Catch up on the changes above, as the end of a request would
+        run_after_request()
+        url = reverse('cookbook_nutrition_summaries')
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {
+                'recipe': '%d,999' % pancakes.id,
+                'ingredient': str(ingredient.id),
+            })
+        self.assertEqual(response['Content-Type'], 'application/json')
+        data = simplejson.loads(response.content)
+        self.assertEqual([nutrient[0] for nutrient in data['nutrients']],
+                         list(COLUMNS))
+        self.assertEqual(data['summaries']['recipe'].keys(), [str(pancakes.id)])
+        self.assertEqual(data['summaries']['recipe'][str(pancakes.id)][0],
+                         round(pancakes.nutrition_info.calories, 2))
+        self.assertEqual(data['summaries']['ingredient'].keys(), [str(ingredient.id)])
+
+        response = self.client.get(url, {'recipe': 'one,two'})
+        self.assertEqual(response.status_code, 400)
+
+
     def test_view_cookbook_nonexistent_recipe(self):
         """View a nonexistent Recipe.
         """
@@ -3,5 +3,8 @@ from django.conf.urls.defaults import patterns, url
 urlpatterns = patterns(
     'cookbook.views',
     url(r'^$', 'index', name='cookbook_index'),
+    url(r'^all/$', 'all_recipes', name='cookbook_all_recipes'),
+    url(r'^search/$', 'search_recipes', name='cookbook_search'),
+    url(r'^nutrition/$', 'nutrition_summaries', name='cookbook_nutrition_summaries'),
     url(r'^(?P<recipe_id>\w+)/$', 'show_recipe', name='cookbook_show_recipe'),
 )
@@ -1,22 +1,183 @@
+from django.core.paginator import Paginator, EmptyPage
+from django.db import connection, transaction
+from django.http import HttpResponse, HttpResponseNotModified, HttpResponseBadRequest, \
+        Http404
 from django.shortcuts import render_to_response, get_object_or_404
-from cookbook.models import Recipe
+from django.template.loader import render_to_string
+from django.utils import simplejson
+from cookbook.models import Recipe, RecipeNutritionInfo, IngredientNutritionInfo
+from nutrition.nutrients import NUTRIENTS, COLUMNS
+from cookbook import page_cache, search, catalog
 from core.helpers import group_by_category
 
+# Number of recipes in each page of search results
+SEARCH_RESULTS_PER_PAGE = 25
+
+# Number of recipes rendered at a time when listing all recipes
+STREAM_CHUNK_SIZE = 200
+
+# Where the recipes go in the page listing all recipes
+STREAM_MARKER = '<!-- recipes -->'
+
+# Models whose nutrition summaries may be fetched, and the field each one
+# refers to its owner by
+NUTRITION_SUMMARIES = {
+    'recipe': (RecipeNutritionInfo, 'recipe'),
+    'ingredient': (IngredientNutritionInfo, 'ingredient'),
+}
+
+# Most summaries that may be fetched at once
+MAX_NUTRITION_SUMMARIES = 500
+
 def index(request):
-    """Cookbook homepage.
+    """Cookbook homepage, listing one page of recipes, starting after the
+    position given by the ``after`` parameter. See `cookbook.catalog`.
     """
+    after = catalog.decode_position(request.GET.get('after', ''))
+    recipes, more = catalog.page(after)
     variables = {
-        'recipe_categories': group_by_category(Recipe.objects.all()),
+        'recipe_categories': group_by_category(recipes),
+        'after': after,
+        'next_page': catalog.encode_position(catalog.position(recipes[-1]))
+                     if more else None,
     }
     return render_to_response('cookbook/index.html', variables)
 
 
+def all_recipes(request):
+    """List every recipe on one page. The page is streamed to the client a
+    chunk of recipes at a time, so it is never all in memory at once.
+    """
+    page = render_to_string('cookbook/index.html', {'stream_marker': STREAM_MARKER})
+    head, tail = page.split(STREAM_MARKER)
+    return HttpResponse(_stream_recipes(head, tail))
+
+
+def _stream_recipes(head, tail):
+    """Yield the rendered index page `head`, each chunk of recipes, and the
+    page `tail`.
+    """
+    yield head
+    try:
+        continued_category = None
+        for recipes in catalog.pages(STREAM_CHUNK_SIZE):
+            groups = group_by_category(recipes)
+            yield render_to_string('cookbook/_recipe_list.html', {
+                'recipe_categories': groups,
+                # Don't repeat the heading of a category split between chunks
+                'continued_category': continued_category,
+            })
+            continued_category = groups[-1][0]
+    finally:
+        # The connection was closed when the request finished, before the
+        # page was streamed; close the one reopened by the queries above,
+        # rather than leave it open in a transaction
+        if not transaction.is_managed():
+            connection.close()
+    yield tail
+
+
+def search_recipes(request):
+    """Search recipes for the words in the ``q`` parameter, and return one
+    page (given by the ``page`` parameter) of ranked results as JSON.
+    """
+    query = request.GET.get('q', '')
+    paginator = Paginator(search.search(query), SEARCH_RESULTS_PER_PAGE)
+    try:
+        page = paginator.page(int(request.GET.get('page', 1)))
+    except (ValueError, EmptyPage):
+        page = paginator.page(paginator.num_pages)
+
+    scores = dict(page.object_list)
+    recipes = Recipe.objects.select_related('category', 'portion') \
+            .in_bulk(scores.keys())
+    results = [
+        {
+            'id': recipe.id,
+            'name': recipe.name,
+            'url': recipe.get_absolute_url(),
+            'servings': recipe.servings(),
+            'source': recipe.source,
+            'rating': recipe.rating,
+            'category': recipe.category.name if recipe.category else None,
+            'score': score,
+        }
+        for recipe, score in (
+            (recipes[recipe_id], score)
+            for recipe_id, score in page.object_list if recipe_id in recipes)
+    ]
+    data = {
+        'query': query,
+        'page': page.number,
+        'num_pages': paginator.num_pages,
+        'count': paginator.count,
+        'results': results,
+    }
+    return HttpResponse(simplejson.dumps(data), mimetype='application/json')
+
+
+def nutrition_summaries(request):
+    """Return the nutrition summaries for many recipes and ingredients at once,
+    as JSON. The ``recipe`` and ``ingredient`` parameters are comma-separated
+    lists of ids; the result looks like::
+
+        {"nutrients": [["calories", "Calories", ""], ["fat", "Fat", "g"], ...],
+         "summaries": {"recipe": {"12": [250.0, 4.5, ...], ...},
+                       "ingredient": {...}}}
+
+    with values in the order of `nutrients`.
+    """
+    wanted = {}
+    for kind in NUTRITION_SUMMARIES:
+        text = request.GET.get(kind, '')
+        try:
+            wanted[kind] = [int(pk) for pk in text.split(',') if pk]
+        except ValueError:
+            return HttpResponseBadRequest("Ids must be comma-separated numbers")
+    if sum(len(ids) for ids in wanted.values()) > MAX_NUTRITION_SUMMARIES:
+        return HttpResponseBadRequest(
+            "At most %d summaries may be fetched at once" % MAX_NUTRITION_SUMMARIES)
+
+    summaries = {}
+    for kind, ids in wanted.iteritems():
+        model, owner = NUTRITION_SUMMARIES[kind]
+        rows = model.objects.filter(**{'%s__in' % owner: ids}) \
+                .values_list(owner, *COLUMNS) if ids else []
+        summaries[kind] = dict(
+            (row[0], [round(value, 2) for value in row[1:]]) for row in rows)
+
+    data = {
+        'nutrients': [
+            [nutrient.name, nutrient.label, nutrient.unit]
+            for nutrient in NUTRIENTS[:len(COLUMNS)]
+        ],
+        'summaries': summaries,
+    }
+    return HttpResponse(simplejson.dumps(data), mimetype='application/json')
+
+
 def show_recipe(request, recipe_id):
-    recipe = get_object_or_404(Recipe, pk=recipe_id)
+    """Show a recipe, from the page cache if it has not changed since it was
+    last rendered. See `cookbook.page_cache`.
+    """
+    stamp = page_cache.recipe_stamp(recipe_id)
+    if stamp is None:
+        raise Http404
+    if page_cache.not_modified(request, recipe_id, stamp):
+        return page_cache.set_headers(HttpResponseNotModified(), recipe_id, stamp)
+
+    stamp, html = page_cache.cached_page(
+        recipe_id, stamp, lambda: _render_recipe(recipe_id))
+    return page_cache.set_headers(HttpResponse(html), recipe_id, stamp)
+
+
+def _render_recipe(recipe_id):
+    """Render the page for the recipe with the given id.
+    """
+    recipe = get_object_or_404(Recipe.objects.select_related('portion'), pk=recipe_id)
     variables = {
         'recipe': recipe,
         'serving': recipe.portion or 'serving',
         'nutrition_info': recipe.nutrition_info,
     }
-    return render_to_response('cookbook/recipe.html', variables)
-
+    return render_to_string('cookbook/recipe.html', variables)
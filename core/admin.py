@@ -1,5 +1,12 @@
 from django.contrib import admin
 from core.models import FoodGroup, Food, Unit, Equivalence, Preparation, FoodNutritionInfo
+from nutrition.forms import NutritionInfoForm, PACKED_FIELDS
+
+# Custom forms
+
+class FoodNutritionInfoForm (NutritionInfoForm):
+    class Meta:
+        model = FoodNutritionInfo
 
 # Inline forms
 
@@ -19,11 +26,23 @@ class FoodInline (admin.TabularInline):
     model = Food
     extra = 5
 
-class FoodNutritionInfoInline (admin.TabularInline):
+class FoodNutritionInfoInline (admin.StackedInline):
     model = FoodNutritionInfo
+    form = FoodNutritionInfoForm
     extra = 0
-    fields = ('quantity', 'unit', 'calories', 'fat_calories',
-              'fat', 'carb', 'sodium', 'protein', 'cholesterol')
+    fieldsets = (
+        (None, {
+            'fields': (
+                ('quantity', 'unit'),
+                ('calories', 'fat_calories'),
+                ('fat', 'carb', 'sodium', 'protein', 'cholesterol'),
+            )
+        }),
+        ('Other nutrients', {
+            'classes': ('collapse',),
+            'fields': PACKED_FIELDS,
+        }),
+    )
     verbose_name = 'Nutrition information'
     verbose_name_plural = 'Nutrition information'
 
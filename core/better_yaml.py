@@ -49,57 +49,223 @@ Note that this serializer is NOT compatible with the default Django
 YAML serializer; this one uses nested dictionaries, while the default
 one uses a flat list of object dicts.
 
-Requires PyYaml (http://pyyaml.org/), of course.
+For large databases, ``./manage.py dump_yaml`` writes this format a model at
+a time, reading each model's objects in chunks and writing them as they are
+read (see the `streaming` option of the Serializer), optionally compressed.
+
+Requires PyYaml (http://pyyaml.org/), of course. If PyYaml was built with
+LibYAML, its faster C parser is used for deserializing.
 """
 
+import gzip
 from StringIO import StringIO
 import yaml
+from yaml.events import AliasEvent, ScalarEvent, SequenceStartEvent, \
+        SequenceEndEvent, MappingStartEvent, MappingEndEvent, StreamEndEvent
+from yaml.nodes import ScalarNode, SequenceNode, MappingNode
 
-from django.core.serializers.pyyaml import Serializer as YamlSerializer
+from django.core.serializers.base import SerializationError
+from django.core.serializers.pyyaml import Serializer as YamlSerializer, DjangoSafeDumper
 from django.core.serializers.python import Deserializer as PythonDeserializer
 from django.utils.encoding import smart_unicode
 
+# xz compression is optional
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+# Use the much faster LibYAML parser when it is installed
+try:
+    SafeLoader = yaml.CSafeLoader
+except AttributeError:
+    SafeLoader = yaml.SafeLoader
+
 class Serializer (YamlSerializer):
     """
     Serialize database objects as nested dicts, indexed first by
     model name, then by primary key.
+
+    Two options may be given along with the usual ones:
+
+    `streaming`
+        If True, write each object as soon as it is serialized, rather than
+        all of them at the end, sorted. The objects must come grouped by
+        model (as from one queryset per model), and are written in the
+        order given.
+    `compress`
+        ``'gz'`` or ``'xz'`` to compress the output (xz needs the `lzma`
+        module).
     """
     def start_serialization(self):
         self._current = None
         self.objects = {}
+        self.streaming = self.options.pop('streaming', False)
+        self._model = None
+        self._written_models = set()
+        self._output = None
+        compress = self.options.pop('compress', None)
+        if compress:
+            self._output = self.stream
+            self.stream = compressed_stream(self.stream, compress)
 
     def end_object(self, obj):
         model = smart_unicode(obj._meta)
         pk = obj._get_pk_val()
 
-        if model not in self.objects:
-            self.objects[model] = {}
-
-        self.objects[model][pk] = self._current
+        if self.streaming:
+            self._write_object(model, pk, self._current)
+        else:
+            if model not in self.objects:
+                self.objects[model] = {}
+            self.objects[model][pk] = self._current
         self._current = None
 
+    def _write_object(self, model, pk, fields):
+        """
+        Write one object's entry, starting its model's block if it is the
+        first object of that model.
+        """
+        if model != self._model:
+            if model in self._written_models:
+                raise SerializationError(
+                    "Objects of %s must all come together when streaming" % model)
+            self._written_models.add(model)
+            self._model = model
+            self.stream.write('%s:\n' % model)
+        text = yaml.dump({pk: fields}, Dumper=DjangoSafeDumper, **self.options)
+        indent = ' ' * (self.options.get('indent') or 2)
+        self.stream.write(''.join(indent + line for line in text.splitlines(True)))
+
+    def end_serialization(self):
+        if not self.streaming:
+            super(Serializer, self).end_serialization()
+        elif not self._written_models:
+            self.stream.write('{}\n')
+        if self._output is not None:
+            # Flush the compressed data, leaving the output stream open
+            self.stream.close()
+            self.stream = self._output
+
+    def getvalue(self):
+        if callable(getattr(self.stream, 'getvalue', None)):
+            return self.stream.getvalue()
+
+
+def compressed_stream(stream, compress):
+    """
+    Return a file object writing to `stream` compressed with ``'gz'``
+    (gzip) or ``'xz'``.
+    """
+    if compress == 'gz':
+        return gzip.GzipFile(fileobj=stream, mode='wb')
+    if compress == 'xz':
+        if lzma is None:
+            raise SerializationError("xz compression needs the lzma module")
+        return lzma.LZMAFile(stream, mode='wb')
+    raise SerializationError("Unknown compression '%s'" % compress)
+
+
+def _compose(loader, anchors):
+    """
+    Build the YAML node starting at the next event of `loader`, consuming
+    all of its events. This is what `yaml.composer.Composer` does, but node
+    by node, so a large document need not be composed all at once.
+    """
+    event = loader.get_event()
+    if isinstance(event, AliasEvent):
+        return anchors[event.anchor]
+
+    if isinstance(event, ScalarEvent):
+        tag = event.tag
+        if tag is None or tag == u'!':
+            tag = loader.resolve(ScalarNode, event.value, event.implicit)
+        node = ScalarNode(tag, event.value, event.start_mark, event.end_mark,
+                          style=event.style)
+    elif isinstance(event, SequenceStartEvent):
+        tag = event.tag
+        if tag is None or tag == u'!':
+            tag = loader.resolve(SequenceNode, None, event.implicit)
+        node = SequenceNode(tag, [], event.start_mark, None,
+                            flow_style=event.flow_style)
+        while not loader.check_event(SequenceEndEvent):
+            node.value.append(_compose(loader, anchors))
+        node.end_mark = loader.get_event().end_mark
+    else:
+        tag = event.tag
+        if tag is None or tag == u'!':
+            tag = loader.resolve(MappingNode, None, event.implicit)
+        node = MappingNode(tag, [], event.start_mark, None,
+                           flow_style=event.flow_style)
+        while not loader.check_event(MappingEndEvent):
+            key = _compose(loader, anchors)
+            node.value.append((key, _compose(loader, anchors)))
+        node.end_mark = loader.get_event().end_mark
+
+    if event.anchor is not None:
+        anchors[event.anchor] = node
+    return node
+
+
+def _construct(loader, anchors):
+    """
+    Return the Python value of the next YAML node in `loader`.
+    """
+    value = loader.construct_object(_compose(loader, anchors), deep=True)
+    # Don't keep every value ever constructed
+    loader.constructed_objects = {}
+    return value
+
+
+def iter_entries(stream):
+    """
+    Yield a ``{'model': ..., 'pk': ..., 'fields': ...}`` dict for each object
+    in the YAML document in `stream`, as written by the Serializer above,
+    reading only as far into the stream as needed for the next one.
+    """
+    loader = SafeLoader(stream)
+    anchors = {}
+    try:
+        loader.get_event()  # StreamStart
+        if loader.check_event(StreamEndEvent):
+            return
+        loader.get_event()  # DocumentStart
+        # An empty document has no mapping of models
+        if not loader.check_event(MappingStartEvent):
+            return
+        loader.get_event()
+        while not loader.check_event(MappingEndEvent):
+            model = _construct(loader, anchors)
+            # A model with no objects may be written as null
+            if not loader.check_event(MappingStartEvent):
+                _construct(loader, anchors)
+                continue
+            loader.get_event()
+            while not loader.check_event(MappingEndEvent):
+                pk = _construct(loader, anchors)
+                fields = _construct(loader, anchors)
+                yield {'model': model, 'pk': pk, 'fields': fields}
+            loader.get_event()
+    finally:
+        loader.dispose()
+
 
 def Deserializer(stream_or_string, **options):
     """
     Deserialize a stream or string of YAML data,
     as written by the Serializer above.
+
+    Objects are parsed and yielded one at a time, in the order they appear,
+    so memory use does not grow with the size of the data.
     """
     if isinstance(stream_or_string, basestring):
         stream = StringIO(stream_or_string)
     else:
         stream = stream_or_string
 
-    # Reconstruct the flat object list as PythonDeserializer expects
-    # FIXME: This will probably choke on large data sets, since it
-    # constructs the flattened data list in memory
-    data = []
-    for model, objects in yaml.load(stream).iteritems():
-        # Add the model name back into each object dict
-        for pk, fields in objects.iteritems():
-            data.append({'model': model, 'pk': pk, 'fields': fields})
-
-    # Deserialize the flattened data
-    for obj in PythonDeserializer(data, **options):
-        yield obj
-
-
+    for entry in iter_entries(stream):
+        for obj in PythonDeserializer([entry], **options):
+            yield obj
@@ -0,0 +1,245 @@
+# conversion_table.py
+
+"""
+Unit conversion factors, shared between processes through a memory-mapped
+file.
+
+Every worker process of a multi-process deployment (see `apache/django.wsgi`)
+would otherwise build its own :py:class:`core.helpers.UnitGraph` and keep it
+valid on its own. Instead, the unit-by-unit factor matrix is written once to
+a binary file, which each worker maps read-only; lookups read straight from
+the mapping, so the table costs the same memory no matter how many workers
+share it.
+
+The file is stamped with the ``'conversions'`` :py:class:`core.models.CacheGeneration`
+it was built from. Saving or deleting a `Unit` or `Equivalence` bumps that
+generation (as does changing a food's density, for the other caches that
+share it); each worker checks it at most once per request, and the first
+worker to see a newer generation rebuilds the file, while the others remap it.
+
+To enable the shared table, add the path where it should live to your
+settings.py:
+
+    CONVERSION_TABLE_PATH = '/some/path/vittles_conversions.bin'
+
+If ``CONVERSION_TABLE_PATH`` is unset, each process uses its own `UnitGraph`.
+"""
+
+import os
+import mmap
+import struct
+import fcntl
+from array import array
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.dispatch import receiver
+
+from core.helpers import NoEquivalence, UnitGraph
+
+# Name of the CacheGeneration that versions the table
+GENERATION = 'conversions'
+
+# File layout: header, unit ids, unit names and kinds (UTF-8, one
+# "name\tkind" per line), padding to 8 bytes, unit x unit factor matrix (NaN
+# where no conversion exists)
+MAGIC = 'VITCONV2'
+_header = struct.Struct('<8sqii')
+_factor = struct.Struct('<d')
+
+
+class ConversionTable (object):
+    """Read-only view of a conversion table file. Provides the same `factor`
+    and `scales` methods as :py:class:`core.helpers.UnitGraph`.
+    """
+    def __init__(self, path):
+        table_file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            table_file.close()
+
+        magic, self.generation, units, names_length = \
+                _header.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError("'%s' is not a conversion table" % path)
+
+        offset = _header.size
+        unit_ids = struct.unpack_from('<%di' % units, self._map, offset)
+        offset += 4 * units
+        names = self._map[offset:offset + names_length].decode('utf-8')
+        offset += names_length
+        offset += -offset % 8
+
+        self._size = units
+        self._factors_offset = offset
+
+        self._unit_index = dict((unit_id, i) for i, unit_id in enumerate(unit_ids))
+        self._name_index = {}
+        self._kinds = []
+        for i, line in enumerate(names.split(u'\n')[:units]):
+            name, kind = line.split(u'\t')
+            self._name_index[name] = i
+            self._kinds.append(kind)
+        self._unit_ids = unit_ids
+
+
+    def _lookup(self, i, j):
+        """Return the factor from unit index `i` to unit index `j`, or None.
+        """
+        offset = self._factors_offset + 8 * (i * self._size + j)
+        value, = _factor.unpack_from(self._map, offset)
+        if value != value:
+            return None
+        return value
+
+
+    def factor(self, unit, to_unit):
+        """Return the number of `to_unit` in one `unit`, or raise
+        `NoEquivalence` if they are not connected.
+        """
+        try:
+            value = self._lookup(self._name_index[unicode(unit)],
+                                 self._name_index[unicode(to_unit)])
+        except KeyError:
+            value = None
+        if value is None:
+            raise NoEquivalence("Cannot convert '%s' to '%s'" % (unit, to_unit))
+        return value
+
+
+    def scales(self, to_unit, kind=None):
+        """Return a dict of ``{unit_id: factor}`` for every `Unit` (optionally
+        only those of the given `kind`) that can be converted to `to_unit`.
+        """
+        scales = {}
+        j = self._name_index.get(unicode(to_unit))
+        if j is None:
+            return scales
+        for i, unit_id in enumerate(self._unit_ids):
+            if kind and self._kinds[i] != kind:
+                continue
+            value = self._lookup(i, j)
+            if value is not None:
+                scales[unit_id] = value
+        return scales
+
+
+def write_table(path, generation):
+    """Compute conversion factors from the database, and write them to
+    `path`, stamped with `generation`. The file is replaced atomically, so
+    processes reading the old file are not disturbed.
+    """
+    graph = UnitGraph()
+    factors = graph.factors()
+    units = sorted(graph.units().iteritems())
+
+    names = u'\n'.join(u'%s\t%s' % (name, kind) for unit_id, (name, kind) in units)
+    names = names.encode('utf-8')
+
+    matrix = array('d')
+    for unit_id, (name, kind) in units:
+        row = factors.get(name, {name: 1.0})
+        for to_unit_id, (to_name, to_kind) in units:
+            matrix.append(row.get(to_name, float('nan')))
+
+    temp_path = '%s.%d' % (path, os.getpid())
+    table_file = open(temp_path, 'wb')
+    try:
+        table_file.write(_header.pack(
+            MAGIC, generation, len(units), len(names)))
+        array('i', [unit_id for unit_id, info in units]).tofile(table_file)
+        table_file.write(names)
+        table_file.write('\0' * (-table_file.tell() % 8))
+        matrix.tofile(table_file)
+    finally:
+        table_file.close()
+    os.rename(temp_path, path)
+
+
+class SharedConversionTable (object):
+    """Keeps a process mapped to the current :py:class:`ConversionTable`,
+    rebuilding the file when its generation is out of date.
+    """
+    def __init__(self, path=None):
+        self._path = path
+        self._table = None
+        self._checked = False
+
+
+    @property
+    def path(self):
+        return self._path or getattr(settings, 'CONVERSION_TABLE_PATH', None)
+
+
+    def expire(self):
+        """Check the table's generation again on next use.
+        """
+        self._checked = False
+
+
+    def invalidate(self):
+        """Unmap the table; it will be remapped (or rebuilt) on next use.
+        """
+        self._table = None
+        self._checked = False
+
+
+    def current(self):
+        """Return the current `ConversionTable`, or None if no
+        ``CONVERSION_TABLE_PATH`` is configured.
+        """
+        path = self.path
+        if not path:
+            return None
+        if self._table is not None and self._checked:
+            return self._table
+
+        from core.models import CacheGeneration
+        generation = CacheGeneration.current(GENERATION)
+        if self._table is None or self._table.generation != generation:
+            self._table = self._open(path, generation)
+        self._checked = True
+        return self._table
+
+
+    def _open(self, path, generation):
+        """Map the table at `path`, first rebuilding it if it is missing or
+        is not of the given `generation`.
+        """
+        table = self._map(path)
+        if table is not None and table.generation == generation:
+            return table
+
+        # Only one process rebuilds; the rest wait, then map its result
+        lock = open(path + '.lock', 'w')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            table = self._map(path)
+            if table is None or table.generation != generation:
+                write_table(path, generation)
+                table = self._map(path)
+        finally:
+            lock.close()
+        return table
+
+
+    def _map(self, path):
+        """Return the `ConversionTable` at `path`, or None if it is missing
+        or unreadable.
+        """
+        try:
+            return ConversionTable(path)
+        except (IOError, OSError, ValueError, struct.error, mmap.error):
+            return None
+
+
+# Process-wide shared table, invalidated by signals in `core.models`
+shared_table = SharedConversionTable()
+
+
+@receiver(request_started)
+def expire_shared_table(sender, **kwargs):
+    """Check the shared table's generation at most once per request.
+    """
+    shared_table.expire()
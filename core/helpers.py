@@ -1,36 +1,183 @@
-from django.core.exceptions import ObjectDoesNotExist
+from itertools import izip, repeat
+from django.core.signals import request_started
+from django.dispatch import receiver
 
 
 class NoEquivalence (Exception):
     pass
 
 
-def convert_unit(unit, to_unit):
-    """Convert `unit` to the equivalent quantity `to_unit`. Requires that an
-    :py:class:`Equivalence` be defined for the relevant units; if no `Equivalence` is
-    found, raise a `NoEquivalence` exception.
+class UnitGraph (object):
+    """Conversion factors between every pair of connected units, built once
+    from all :py:class:`Equivalence` rows and kept for the life of the process.
+
+    Each `Equivalence` is an edge between two units, usable in either
+    direction. Units with no direct `Equivalence` are converted along the
+    shortest chain of edges (fewest multiplications, and so the least rounding
+    error), with a direct mapping preferred over a reversed one. Call
+    `invalidate` whenever an `Equivalence` or `Unit` changes; the table is
+    rebuilt on next use. Changes made by other processes are noticed through
+    the ``'conversions'`` `CacheGeneration`, checked on first use after
+    `expire`.
     """
-    from core.models import Equivalence
+    def __init__(self):
+        self._state = None
+        self._generation = None
+        self._checked = False
+
+
+    def expire(self):
+        """Check for other processes' changes on next use.
+        """
+        self._checked = False
+
+
+    def invalidate(self):
+        """Discard all computed conversion factors.
+        """
+        self._state = None
+        self._checked = False
+
+
+    def _validate(self):
+        """Discard the conversion factors if units or equivalences have changed
+        in another process since they were built.
+        """
+        if self._checked:
+            return
+        from core.models import CacheGeneration
+        from core.conversion_table import GENERATION
+        generation = CacheGeneration.current(GENERATION)
+        if generation != self._generation:
+            self._state = None
+            self._generation = generation
+        self._checked = True
+
+
+    def _load(self):
+        """Return ``(factors, units)``, building them if necessary.
+        """
+        self._validate()
+        state = self._state
+        if state is None:
+            state = self._state = self._build()
+        return state
+
+
+    def factors(self):
+        """Return a dict of ``{unit_name: {to_unit_name: factor}}`` for every
+        pair of units that can be converted.
+        """
+        return self._load()[0]
+
+
+    def units(self):
+        """Return a dict of ``{unit_id: (unit_name, unit_kind)}`` for every
+        `Unit`.
+        """
+        return self._load()[1]
+
+
+    def factor(self, unit, to_unit):
+        """Return the number of `to_unit` in one `unit`, or raise
+        `NoEquivalence` if they are not connected.
+        """
+        try:
+            return self.factors()[unicode(unit)][unicode(to_unit)]
+        except KeyError:
+            raise NoEquivalence("Cannot convert '%s' to '%s'" % (unit, to_unit))
+
+
+    def scales(self, to_unit, kind=None):
+        """Return a dict of ``{unit_id: factor}`` for every `Unit` (optionally
+        only those of the given `kind`) that can be converted to `to_unit`.
+        """
+        factors, units = self._load()
+        to_unit = unicode(to_unit)
+        scales = {}
+        for unit_id, (name, unit_kind) in units.iteritems():
+            if kind and unit_kind != kind:
+                continue
+            if name == to_unit:
+                scales[unit_id] = 1.0
+            elif to_unit in factors.get(name, {}):
+                scales[unit_id] = factors[name][to_unit]
+        return scales
+
+
+    def _build(self):
+        """Query all `Equivalence`\s and compute the transitive closure.
+        """
+        from core.models import Equivalence, Unit
+
+        units = dict(
+            (unit_id, (name, kind))
+            for unit_id, name, kind in Unit.objects.values_list('id', 'name', 'kind')
+        )
+
+        rows = Equivalence.objects.values_list(
+            'unit__name', 'to_quantity', 'to_unit__name')
+
+        # Direct edges are listed before reversed ones, so that a breadth-first
+        # search reaches each neighbor by its direct mapping when there is one
+        forward = {}
+        reverse = {}
+        for unit, to_quantity, to_unit in rows:
+            forward.setdefault(unit, []).append((to_unit, to_quantity))
+            if to_quantity:
+                reverse.setdefault(to_unit, []).append((unit, 1.0 / to_quantity))
+
+        edges = {}
+        for unit in set(forward) | set(reverse):
+            edges[unit] = forward.get(unit, []) + reverse.get(unit, [])
+
+        factors = {}
+        for source in edges:
+            reached = {source: 1.0}
+            frontier = [source]
+            while frontier:
+                next_frontier = []
+                for unit in frontier:
+                    for to_unit, quantity in edges[unit]:
+                        if to_unit not in reached:
+                            reached[to_unit] = reached[unit] * quantity
+                            next_frontier.append(to_unit)
+                frontier = next_frontier
+            factors[source] = reached
+        return factors, units
+
+
+# Process-wide conversion table, invalidated by signals in `core.models`
+unit_graph = UnitGraph()
+
 
+@receiver(request_started)
+def expire_unit_graph(sender, **kwargs):
+    """Check the unit graph's generation at most once per request.
+    """
+    unit_graph.expire()
+
+
+def conversions():
+    """Return the source of unit conversion factors for this process: the
+    :py:class:`core.conversion_table.ConversionTable` shared between processes
+    if ``settings.CONVERSION_TABLE_PATH`` is set, otherwise `unit_graph`.
+    Either one provides `factor` and `scales`.
+    """
+    from core.conversion_table import shared_table
+    return shared_table.current() or unit_graph
+
+
+def convert_unit(unit, to_unit):
+    """Convert `unit` to the equivalent quantity `to_unit`. Requires that a
+    chain of :py:class:`Equivalence`\s connect the relevant units; if no such
+    chain exists, raise a `NoEquivalence` exception.
+    """
     # Degenerate case
     if str(unit) == str(to_unit):
         return 1.0
 
-    # Try to find a direct mapping between units
-    try:
-        equivalence = Equivalence.objects.get(unit__name=unit, to_unit__name=to_unit)
-    except ObjectDoesNotExist:
-        # OK, see if there's a mapping in the other direction
-        try:
-            equivalence = Equivalence.objects.get(unit__name=to_unit, to_unit__name=unit)
-        except ObjectDoesNotExist:
-            raise NoEquivalence("Cannot convert '%s' to '%s'" % (unit, to_unit))
-        # Got a reverse mapping -- divide
-        else:
-            return 1.0 / equivalence.to_quantity
-    # Got a direct mapping -- multiply
-    else:
-        return equivalence.to_quantity
+    return conversions().factor(unit, to_unit)
 
 
 def to_grams(unit, food=None):
@@ -84,6 +231,72 @@ def convert_amount(quantity, unit, to_unit):
         return quantity * convert_unit(unit, to_unit)
 
 
+def _scale_amounts(quantities, unit_ids, densities, scales, density_scales, divide):
+    """Scale each quantity by the factor for its unit in `scales`, or failing
+    that in `density_scales`, multiplied (or if `divide` is True, divided) by
+    the food density in the same row. Return ``(amounts, valid)``.
+    """
+    if densities is None:
+        densities = repeat(None)
+    amounts = []
+    valid = []
+    for quantity, unit_id, density in izip(quantities, unit_ids, densities):
+        if unit_id in scales:
+            amount = quantity * scales[unit_id]
+        elif unit_id in density_scales:
+            density = density or 1.0
+            amount = quantity * density_scales[unit_id]
+            amount = amount / density if divide else amount * density
+        else:
+            amounts.append(0.0)
+            valid.append(False)
+            continue
+        amounts.append(amount)
+        valid.append(True)
+    return amounts, valid
+
+
+def convert_amounts(quantities, unit_ids, to_unit):
+    """Bulk counterpart to :py:func:`convert_amount`. Convert each quantity in
+    `quantities`, measured in the `Unit` whose primary key is at the same
+    position in `unit_ids`, to `to_unit`, and return ``(amounts, valid)``: two
+    lists as long as `quantities`. Where ``valid[i]`` is False, no conversion
+    exists and ``amounts[i]`` is 0.0; no `NoEquivalence` is raised.
+
+    Any sequences (lists, tuples, NumPy arrays) may be passed.
+    """
+    return _scale_amounts(quantities, unit_ids, None,
+                          conversions().scales(to_unit), {}, False)
+
+
+def amounts_to_grams(quantities, unit_ids, densities=None):
+    """Bulk counterpart to :py:func:`to_grams`. Return ``(grams, valid)`` for
+    the given parallel sequences of quantities and `Unit` primary keys, as in
+    :py:func:`convert_amounts`. Volumes are converted using the food density
+    (g/ml) at the same position in `densities`; if `densities` is not given, or
+    a density is None, assume 1.0 g/ml.
+    """
+    table = conversions()
+    return _scale_amounts(quantities, unit_ids, densities,
+                          table.scales('gram', kind='weight'),
+                          table.scales('milliliter', kind='volume'),
+                          False)
+
+
+def amounts_to_ml(quantities, unit_ids, densities=None):
+    """Bulk counterpart to :py:func:`to_ml`. Return ``(milliliters, valid)``
+    for the given parallel sequences of quantities and `Unit` primary keys, as
+    in :py:func:`convert_amounts`. Weights are converted using the food density
+    (g/ml) at the same position in `densities`; if `densities` is not given, or
+    a density is None, assume 1.0 g/ml.
+    """
+    table = conversions()
+    return _scale_amounts(quantities, unit_ids, densities,
+                          table.scales('milliliter', kind='volume'),
+                          table.scales('gram', kind='weight'),
+                          True)
+
+
 def add_amount(quantity, unit, to_quantity, to_unit):
     """Add two amounts together (possibly using different units),
     and return the resulting quantity in terms of the first unit.
@@ -98,18 +311,49 @@ def subtract_amount(quantity, unit, to_quantity, to_unit):
     return quantity - convert_amount(to_quantity, to_unit, unit)
 
 
-def group_by_category(queryset):
-    """Group objects in `queryset` by category name, and return a list of
-    ``(category_name, [matching_objects])`` for each category.
+def group_by_category(objects):
+    """Group `objects` by category name, and return a list of
+    ``(category_name, [matching_objects])`` for each category, in the order
+    each category first appears in `objects`. Objects with no category are
+    grouped under a `category_name` of None.
 
-    Objects in `queryset` must have a `category` attribute, where `category`
-    itself has a `name` attribute.
+    Objects in `objects` must have a `category` attribute, where `category`
+    itself has a `name` attribute. `objects` is only evaluated once; if it is
+    a queryset, categories are fetched along with it.
     """
-    categories = set(obj.category for obj in queryset)
+    if hasattr(objects, 'select_related'):
+        objects = objects.select_related('category')
     groups = []
-    for category in categories:
-        if category:
-            category = category.name
-        groups.append((category, queryset.filter(category__name=category)))
+    by_name = {}
+    for obj in objects:
+        category = obj.category.name if obj.category else None
+        if category not in by_name:
+            by_name[category] = []
+            groups.append((category, by_name[category]))
+        by_name[category].append(obj)
     return groups
 
+
+def prefetch_one_to_one(objects, related_name):
+    """Load the related object on the reverse side of a one-to-one relation
+    (such as ``recipe.nutrition_info``) for every instance in `objects` with a
+    single query, so that accessing `related_name` on each instance does not
+    need a query of its own. Return `objects` as a list.
+
+    This is needed because ``select_related`` cannot follow reverse one-to-one
+    relations to models that use inheritance (as all the `NutritionInfo`
+    models do).
+    """
+    objects = list(objects)
+    if not objects:
+        return objects
+    descriptor = getattr(type(objects[0]), related_name)
+    field = descriptor.related.field
+    related = descriptor.related.model.objects.filter(
+        **{'%s__in' % field.name: [obj.pk for obj in objects]})
+    by_pk = dict((getattr(rel_obj, field.attname), rel_obj) for rel_obj in related)
+    for obj in objects:
+        if obj.pk in by_pk:
+            setattr(obj, descriptor.cache_name, by_pk[obj.pk])
+            setattr(by_pk[obj.pk], field.get_cache_name(), obj)
+    return objects
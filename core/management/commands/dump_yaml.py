@@ -0,0 +1,78 @@
+from optparse import make_option
+from django.core import serializers
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.commands.dumpdata import sort_dependencies
+from django.db.models import get_app, get_apps, get_model
+from django.utils.datastructures import SortedDict
+
+
+def chunked(queryset, size):
+    """Yield all objects in `queryset` by ascending primary key, reading
+    `size` at a time.
+    """
+    queryset = queryset.order_by('pk')
+    last = None
+    while True:
+        chunk = queryset if last is None else queryset.filter(pk__gt=last)
+        chunk = list(chunk[:size])
+        for obj in chunk:
+            yield obj
+        if len(chunk) < size:
+            return
+        last = chunk[-1].pk
+
+
+class Command (BaseCommand):
+    args = "[appname appname.ModelName ...]"
+    help = "Write the contents of the database (or of the given apps and " \
+           "models) as YAML, streaming it a model at a time in constant memory."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--output', '-o', default=None,
+            help="File to write to (default: standard output)."),
+        make_option('--compress', default=None,
+            help="Compress the output: 'gz' or 'xz'."),
+        make_option('--chunk-size', type='int', default=1000,
+            help="Number of objects read from the database at a time."),
+        make_option('--indent', type='int', default=None,
+            help="Indentation of nested values."),
+    )
+
+    def handle(self, *labels, **options):
+        app_list = SortedDict()
+        try:
+            for label in labels:
+                if '.' in label:
+                    app_label, model_name = label.split('.', 1)
+                    model = get_model(app_label, model_name)
+                    if model is None:
+                        raise CommandError("Unknown model: %s" % label)
+                    models = app_list.setdefault(get_app(app_label), [])
+                    if models is not None and model not in models:
+                        models.append(model)
+                else:
+                    app_list[get_app(label)] = None
+        except ImproperlyConfigured, e:
+            raise CommandError(str(e))
+        if not labels:
+            app_list = SortedDict((app, None) for app in get_apps())
+
+        models = [model for model in sort_dependencies(app_list.items())
+                  if not model._meta.proxy]
+        chunk_size = options['chunk_size']
+        objects = (obj for model in models
+                   for obj in chunked(model._default_manager.all(), chunk_size))
+
+        if options['output']:
+            output = open(options['output'], 'wb')
+        else:
+            output = self.stdout
+        try:
+            serializers.serialize('yaml', objects, stream=output, streaming=True,
+                                  compress=options['compress'], indent=options['indent'])
+        except serializers.base.SerializationError, e:
+            raise CommandError(str(e))
+        finally:
+            if options['output']:
+                output.close()
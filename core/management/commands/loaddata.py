@@ -0,0 +1,13 @@
+from django.core.management.commands import loaddata
+from core.models import CacheGeneration
+
+
+class Command (loaddata.Command):
+    def handle(self, *fixture_labels, **options):
+        """Load the fixtures, then bump the cache generations of the data
+        they changed, once each rather than once per object.
+        """
+        try:
+            return super(Command, self).handle(*fixture_labels, **options)
+        finally:
+            CacheGeneration.bump_loaded()
@@ -0,0 +1,36 @@
+"""
+Work deferred to the end of each request.
+
+Apps that collect changes while a request runs, so they can act on them once
+(like queueing recalculations), register a function with
+:py:func:`after_request`; :py:class:`AfterRequestMiddleware` calls each one
+as the response leaves the view, while the database connection is still open.
+Outside of a request, call :py:func:`run_after_request`.
+"""
+
+# Functions called at the end of every request, in registration order
+_functions = []
+
+
+def after_request(function):
+    """Register `function` to be called with no arguments at the end of every
+    request. Returns `function`, so this can be used as a decorator.
+    """
+    _functions.append(function)
+    return function
+
+
+def run_after_request():
+    """Call the functions registered with :py:func:`after_request`.
+    """
+    for function in _functions:
+        function()
+
+
+class AfterRequestMiddleware (object):
+    """Calls the functions registered with :py:func:`after_request` at the
+    end of each request.
+    """
+    def process_response(self, request, response):
+        run_after_request()
+        return response
@@ -1,5 +1,5 @@
-from django.db import models
-from core import utils, helpers
+from django.db import models, transaction, IntegrityError
+from core import utils, helpers, conversion_table, nutrition_index
 from nutrition.models import NutritionInfo
 # For list_filter_range
 from core import filters
@@ -23,6 +23,64 @@ class ModelWrapper (models.Model):
         return obj
 
 
+class CacheGeneration (ModelWrapper):
+    """A counter identifying the current version of some set of data. It is
+    bumped whenever that data changes, so caches built from the data (possibly
+    in other processes) know when to rebuild.
+    """
+    name  = models.CharField(max_length=50, unique=True)
+    value = models.IntegerField(default=0)
+
+    def __unicode__(self):
+        return u"%s: %d" % (self.name, self.value)
+
+    @classmethod
+    def current(cls, name):
+        """Return the current generation number for `name`.
+        """
+        values = list(cls.objects.filter(name=name).values_list('value', flat=True))
+        return values[0] if values else 0
+
+    @classmethod
+    def bump(cls, name):
+        """Increment the generation number for `name`.
+        """
+        if cls.objects.filter(name=name).update(value=models.F('value') + 1):
+            return
+        sid = transaction.savepoint()
+        try:
+            cls.objects.create(name=name, value=1)
+        except IntegrityError:
+            # Another process created it first
+            transaction.savepoint_rollback(sid)
+            cls.objects.filter(name=name).update(value=models.F('value') + 1)
+        else:
+            transaction.savepoint_commit(sid)
+
+
+    @classmethod
+    def bump_after_load(cls, name):
+        """Increment the generation number for `name` once the fixtures being
+        loaded are all in (see :py:meth:`bump_loaded`), rather than for every
+        object saved.
+        """
+        _loaded_generations.add(name)
+
+
+    @classmethod
+    def bump_loaded(cls):
+        """Increment, once each, the generation numbers changed by the
+        fixtures loaded since the last call.
+        """
+        for name in sorted(_loaded_generations):
+            cls.bump(name)
+        _loaded_generations.clear()
+
+
+# Generations to bump once fixtures are loaded (see `CacheGeneration.bump_loaded`)
+_loaded_generations = set()
+
+
 class FoodGroup (ModelWrapper):
     """A classification for something.
     """
@@ -85,31 +143,35 @@ class FoodNutritionInfo (NutritionInfo):
     quantity = models.FloatField(default=1)
     unit     = models.ForeignKey(Unit, null=True, blank=True)
 
-    def for_amount(self, to_quantity, to_unit):
-        """Return a `FoodNutritionInfo` for the given quantity and unit.
+    def scale_for_amount(self, to_quantity, to_unit):
+        """Return the factor by which to multiply this `FoodNutritionInfo` to
+        get the nutrition for the given quantity and unit.
         """
         # If units are the same, scale by quantity alone
         if self.unit == to_unit:
-            factor = float(to_quantity) / self.quantity
-        else:
-            # Scaling factor for a 1-gram serving size
-            gram_serving = 1.0 / (helpers.to_grams(self.unit, self.food) * self.quantity)
-            # Target quantity in grams
-            target_grams = helpers.to_grams(to_unit, self.food) * to_quantity
-            # Overall scaling factor to apply to all nutritional info
-            factor = gram_serving * target_grams
+            return float(to_quantity) / self.quantity
+        # Scaling factor for a 1-gram serving size
+        gram_serving = 1.0 / (helpers.to_grams(self.unit, self.food) * self.quantity)
+        # Target quantity in grams
+        target_grams = helpers.to_grams(to_unit, self.food) * to_quantity
+        # Overall scaling factor to apply to all nutritional info
+        return gram_serving * target_grams
+
+
+    def vector_for_amount(self, to_quantity, to_unit):
+        """Return a `NutritionVector` for the given quantity and unit.
+        """
+        return self.vector() * self.scale_for_amount(to_quantity, to_unit)
 
+
+    def for_amount(self, to_quantity, to_unit):
+        """Return a `FoodNutritionInfo` for the given quantity and unit.
+        """
         return FoodNutritionInfo(
-            food         = self.food,
-            quantity     = to_quantity,
-            unit         = to_unit,
-            calories     = factor * self.calories,
-            fat_calories = factor * self.fat_calories,
-            fat          = factor * self.fat,
-            carb         = factor * self.carb,
-            sodium       = factor * self.sodium,
-            protein      = factor * self.protein,
-            cholesterol  = factor * self.cholesterol
+            food     = self.food,
+            quantity = to_quantity,
+            unit     = to_unit,
+            **self.vector_for_amount(to_quantity, to_unit).fields()
         )
 
 
@@ -118,15 +180,10 @@ class FoodNutritionInfo (NutritionInfo):
         """
         # FIXME: Catch possibility of self.quantity == 0
         scale = 1.0 / self.quantity
-        self.quantity     = 1.0
-        self.calories     = round(scale * self.calories, 2)
-        self.fat_calories = round(scale * self.fat_calories, 2)
-        self.fat          = round(scale * self.fat, 2)
-        self.carb         = round(scale * self.carb, 2)
-        self.sodium       = round(scale * self.sodium, 2)
-        self.protein      = round(scale * self.protein, 2)
-        self.cholesterol  = round(scale * self.cholesterol, 2)
-        self.save()
+        self.quantity = 1.0
+        vector = self.vector() * scale
+        vector.values = [round(value, 2) for value in vector.values]
+        self.set_equal(vector)
 
 
     def is_equal(self, other):
@@ -166,3 +223,65 @@ class Preparation (ModelWrapper):
     class Meta:
         ordering = ['name']
 
+
+
+# Signals
+
+from django.dispatch import receiver
+
+def _generation_changed(name, raw):
+    """Bump the generation `name`, or if fixtures are being loaded (`raw`),
+    bump it once they are.
+    """
+    if raw:
+        CacheGeneration.bump_after_load(name)
+    else:
+        CacheGeneration.bump(name)
+
+
+@receiver(models.signals.post_save, sender=Unit)
+@receiver(models.signals.post_delete, sender=Unit)
+@receiver(models.signals.post_save, sender=Equivalence)
+@receiver(models.signals.post_delete, sender=Equivalence)
+def units_changed(sender, **kwargs):
+    """After a `Unit` or `Equivalence` is saved or deleted, discard the cached
+    unit conversion factors, and tell other processes to do the same.
+    """
+    helpers.unit_graph.invalidate()
+    conversion_table.shared_table.invalidate()
+    nutrition_index.food_indexes.invalidate()
+    _generation_changed(conversion_table.GENERATION, kwargs.get('raw'))
+
+
+@receiver(models.signals.pre_save, sender=Food)
+def food_saving(sender, instance, **kwargs):
+    """Before a `Food` is saved, note whether its density is changing.
+    """
+    instance._density_changed = True
+    if instance.pk and not kwargs.get('raw'):
+        old = list(Food.objects.filter(pk=instance.pk).values_list('grams_per_ml', flat=True))
+        instance._density_changed = not old or old[0] != instance.grams_per_ml
+
+
+@receiver(models.signals.post_save, sender=Food)
+@receiver(models.signals.post_delete, sender=Food)
+def food_changed(sender, instance, **kwargs):
+    """After a `Food` is added or deleted, or its density changes, discard
+    its cached nutrition index, and tell other processes that conversions
+    through food densities are out of date.
+    """
+    saved = kwargs['signal'] is models.signals.post_save
+    if saved and not getattr(instance, '_density_changed', True):
+        return
+    nutrition_index.food_indexes.invalidate([instance.pk])
+    _generation_changed(conversion_table.GENERATION, kwargs.get('raw'))
+
+
+@receiver(models.signals.post_save, sender=FoodNutritionInfo)
+@receiver(models.signals.post_delete, sender=FoodNutritionInfo)
+def food_nutrition_changed(sender, instance, **kwargs):
+    """After a `FoodNutritionInfo` is saved or deleted, discard the cached
+    nutrition index for its food, and tell other processes to do the same.
+    """
+    nutrition_index.food_indexes.invalidate([instance.food_id])
+    _generation_changed(nutrition_index.GENERATION, kwargs.get('raw'))
@@ -0,0 +1,178 @@
+"""
+Precomputed lookup of which `FoodNutritionInfo` to use for each unit of a food.
+
+A food may have nutrition information for several reference servings (say,
+per cup and per ounce). To find the nutrition for an amount of the food, a
+reference in the same unit is used if there is one; otherwise the first
+reference that can be converted through grams. A
+:py:class:`FoodNutritionIndex` works this out ahead of time for every unit,
+together with the combined scaling factor, so that finding the nutrition of
+an ingredient is one dict lookup and one multiplication.
+
+Indexes are cached per process in `food_indexes`. They are dropped when the
+food or its nutrition changes in this process, and checked against the
+``'conversions'`` and ``'food_nutrition'`` :py:class:`CacheGeneration`\s (at
+most once per request or bulk recalculation) to catch changes made by other
+processes.
+"""
+
+from django.core.signals import request_started
+from django.dispatch import receiver
+from core.helpers import conversions
+from nutrition.nutrients import COLUMNS
+from nutrition.vector import NutritionVector
+
+# Name of the CacheGeneration bumped when any FoodNutritionInfo changes
+GENERATION = 'food_nutrition'
+
+# Number of foods loaded per query
+BATCH_SIZE = 500
+
+
+class FoodNutritionIndex (object):
+    """For one food, maps each unit id (or None, for no unit) to the reference
+    nutrition to scale, and the factor by which to scale it per unit.
+    """
+    def __init__(self, references, density, weights, volumes):
+        """Build the index from `references`, a list of ``(unit_id, quantity,
+        NutritionVector)`` for the food's `FoodNutritionInfo`\s in order, the
+        food's `density` (g/ml), and `weights` and `volumes`, which map unit
+        ids to grams and milliliters as returned by `UnitGraph.scales`.
+        """
+        self._units = {}
+
+        # Every weight or volume scales from the first reference that can
+        # itself be converted to grams
+        for ref_unit, ref_quantity, vector in references:
+            if ref_unit in weights:
+                ref_grams = weights[ref_unit]
+            elif ref_unit in volumes:
+                ref_grams = volumes[ref_unit] * density
+            else:
+                continue
+            if ref_grams and ref_quantity:
+                per_gram = 1.0 / (ref_grams * ref_quantity)
+                for unit_id, grams in weights.iteritems():
+                    self._units[unit_id] = (vector, grams * per_gram)
+                for unit_id, ml in volumes.iteritems():
+                    self._units[unit_id] = (vector, ml * density * per_gram)
+                break
+
+        # A reference in the same unit takes precedence; the first one wins
+        for ref_unit, ref_quantity, vector in reversed(references):
+            if ref_quantity:
+                self._units[ref_unit] = (vector, 1.0 / ref_quantity)
+
+
+    def vector(self, quantity, unit_id):
+        """Return a `NutritionVector` for `quantity` of the food in the unit
+        with the given id, or None if no reference nutrition can be used.
+        """
+        try:
+            vector, factor = self._units[unit_id]
+        except KeyError:
+            return None
+        return vector * (quantity * factor)
+
+
+def build_indexes(food_ids):
+    """Return a dict of ``{food_id: FoodNutritionIndex}`` for the foods with
+    the given ids, loaded in two queries per batch of foods.
+    """
+    from core.models import Food, FoodNutritionInfo
+
+    table = conversions()
+    weights = table.scales('gram', kind='weight')
+    volumes = table.scales('milliliter', kind='volume')
+
+    food_ids = list(food_ids)
+    indexes = {}
+    for start in range(0, len(food_ids), BATCH_SIZE):
+        batch = food_ids[start:start + BATCH_SIZE]
+        densities = dict(
+            Food.objects.filter(pk__in=batch).values_list('id', 'grams_per_ml'))
+
+        references = {}
+        fields = ('food', 'unit', 'quantity') + COLUMNS + ('packed_nutrients',)
+        nutritions = FoodNutritionInfo.objects.filter(food__in=batch).order_by('pk')
+        for row in nutritions.values_list(*fields):
+            references.setdefault(row[0], []).append(
+                (row[1], row[2], NutritionVector.from_columns(row[3:-1], row[-1])))
+
+        for food_id, density in densities.iteritems():
+            indexes[food_id] = FoodNutritionIndex(
+                references.get(food_id, []), density, weights, volumes)
+    return indexes
+
+
+class FoodNutritionIndexCache (object):
+    """Per-process cache of `FoodNutritionIndex`\s, by food id.
+    """
+    def __init__(self):
+        self._indexes = {}
+        self._generation = None
+        self._checked = False
+
+
+    def expire(self):
+        """Check the cache against other processes' changes on next use.
+        """
+        self._checked = False
+
+
+    def invalidate(self, food_ids=None):
+        """Drop the indexes for the given foods, or for all foods.
+        """
+        if food_ids is None:
+            self._indexes.clear()
+        else:
+            for food_id in food_ids:
+                self._indexes.pop(food_id, None)
+
+
+    def _validate(self):
+        """Drop all indexes if conversions or food nutrition have changed in
+        another process since they were built.
+        """
+        if self._checked:
+            return
+        from core.models import CacheGeneration
+        from core.conversion_table import GENERATION as CONVERSIONS
+        generation = sorted(CacheGeneration.objects.filter(
+            name__in=[CONVERSIONS, GENERATION]).values_list('name', 'value'))
+        if generation != self._generation:
+            self._indexes.clear()
+            self._generation = generation
+        self._checked = True
+
+
+    def get_many(self, food_ids):
+        """Return a dict of ``{food_id: FoodNutritionIndex}``, building those
+        not already cached. Foods that do not exist are left out.
+        """
+        self._validate()
+        food_ids = set(food_ids)
+        missing = food_ids.difference(self._indexes)
+        if missing:
+            self._indexes.update(build_indexes(missing))
+        return dict(
+            (food_id, self._indexes[food_id])
+            for food_id in food_ids if food_id in self._indexes
+        )
+
+
+    def get(self, food_id):
+        """Return the `FoodNutritionIndex` for the food with the given id.
+        """
+        return self.get_many([food_id])[food_id]
+
+
+# Process-wide cache, invalidated by signals in `core.models`
+food_indexes = FoodNutritionIndexCache()
+
+
+@receiver(request_started)
+def expire_food_indexes(sender, **kwargs):
+    """Check cached indexes against other processes' changes once per request.
+    """
+    food_indexes.expire()
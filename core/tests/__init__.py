@@ -2,6 +2,7 @@
 from conversion import *
 from amount import *
 from nutrition import *
+from nutrition_index import *
 from formatting import *
 from serialization import *
 from filterspecs import *
@@ -1,6 +1,12 @@
+import os
+import shutil
+import tempfile
 from django.test import TestCase
-from core.models import Food, Unit, Equivalence
-from core.helpers import convert_unit, convert_amount, to_grams, to_ml, NoEquivalence
+from django.core import management
+from core.models import Food, Unit, Equivalence, CacheGeneration
+from core.conversion_table import SharedConversionTable, GENERATION
+from core.helpers import convert_unit, convert_amount, to_grams, to_ml, NoEquivalence, \
+        convert_amounts, amounts_to_grams, amounts_to_ml, unit_graph
 
 class ConversionTest (TestCase):
     fixtures = [
@@ -28,6 +34,33 @@ class ConvertUnitTest (ConversionTest):
         self.failUnlessEqual(convert_unit('teaspoon', 'tablespoon'), 1.0 / 3.0)
 
 
+    def test_convert_unit_transitive_equivalence(self):
+        """Convert from one unit to another through an intermediate unit.
+        """
+        # dash --> milliliter and teaspoon --> milliliter are defined in
+        # fixture, but there is no mapping between dash and teaspoon
+        ml_per_dash = Equivalence.objects.get(
+            unit__name='dash', to_unit__name='milliliter').to_quantity
+        ml_per_tsp = Equivalence.objects.get(
+            unit__name='teaspoon', to_unit__name='milliliter').to_quantity
+        self.assertAlmostEqual(convert_unit('dash', 'teaspoon'), ml_per_dash / ml_per_tsp)
+        self.assertAlmostEqual(convert_unit('teaspoon', 'dash'), ml_per_tsp / ml_per_dash)
+
+
+    def test_convert_unit_after_equivalence_changes(self):
+        """Conversion reflects Equivalences added or deleted after first use.
+        """
+        self.assertRaises(NoEquivalence, convert_unit, 'milligram', 'gram')
+        milligram = Unit.objects.get(name='milligram')
+        gram = Unit.objects.get(name='gram')
+        equivalence = Equivalence.objects.create(
+            unit=milligram, to_quantity=0.001, to_unit=gram)
+        self.failUnlessEqual(convert_unit('milligram', 'gram'), 0.001)
+        self.assertAlmostEqual(convert_unit('milligram', 'kilogram'), 0.000001)
+        equivalence.delete()
+        self.assertRaises(NoEquivalence, convert_unit, 'milligram', 'gram')
+
+
     def test_convert_unit_without_equivalence(self):
         """NoEquivalence exception when converting units.
         """
@@ -149,3 +182,136 @@ class ConvertAmountTest (ConversionTest):
 
 
 
+
+
+class BulkConversionTest (ConversionTest):
+    """Test conversion of many amounts at once.
+    """
+    def setUp(self):
+        self.units = dict(
+            (unit.name, unit.id) for unit in Unit.objects.all())
+        self.honey = Food.objects.get(name='honey')
+
+
+    def test_convert_amounts(self):
+        """Convert many amounts to a single unit.
+        """
+        unit_ids = [self.units['pound'], self.units['ounce'], self.units['quart']]
+        amounts, valid = convert_amounts([2, 4, 1], unit_ids, 'ounce')
+        self.assertEqual(valid, [True, True, False])
+        self.assertEqual(amounts, [32, 4, 0.0])
+
+
+    def test_amounts_to_grams(self):
+        """Convert many amounts of weight and volume to grams.
+        """
+        gram, cup, slice = self.units['gram'], self.units['cup'], self.units['slice']
+        ml_per_cup = convert_unit('cup', 'milliliter')
+        densities = [self.honey.grams_per_ml, self.honey.grams_per_ml, None, None]
+        amounts, valid = amounts_to_grams([5, 2, 2, 3], [gram, cup, cup, slice], densities)
+        self.assertEqual(valid, [True, True, True, False])
+        self.assertEqual(amounts[0], 5)
+        self.assertAlmostEqual(amounts[1], 2 * ml_per_cup * self.honey.grams_per_ml)
+        self.assertAlmostEqual(amounts[2], 2 * ml_per_cup)
+        # Same as converting one at a time
+        cup_unit = Unit.objects.get(name='cup')
+        self.assertAlmostEqual(amounts[1], 2 * to_grams(cup_unit, self.honey))
+
+
+    def test_amounts_to_ml(self):
+        """Convert many amounts of weight and volume to milliliters.
+        """
+        ounce, ml = self.units['ounce'], self.units['milliliter']
+        amounts, valid = amounts_to_ml(
+            [1, 10, 1], [ounce, ml, None], [self.honey.grams_per_ml, None, None])
+        self.assertEqual(valid, [True, True, False])
+        ounce_unit = Unit.objects.get(name='ounce')
+        self.assertAlmostEqual(amounts[0], to_ml(ounce_unit, self.honey))
+        self.assertEqual(amounts[1], 10)
+        self.assertEqual(amounts[2], 0.0)
+
+
+class SharedConversionTableTest (ConversionTest):
+    """Test the conversion table shared between processes.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'conversions.bin')
+        self.shared = SharedConversionTable(self.path)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def test_shared_table_matches_unit_graph(self):
+        """Shared table gives the same factors as the in-process graph.
+        """
+        table = self.shared.current()
+        self.assertTrue(os.path.exists(self.path))
+        for unit, to_unit in [('pound', 'ounce'), ('teaspoon', 'tablespoon'),
+                              ('dash', 'teaspoon'), ('cup', 'cup')]:
+            self.assertEqual(table.factor(unit, to_unit), convert_unit(unit, to_unit))
+        self.assertRaises(NoEquivalence, table.factor, 'pound', 'quart')
+        self.assertEqual(table.scales('ounce', kind='weight'),
+                         unit_graph.scales('ounce', kind='weight'))
+
+
+    def test_shared_table_remapped_after_changes(self):
+        """Shared table is rebuilt when its generation is out of date.
+        """
+        table = self.shared.current()
+        self.assertRaises(NoEquivalence, table.factor, 'milligram', 'gram')
+
+        milligram = Unit.objects.get(name='milligram')
+        gram = Unit.objects.get(name='gram')
+        Equivalence.objects.create(unit=milligram, to_quantity=0.001, to_unit=gram)
+        honey = Food.objects.get(name='honey')
+        honey.grams_per_ml = 1.5
+        honey.save()
+
+        # Same table until the next request
+        self.assertTrue(self.shared.current() is table)
+        self.shared.expire()
+        table = self.shared.current()
+        self.assertEqual(table.generation, CacheGeneration.current(GENERATION))
+        self.assertEqual(table.factor('milligram', 'gram'), 0.001)
+
+        # Another process with the same file maps it without rebuilding
+        other = SharedConversionTable(self.path)
+        self.assertEqual(other.current().generation, table.generation)
+
+
+class CacheGenerationTest (ConversionTest):
+    """Test when conversion changes bump the cache generation.
+    """
+    def test_bump(self):
+        """Bumping takes one query once the generation exists.
+        """
+        with self.assertNumQueries(2):
+            CacheGeneration.bump('test')
+        with self.assertNumQueries(1):
+            CacheGeneration.bump('test')
+        self.assertEqual(CacheGeneration.current('test'), 2)
+
+
+    def test_food_changes(self):
+        """Only a change of density bumps the generation.
+        """
+        honey = Food.objects.get(name='honey')
+        generation = CacheGeneration.current(GENERATION)
+        honey.name = 'clover honey'
+        honey.save()
+        self.assertEqual(CacheGeneration.current(GENERATION), generation)
+        honey.grams_per_ml = 1.5
+        honey.save()
+        self.assertEqual(CacheGeneration.current(GENERATION), generation + 1)
+
+
+    def test_fixtures_bump_once(self):
+        """Loading fixtures bumps the generation once, not once per object.
+        """
+        generation = CacheGeneration.current(GENERATION)
+        management.call_command('loaddata', 'test_unit', 'test_equivalence',
+                                verbosity=0, commit=False)
+        self.assertEqual(CacheGeneration.current(GENERATION), generation + 1)
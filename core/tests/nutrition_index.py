@@ -0,0 +1,65 @@
+from django.test import TestCase
+from core.models import Food, Unit, FoodNutritionInfo
+from core.nutrition_index import food_indexes
+
+class FoodNutritionIndexTest (TestCase):
+    """Test lookup of nutrition through a FoodNutritionIndex.
+    """
+    fixtures = ['test_unit', 'test_food', 'test_equivalence']
+
+    def setUp(self):
+        food_indexes.invalidate()
+        self.butter = Food.objects.get(name='butter')
+        self.gram = Unit.objects.get(name='gram')
+        self.ounce = Unit.objects.get(name='ounce')
+        self.cup = Unit.objects.get(name='cup')
+        self.slab = Unit.objects.get(name='slab')
+
+
+    def add_nutrition(self, quantity, unit, calories):
+        return FoodNutritionInfo.objects.create(
+            food=self.butter, quantity=quantity, unit=unit, calories=calories)
+
+
+    def test_same_unit_preferred(self):
+        """A reference in the same unit is used over one that converts.
+        """
+        self.add_nutrition(100, self.gram, 700)
+        self.add_nutrition(1, self.slab, 50)
+        self.add_nutrition(2, self.ounce, 410)
+        index = food_indexes.get(self.butter.id)
+
+        self.assertAlmostEqual(index.vector(3, self.slab.id).calories, 150)
+        self.assertAlmostEqual(index.vector(1, self.ounce.id).calories, 205)
+        # Other weights convert from the first weight reference
+        self.assertAlmostEqual(index.vector(1000, self.gram.id).calories, 7000)
+
+
+    def test_conversion_through_density(self):
+        """Volumes scale from a weight reference using the food's density.
+        """
+        reference = self.add_nutrition(1, self.ounce, 200)
+        index = food_indexes.get(self.butter.id)
+        expected = reference.vector_for_amount(2, self.cup)
+        self.assertAlmostEqual(index.vector(2, self.cup.id).calories, expected.calories)
+
+
+    def test_no_usable_reference(self):
+        """None is returned when no reference can be scaled.
+        """
+        self.add_nutrition(1, self.slab, 50)
+        index = food_indexes.get(self.butter.id)
+        self.assertEqual(index.vector(1, self.cup.id), None)
+        self.assertEqual(index.vector(1, None), None)
+
+
+    def test_invalidated_on_change(self):
+        """Saving food nutrition rebuilds that food's index.
+        """
+        reference = self.add_nutrition(1, self.slab, 50)
+        self.assertAlmostEqual(
+            food_indexes.get(self.butter.id).vector(1, self.slab.id).calories, 50)
+        reference.calories = 60
+        reference.save()
+        self.assertAlmostEqual(
+            food_indexes.get(self.butter.id).vector(1, self.slab.id).calories, 60)
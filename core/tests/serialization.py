@@ -1,5 +1,7 @@
+import gzip
+from StringIO import StringIO
 from django.test import TestCase
-from django.core import serializers
+from django.core import serializers, management
 from core.models import Food, Unit, Equivalence
 
 
@@ -50,10 +52,75 @@ class YamlSerializerTest (TestCase):
         # Ensure the correct number of objects were deserialized
         self.assertEqual(len(foods), len(self.model_fields))
 
+        # Objects come back in the order they appear in the text
+        model_fields = sorted(self.model_fields,
+                              key=lambda (model, fields): model._meta.module_name)
+
         # Ensure the objects' data is correct
         for index, food in enumerate(foods):
-            model, fields = self.model_fields[index]
+            model, fields = model_fields[index]
             for field, value in fields.iteritems():
                 actual = food.object.__getattribute__(field)
                 self.assertEqual(actual, value)
 
+
+
+    def test_deserialize_streaming(self):
+        """Objects are deserialized as they are read, not after the whole
+        stream has been read.
+        """
+        lines = ['core.food:']
+        for pk in range(1, 5001):
+            lines.append('  %d: {food_group: null, grams_per_ml: 1.0, name: food %d}' % (pk, pk))
+        stream = StringIO('\n'.join(lines) + '\n')
+        objects = serializers.deserialize('yaml', stream)
+        first = objects.next()
+        self.assertEqual((first.object.pk, first.object.name), (1, 'food 1'))
+        self.assertTrue(stream.tell() < len(stream.getvalue()) / 2)
+        self.assertEqual(len(list(objects)), 4999)
+
+
+    def test_deserialize_empty(self):
+        """Empty documents and models hold no objects.
+        """
+        self.assertEqual(list(serializers.deserialize('yaml', '')), [])
+        self.assertEqual(list(serializers.deserialize('yaml', 'core.food:\n')), [])
+
+
+    def save_objects(self):
+        for model, fields in self.model_fields:
+            model(**fields).save()
+
+
+    def test_serialize_streaming(self):
+        """Streamed output matches the sorted output when objects come
+        grouped by model, and may be compressed.
+        """
+        self.save_objects()
+        objects = list(Equivalence.objects.all()) + list(Food.objects.order_by('pk')) + \
+                list(Unit.objects.order_by('pk'))
+        self.assertEqual(serializers.serialize('yaml', objects, streaming=True),
+                         self.yaml_text)
+
+        compressed = serializers.serialize('yaml', objects, streaming=True, compress='gz')
+        text = gzip.GzipFile(fileobj=StringIO(compressed)).read()
+        self.assertEqual(text, self.yaml_text)
+
+        # A model's objects must not be split up
+        objects = list(Food.objects.all()) + list(Unit.objects.all()) + \
+                list(Food.objects.all())
+        self.assertRaises(serializers.base.SerializationError,
+                          serializers.serialize, 'yaml', objects, streaming=True)
+
+
+    def test_dump_yaml_command(self):
+        """The whole database, or some models, may be dumped and loaded back.
+        """
+        self.save_objects()
+        output = StringIO()
+        management.call_command('dump_yaml', 'core.food', 'core.unit',
+                                chunk_size=1, stdout=output)
+        self.assertEqual(output.getvalue(), '\n'.join(self.yaml_text.split('\n')[2:]))
+        Food.objects.all().delete()
+        objects = list(serializers.deserialize('yaml', output.getvalue()))
+        self.assertEqual(len(objects), 4)
@@ -1,5 +1,12 @@
 from django.contrib import admin
 from diet.models import Meal, DietPlan, TargetServing, DietPlanNutritionInfo
+from nutrition.forms import NutritionInfoForm, PACKED_FIELDS
+
+# Custom forms
+
+class DietPlanNutritionInfoForm (NutritionInfoForm):
+    class Meta:
+        model = DietPlanNutritionInfo
 
 # Inline forms
 
@@ -7,9 +14,22 @@ class TargetServingInline (admin.TabularInline):
     model = TargetServing
     extra = 5
 
-class DietPlanNutritionInfoInline (admin.TabularInline):
+class DietPlanNutritionInfoInline (admin.StackedInline):
     model = DietPlanNutritionInfo
+    form = DietPlanNutritionInfoForm
     can_delete = False
+    fieldsets = (
+        (None, {
+            'fields': (
+                ('calories', 'fat_calories'),
+                ('fat', 'carb', 'sodium', 'protein', 'cholesterol'),
+            )
+        }),
+        ('Other nutrients', {
+            'classes': ('collapse',),
+            'fields': PACKED_FIELDS,
+        }),
+    )
 
 # Main forms
 
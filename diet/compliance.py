@@ -0,0 +1,161 @@
+"""
+Comparing what was eaten over a range of days with a `DietPlan`'s targets.
+
+:py:func:`compliance` returns, for every day in the range, the amount eaten of
+each nutrient the plan has a target for (`DietPlanNutritionInfo`) and of each
+food group it has a `TargetServing` for, in the serving's unit. The whole range
+is computed at once, as one array of daily values per nutrient and per food
+group:
+
+- Nutrients are read from the daily `NutritionRollup`\s (see
+  :py:mod:`diet.rollups`) with one query, rather than from every meal.
+- Food-group servings are worked out once per recipe eaten, from its
+  ingredients (one query for all of them, converted with the bulk unit
+  helpers), then added into the arrays for each meal's day.
+
+A food counts towards the target for its own food group and for every group
+above it, so a target for vegetables includes leafy greens.
+"""
+
+from array import array
+from core.helpers import amounts_to_grams, amounts_to_ml
+from core.models import FoodGroup
+from cookbook.models import Ingredient
+from nutrition.nutrients import NUTRIENTS, COLUMNS
+from nutrition.vector import NutritionVector
+from diet.models import Meal, NutritionRollup, DietPlanNutritionInfo, TargetServing
+
+
+class Compliance (object):
+    """Daily intake compared with a plan's targets, from `start` to `end`.
+
+    `nutrients` is a list of ``(Nutrient, target, actual)``, and `servings` a
+    list of ``(TargetServing, actual)``, where each `actual` is an array of
+    the amount eaten on each of `days`.
+    """
+    def __init__(self, start, end, days, nutrients, servings):
+        self.start = start
+        self.end = end
+        self.days = days
+        self.nutrients = nutrients
+        self.servings = servings
+
+
+def _days(start, end):
+    """Return the list of dates from `start` to `end`, inclusive.
+    """
+    return [start.fromordinal(ordinal)
+            for ordinal in range(start.toordinal(), end.toordinal() + 1)]
+
+
+def daily_nutrition(start, end):
+    """Return a list of arrays, one per nutrient in `NUTRIENTS` order, with
+    the nutrition eaten on each day from `start` to `end`.
+    """
+    count = end.toordinal() - start.toordinal() + 1
+    series = [array('d', [0.0]) * count for nutrient in NUTRIENTS]
+    rows = NutritionRollup.objects.filter(period='day', start__gte=start, start__lte=end) \
+            .values_list('start', 'packed_nutrients', *COLUMNS)
+    for row in rows:
+        index = row[0].toordinal() - start.toordinal()
+        for values, value in zip(series, NutritionVector.from_columns(row[2:], row[1]).values):
+            values[index] += value
+    return series
+
+
+def _ancestors(food_group_ids):
+    """Return a dict of ``{food_group_id: [food_group_id, ...]}`` listing each
+    group and every group above it.
+    """
+    parents = dict(FoodGroup.objects.values_list('id', 'parent'))
+    ancestors = {}
+    for food_group_id in food_group_ids:
+        chain = []
+        group = food_group_id
+        while group is not None and group not in chain:
+            chain.append(group)
+            group = parents.get(group)
+        ancestors[food_group_id] = chain
+    return ancestors
+
+
+def recipe_servings(recipe_ids, targets):
+    """Return a dict of ``{recipe_id: {target_id: amount}}`` with the amount of
+    each `TargetServing`'s food group in one portion of each recipe, in the
+    target's unit. Ingredients that cannot be converted to it are left out.
+    """
+    rows = list(Ingredient.objects.filter(recipe__in=list(recipe_ids)).values_list(
+        'recipe', 'quantity', 'unit', 'food__food_group', 'food__grams_per_ml',
+        'recipe__num_portions'))
+    ancestors = _ancestors(set(row[3] for row in rows))
+    quantities = [row[1] for row in rows]
+    units = [row[2] for row in rows]
+    densities = [row[4] for row in rows]
+    grams, grams_valid = amounts_to_grams(quantities, units, densities)
+    ml, ml_valid = amounts_to_ml(quantities, units, densities)
+    grams_per_unit, weight_valid = amounts_to_grams(
+        [1.0] * len(targets), [target.unit_id for target in targets])
+    ml_per_unit, volume_valid = amounts_to_ml(
+        [1.0] * len(targets), [target.unit_id for target in targets])
+
+    servings = {}
+    for target, per_gram, by_weight, per_ml, by_volume in zip(
+            targets, grams_per_unit, weight_valid, ml_per_unit, volume_valid):
+        by_weight = by_weight and target.unit.kind == 'weight'
+        by_volume = by_volume and target.unit.kind == 'volume'
+        for i, (recipe_id, quantity, unit_id, food_group_id, density, portions) \
+                in enumerate(rows):
+            if target.food_group_id not in ancestors.get(food_group_id, ()):
+                continue
+            if unit_id == target.unit_id:
+                amount = quantity
+            elif by_weight and grams_valid[i]:
+                amount = grams[i] / per_gram
+            elif by_volume and ml_valid[i]:
+                amount = ml[i] / per_ml
+            else:
+                continue
+            recipe = servings.setdefault(recipe_id, {})
+            recipe[target.id] = recipe.get(target.id, 0.0) + amount / (portions or 1)
+    return servings
+
+
+def daily_servings(start, end, targets):
+    """Return a dict of ``{target_id: array}`` with the amount of each
+    `TargetServing`'s food group eaten on each day from `start` to `end`.
+    """
+    count = end.toordinal() - start.toordinal() + 1
+    series = dict((target.id, array('d', [0.0]) * count) for target in targets)
+    meals = list(Meal.objects.filter(date__gte=start, date__lte=end)
+                 .values_list('date', 'recipe'))
+    if not targets or not meals:
+        return series
+    servings = recipe_servings(set(recipe_id for day, recipe_id in meals), targets)
+    for day, recipe_id in meals:
+        index = day.toordinal() - start.toordinal()
+        for target_id, amount in servings.get(recipe_id, {}).iteritems():
+            series[target_id][index] += amount
+    return series
+
+
+def compliance(diet_plan, start, end):
+    """Return the `Compliance` of the meals eaten from `start` to `end`
+    (inclusive) with `diet_plan`. Only nutrients with a nonzero target are
+    included.
+    """
+    try:
+        target = DietPlanNutritionInfo.objects.get(diet_plan=diet_plan).vector()
+    except DietPlanNutritionInfo.DoesNotExist:
+        target = NutritionVector()
+    actual = daily_nutrition(start, end)
+    nutrients = [
+        (nutrient, value, values)
+        for nutrient, value, values in zip(NUTRIENTS, target.values, actual)
+        if value
+    ]
+
+    targets = list(TargetServing.objects.filter(diet_plan=diet_plan)
+                   .select_related('unit', 'food_group').order_by('pk'))
+    actual = daily_servings(start, end, targets)
+    servings = [(target, actual[target.id]) for target in targets]
+    return Compliance(start, end, _days(start, end), nutrients, servings)
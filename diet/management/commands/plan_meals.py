@@ -0,0 +1,48 @@
+from datetime import datetime
+from optparse import make_option
+from django.core.management.base import BaseCommand, CommandError
+from diet.models import DietPlan, Meal
+from diet.planner import plan_week, DEFAULT_KINDS, TIME_BUDGET
+
+class Command (BaseCommand):
+    args = "<diet plan id> <YYYY-MM-DD>"
+    help = "Plan a week of meals, starting on the given date, to meet a " \
+           "diet plan's targets."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--kinds', default=','.join(DEFAULT_KINDS),
+            help="Comma-separated kinds of meal to plan each day " \
+                 "(default: %s)." % ','.join(DEFAULT_KINDS)),
+        make_option('--seconds', type='float', default=TIME_BUDGET,
+            help="Time to spend searching (default: %g)." % TIME_BUDGET),
+        make_option('--dry-run', action='store_true', default=False,
+            help="Show the plan without saving it."),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        if len(args) != 2:
+            raise CommandError("Give a diet plan id and a start date")
+        try:
+            diet_plan = DietPlan.objects.get(pk=int(args[0]))
+        except (ValueError, DietPlan.DoesNotExist):
+            raise CommandError("No diet plan with id '%s'" % args[0])
+        try:
+            start = datetime.strptime(args[1], '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError("Start date must be YYYY-MM-DD")
+
+        kinds = [kind for kind in options['kinds'].split(',') if kind]
+        choices = [kind for kind, label in Meal._meal_choices]
+        for kind in kinds:
+            if kind not in choices:
+                raise CommandError("Unknown kind of meal '%s'; choose from %s" % (
+                    kind, ', '.join(choices)))
+
+        plan = plan_week(diet_plan, start, kinds=kinds,
+                         seconds=options['seconds'], save=not options['dry_run'])
+        if verbosity > 0:
+            for meal in plan.meals:
+                self.stdout.write("%s %s\n" % (meal.date, meal))
+            self.stdout.write("Planned %d meals (cost %.3f%s)\n" % (
+                len(plan.meals), plan.cost, '' if plan.finished else ', out of time'))
@@ -0,0 +1,16 @@
+import time
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+from diet import rollups
+
+class Command (NoArgsCommand):
+    help = "Rebuild the daily, weekly and monthly nutrition rollups from all meals."
+
+    def handle_noargs(self, **options):
+        verbosity = int(options.get('verbosity', 1))
+        started = time.time()
+        with transaction.commit_on_success():
+            count = rollups.rebuild_rollups()
+        if verbosity > 0:
+            self.stdout.write("Rolled up %d meals in %.1f seconds\n" %
+                              (count, time.time() - started))
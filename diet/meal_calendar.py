@@ -0,0 +1,150 @@
+"""
+Laying out a month of meals as a calendar.
+
+All the month's meals, with their recipes, are loaded with one query and
+bucketed by date, so laying out a month takes time in proportion to its days
+plus its meals.
+
+Months that are over (including the days of the next month shown in their
+last week) can no longer change by the passing of time, so their rendered
+calendars are kept in the Django cache. Cached calendars are keyed by the
+``meals`` `CacheGeneration`, which is bumped whenever a meal is saved or
+deleted, or a recipe with meals is renamed, so every process stops using them
+at once.
+"""
+
+from datetime import date, timedelta
+from calendar import monthrange
+from dateutil.relativedelta import relativedelta
+from django.core.cache import cache
+from django.db import models
+from django.dispatch import receiver
+from core.models import CacheGeneration
+from cookbook.models import Recipe
+from diet.models import Meal
+
+# Name of the CacheGeneration bumped whenever any Meal changes
+GENERATION = 'meals'
+
+# Seconds to keep a rendered month
+CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def calendar_days(year, month):
+    """Return the first and last days shown on the calendar for the given
+    month: whole weeks, Monday to Sunday, around it.
+    """
+    first_day_of_month = date(year, month, 1)
+    last_day_of_month = date(year, month, monthrange(year, month)[1])
+    first_day_of_calendar = first_day_of_month - timedelta(first_day_of_month.weekday())
+    last_day_of_calendar = last_day_of_month + timedelta(7 - last_day_of_month.weekday())
+    return first_day_of_calendar, last_day_of_calendar
+
+
+def meals_by_date(start, end):
+    """Return a dict of ``{date: [meal, ...]}`` for the meals from `start` to
+    `end` (inclusive), each with its recipe loaded.
+    """
+    meals = {}
+    for meal in Meal.objects.filter(date__gte=start, date__lte=end) \
+            .select_related('recipe').order_by('date', 'pk'):
+        meals.setdefault(meal.date, []).append(meal)
+    return meals
+
+
+def month_context(year, month, weekday_name_format='%a'):
+    """Return the template context for the calendar of the given month.
+    """
+    first_day_of_calendar, last_day_of_calendar = calendar_days(year, month)
+    first_day_of_month = date(year, month, 1)
+    meals = meals_by_date(
+        first_day_of_month, date(year, month, monthrange(year, month)[1]))
+    today = date.today()
+
+    calendar = []
+    week = []
+    headers = []
+
+    i = 0
+    day = first_day_of_calendar
+    while day <= last_day_of_calendar:
+        if i < 7:
+            headers.append(day.strftime(weekday_name_format))
+
+        cal_day = {
+            'day': day,
+            'events': meals.get(day, []),
+        }
+        if day == today:
+            cal_day['class'] = 'today'
+        elif day.month != month:
+            cal_day['class'] = 'other_month'
+
+        week.append(cal_day)
+
+        # Start a new week?
+        if day.weekday() == 6:
+            calendar.append(week)
+            week = []
+
+        i += 1
+        day += timedelta(1)
+
+    return {
+        'this_month': first_day_of_month,
+        'prev_month': first_day_of_month + relativedelta(months=-1),
+        'next_month': first_day_of_month + relativedelta(months=+1),
+        'calendar': calendar,
+        'headers': headers,
+    }
+
+
+def cached_month(year, month, weekday_name_format, render):
+    """Return the rendered calendar for the given month. If the month is over,
+    it is taken from the cache, or else rendered by calling `render()` and
+    cached; otherwise it is always rendered.
+    """
+    if calendar_days(year, month)[1] >= date.today():
+        return render()
+    key = 'diet.month_calendar.%d.%d-%d.%s' % (
+        CacheGeneration.current(GENERATION), year, month, weekday_name_format)
+    html = cache.get(key)
+    if html is None:
+        html = render()
+        cache.set(key, html, CACHE_TIMEOUT)
+    return html
+
+
+# Signals
+
+@receiver(models.signals.post_save, sender=Meal)
+@receiver(models.signals.post_delete, sender=Meal)
+def meals_changed(sender, **kwargs):
+    """After a `Meal` is saved or deleted (including along with its recipe),
+    stop using cached calendars.
+    """
+    if kwargs.get('raw'):
+        CacheGeneration.bump_after_load(GENERATION)
+    else:
+        CacheGeneration.bump(GENERATION)
+
+
+@receiver(models.signals.pre_save, sender=Recipe)
+def recipe_saving(sender, instance, **kwargs):
+    """Before a `Recipe` is saved, note whether it is being renamed while
+    calendars show it. Recipes are saved for many other reasons, which don't
+    affect calendars.
+    """
+    instance._calendar_renamed = bool(
+        instance.pk and not kwargs.get('raw') and
+        Recipe.objects.filter(pk=instance.pk, meal__isnull=False)
+        .exclude(name=instance.name).exists())
+
+
+@receiver(models.signals.post_save, sender=Recipe)
+def recipe_saved(sender, instance, **kwargs):
+    """After a `Recipe` that calendars show is renamed, stop using cached
+    calendars.
+    """
+    if getattr(instance, '_calendar_renamed', False):
+        CacheGeneration.bump(GENERATION)
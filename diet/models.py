@@ -58,3 +58,33 @@ class TargetServing (ModelWrapper):
     def __unicode__(self):
         return "%g %s %s" % (self.quantity, pluralize(self.unit), self.food_group)
 
+
+class NutritionRollup (NutritionInfo):
+    """Total nutrition of the meals of one kind eaten over a day, week or
+    month, kept up to date as meals change; see `diet.rollups`.
+    """
+    _period_choices = (
+        ('day', 'Day'),
+        ('week', 'Week'),
+        ('month', 'Month'),
+    )
+    period = models.CharField(max_length=5, choices=_period_choices)
+    start  = models.DateField()
+    kind   = models.CharField(max_length=20, choices=Meal._meal_choices)
+    meals  = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('period', 'start', 'kind')
+        ordering = ['period', 'start', 'kind']
+
+    def __unicode__(self):
+        return u"%s of %s, %s" % (self.get_period_display(), self.start,
+                                  self.get_kind_display())
+
+
+
+# Signals
+
+# Cached meal calendars are dropped when meals change; see `diet.meal_calendar`.
+# Nutrition rollups are kept up to date as meals change; see `diet.rollups`.
+from diet import meal_calendar, rollups
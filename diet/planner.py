@@ -0,0 +1,226 @@
+"""
+Planning a week of meals to meet a `DietPlan`'s targets.
+
+:py:func:`plan_week` fills each day of the week with one meal of each of the
+given kinds (leaving alone any meals already planned) from the recipes in the
+cookbook, no recipe more than once, so that each day's nutrition and
+food-group servings come as close as possible to the plan's targets.
+
+A day's cost is the sum, over every target, of the squared fraction by which
+the day misses it; the plan's cost is the sum over its days. Each recipe's
+amounts of the targeted nutrients and servings are loaded once, as a row of a
+matrix, so trying a recipe only takes a few additions. The plan is built
+greedily, filling each meal with the recipe that lowers its day's cost most,
+then improved by local search (replacing a meal's recipe, or swapping two
+meals between days) until no more time is left. The best plan found so far is
+always the one kept.
+"""
+
+import time
+import random
+from datetime import timedelta
+from django.db import transaction
+from cookbook.models import Recipe
+from cookbook.recalculation import batches
+from diet.models import Meal, DietPlanNutritionInfo, TargetServing
+from diet.compliance import recipe_servings
+from diet.rollups import recipe_vectors
+
+# Kinds of meal planned for each day, by default
+DEFAULT_KINDS = ('breakfast', 'lunch', 'dinner')
+
+# Seconds spent improving a plan, by default
+TIME_BUDGET = 2.0
+
+# Number of recipes whose amounts are loaded per query
+BATCH_SIZE = 500
+
+# Local search moves tried between checks of the clock
+CHECK_EVERY = 200
+
+# Local search stops early after this many moves in a row fail to help
+STALL_TRIES = 5000
+
+
+class Slot (object):
+    """A meal to plan: a day (counted from the start of the week) and kind,
+    with the index of the recipe chosen for it.
+    """
+    def __init__(self, day, kind):
+        self.day = day
+        self.kind = kind
+        self.recipe = None
+
+
+class WeekPlan (object):
+    """The result of :py:func:`plan_week`: the `meals` planned, the plan's
+    `cost`, and whether the search was `finished` before running out of time.
+    """
+    def __init__(self, meals, cost, finished):
+        self.meals = meals
+        self.cost = cost
+        self.finished = finished
+
+
+def targets(diet_plan):
+    """Return ``(nutrients, servings, values)`` for `diet_plan`: the indexes
+    in `NUTRIENTS` of the nutrients it has a nonzero target for, its
+    `TargetServing`\s with a nonzero quantity, and the daily target values
+    of both, in that order.
+    """
+    nutrients = []
+    values = []
+    try:
+        nutrition = DietPlanNutritionInfo.objects.get(diet_plan=diet_plan).vector()
+        for index, value in enumerate(nutrition.values):
+            if value:
+                nutrients.append(index)
+                values.append(value)
+    except DietPlanNutritionInfo.DoesNotExist:
+        pass
+    servings = list(TargetServing.objects.filter(diet_plan=diet_plan, quantity__gt=0)
+                    .select_related('unit', 'food_group').order_by('pk'))
+    values.extend(serving.quantity for serving in servings)
+    return nutrients, servings, values
+
+
+def recipe_matrix(recipe_ids, nutrients, servings):
+    """Return ``(recipe_ids, rows)``: those of the recipes with the given ids
+    that have any nutrition, and for each one a row with its amounts of the
+    given `nutrients` and `servings` (see :py:func:`targets`).
+    """
+    found = []
+    rows = []
+    for batch in batches(recipe_ids, BATCH_SIZE):
+        vectors = recipe_vectors(batch)
+        amounts = recipe_servings(vectors.keys(), servings) if servings else {}
+        for recipe_id in batch:
+            vector = vectors.get(recipe_id)
+            if vector is None or vector.is_empty():
+                continue
+            recipe_amounts = amounts.get(recipe_id, {})
+            found.append(recipe_id)
+            rows.append([vector.values[index] for index in nutrients] +
+                        [recipe_amounts.get(serving.id, 0.0) for serving in servings])
+    return found, rows
+
+
+def _day_cost(totals, values):
+    """Return the cost of a day with the given totals of each target.
+    """
+    cost = 0.0
+    for total, value in zip(totals, values):
+        miss = (total - value) / value
+        cost += miss * miss
+    return cost
+
+
+def _add(totals, row, sign=1):
+    """Return `totals` with `row` added (or, if `sign` is -1, subtracted).
+    """
+    return [total + sign * amount for total, amount in zip(totals, row)]
+
+
+def plan_week(diet_plan, start, kinds=DEFAULT_KINDS, recipes=None,
+              seconds=TIME_BUDGET, save=True, seed=None):
+    """Plan the week of meals starting on `start` to meet the targets of
+    `diet_plan`, and return a `WeekPlan`.
+
+    Each day gets one meal of each of `kinds`, chosen from `recipes` (a
+    queryset; by default, all recipes), unless it already has one; meals
+    already planned count towards their day's targets. No recipe is used
+    twice in the week. The search stops after `seconds`. If `save` is True,
+    the new `Meal`\s are saved, all or none of them. Raise `ValueError` if any
+    of `kinds` is not a kind of `Meal`.
+    """
+    unknown = set(kinds) - set(kind for kind, label in Meal._meal_choices)
+    if unknown:
+        raise ValueError("Unknown kinds of meal: %s" % ', '.join(sorted(unknown)))
+    deadline = time.time() + seconds
+    rng = random.Random(seed)
+    nutrients, servings, values = targets(diet_plan)
+    existing = list(Meal.objects.filter(date__gte=start, date__lte=start + timedelta(6))
+                    .values_list('date', 'kind', 'recipe'))
+    used = set(recipe_id for day, kind, recipe_id in existing)
+    if recipes is None:
+        recipes = Recipe.objects.all()
+    found, rows = recipe_matrix(
+        [recipe_id for recipe_id in recipes.values_list('pk', flat=True)
+         if recipe_id not in used],
+        nutrients, servings)
+
+    # Meals already planned count towards their days
+    days = [[0.0] * len(values) for day in range(7)]
+    fixed = dict(zip(*recipe_matrix(list(used), nutrients, servings)))
+    for day, kind, recipe_id in existing:
+        if recipe_id in fixed:
+            index = (day - start).days
+            days[index] = _add(days[index], fixed[recipe_id])
+
+    planned = set((day, kind) for day, kind, recipe_id in existing)
+    slots = [Slot(day, kind) for day in range(7) for kind in kinds
+             if (start + timedelta(day), kind) not in planned]
+    # With too few recipes, some meals are left unplanned
+    slots = slots[:len(found)]
+    free = set(range(len(found)))
+
+    # Greedy: fill each meal with the recipe that helps its day most; once out
+    # of time, with any recipe
+    finished = True
+    for slot in slots:
+        if time.time() > deadline:
+            finished = False
+            slot.recipe = free.pop()
+        else:
+            cost, slot.recipe = min(
+                (_day_cost(_add(days[slot.day], rows[recipe]), values), recipe)
+                for recipe in free)
+            free.remove(slot.recipe)
+        days[slot.day] = _add(days[slot.day], rows[slot.recipe])
+    costs = [_day_cost(totals, values) for totals in days]
+
+    # Local search: keep any change that lowers the cost
+    free = list(free)
+    tries = stalled = 0
+    while finished and len(slots) > 1 and stalled < STALL_TRIES:
+        tries += 1
+        stalled += 1
+        if tries % CHECK_EVERY == 0 and time.time() > deadline:
+            finished = False
+            break
+        slot = rng.choice(slots)
+        if free and rng.random() < 0.5:
+            # Replace the meal's recipe with an unused one
+            position = rng.randrange(len(free))
+            totals = _add(_add(days[slot.day], rows[slot.recipe], -1), rows[free[position]])
+            cost = _day_cost(totals, values)
+            if cost < costs[slot.day]:
+                slot.recipe, free[position] = free[position], slot.recipe
+                days[slot.day] = totals
+                costs[slot.day] = cost
+                stalled = 0
+        else:
+            # Swap recipes with a meal on another day
+            other = rng.choice(slots)
+            if other.day == slot.day:
+                continue
+            totals = _add(_add(days[slot.day], rows[slot.recipe], -1), rows[other.recipe])
+            other_totals = _add(_add(days[other.day], rows[other.recipe], -1),
+                                rows[slot.recipe])
+            cost = _day_cost(totals, values)
+            other_cost = _day_cost(other_totals, values)
+            if cost + other_cost < costs[slot.day] + costs[other.day]:
+                slot.recipe, other.recipe = other.recipe, slot.recipe
+                days[slot.day], days[other.day] = totals, other_totals
+                costs[slot.day], costs[other.day] = cost, other_cost
+                stalled = 0
+
+    meals = [
+        Meal(date=start + timedelta(slot.day), kind=slot.kind, recipe_id=found[slot.recipe])
+        for slot in slots
+    ]
+    if save:
+        with transaction.commit_on_success():
+            for meal in meals:
+                meal.save()
+    return WeekPlan(meals, sum(costs), finished)
@@ -0,0 +1,288 @@
+"""
+Nutrition eaten over time, summed by day, week and month.
+
+For each meal kind, a `NutritionRollup` holds the total nutrition of the meals
+of that kind eaten in each day, week (starting on Monday) and month, along with
+the number of meals. Rollups are never re-summed from meals: whenever a meal is
+added, edited or deleted, or the nutrition of a recipe that meals use changes,
+only the difference is added to the rollups it falls in. Reports over years of
+meals (see :py:func:`intake`) read a few rows per period instead.
+
+Each meal counts for one portion of its recipe, as in `RecipeNutritionInfo`.
+To rebuild all rollups from the meals, run:
+
+    $ ./manage.py rebuild_nutrition_rollups
+"""
+
+from datetime import timedelta
+from django.db import connection, models, transaction, IntegrityError
+from django.dispatch import receiver
+from nutrition.models import NutritionInfo
+from nutrition.nutrients import COLUMNS
+from nutrition.vector import NutritionVector
+from cookbook.models import RecipeNutritionInfo
+from cookbook.recalculation import batches, recipe_nutrition_changing
+from cookbook.importer import catalog_imported
+from diet.models import Meal, NutritionRollup
+
+# Periods kept, each with a function returning the first day of the period a
+# given day falls in
+PERIODS = (
+    ('day', lambda day: day),
+    ('week', lambda day: day - timedelta(day.weekday())),
+    ('month', lambda day: day.replace(day=1)),
+)
+
+# Number of meals loaded at a time when rebuilding
+BATCH_SIZE = 1000
+
+
+def period_start(period, day):
+    """Return the first day of the `period` that `day` falls in.
+    """
+    return dict(PERIODS)[period](day)
+
+
+def recipe_vectors(recipe_ids):
+    """Return a dict of ``{recipe_id: NutritionVector}`` with the nutrition of
+    one portion of each recipe. Recipes with no nutrition yet are left out.
+    """
+    rows = RecipeNutritionInfo.objects.filter(recipe__in=list(recipe_ids)) \
+            .values_list('recipe', 'packed_nutrients', *COLUMNS)
+    return dict(
+        (row[0], NutritionVector.from_columns(row[2:], row[1])) for row in rows)
+
+
+def _buckets(changes):
+    """Given ``(date, kind, meals, vector)`` changes, return a dict of
+    ``{(period, start, kind): [meals, vector]}`` with their total for each
+    rollup they fall in.
+    """
+    buckets = {}
+    for day, kind, meals, vector in changes:
+        for period, start in PERIODS:
+            bucket = buckets.setdefault((period, start(day), kind), [0, NutritionVector()])
+            bucket[0] += meals
+            bucket[1] = bucket[1] + vector
+    return buckets
+
+
+def _create_rollups(keys):
+    """Create an empty rollup for each ``(period, start, kind)`` in `keys`,
+    unless one already exists. Another process may be creating the same
+    rollup at the same time; then the one it made is used.
+    """
+    for period, start, kind in keys:
+        rollup = NutritionRollup(period=period, start=start, kind=kind)
+        sid = transaction.savepoint()
+        try:
+            rollup.save()
+        except IntegrityError:
+            transaction.savepoint_rollback(sid)
+            # Without savepoints (SQLite), the parent row is left behind
+            if rollup.pk:
+                NutritionInfo.objects.filter(pk=rollup.pk).delete()
+        else:
+            transaction.savepoint_commit(sid)
+
+
+def apply_changes(changes):
+    """Add ``(date, kind, meals, vector)`` changes to the rollups they fall in:
+    `meals` meals (which may be negative) and the nutrition `vector` eaten on
+    `date` as meals of the given `kind`. Rollups left with no meals are
+    deleted.
+
+    All the rollups touched are read with one query and written with one
+    batched ``UPDATE`` per table; only new rollups are created one by one.
+    The meal counts are updated first, relative to their current values,
+    which locks the rollups until the transaction ends, so changes made at
+    the same time by other processes are not lost. The changes are part of
+    the caller's transaction, if it manages one, and committed otherwise.
+    """
+    buckets = _buckets(changes)
+    if not buckets:
+        return
+
+    starts = set(start for period, start, kind in buckets)
+    kinds = set(kind for period, start, kind in buckets)
+    rollups = NutritionRollup.objects.filter(start__in=starts, kind__in=kinds)
+    qn = connection.ops.quote_name
+    cursor = connection.cursor()
+
+    existing = set(rollups.values_list('period', 'start', 'kind'))
+    for key, (meals, vector) in buckets.items():
+        if key not in existing and meals <= 0:
+            del buckets[key]
+    _create_rollups(sorted(key for key in buckets if key not in existing))
+
+    # Always in the same order, so processes can't deadlock
+    keys = sorted(buckets)
+    meta = NutritionRollup._meta
+    meals_column = qn(meta.get_field('meals').column)
+    cursor.executemany('UPDATE %s SET %s = %s + %%s WHERE %s' % (
+        qn(meta.db_table), meals_column, meals_column,
+        ' AND '.join('%s = %%s' % qn(meta.get_field(field).column)
+                     for field in ('period', 'start', 'kind'))),
+        [(buckets[key][0],) + key for key in keys])
+
+    nutrition_rows = []
+    empty = []
+    for row in rollups.values_list('period', 'start', 'kind', 'pk', 'meals',
+                                   'packed_nutrients', *COLUMNS):
+        key = row[:3]
+        if key not in buckets:
+            continue
+        if row[4] <= 0:
+            empty.append(row[3])
+            continue
+        vector = buckets[key][1] + NutritionVector.from_columns(row[6:], row[5])
+        nutrition_rows.append(vector.columns() + [vector.packed(), row[3]])
+
+    if nutrition_rows:
+        meta = NutritionInfo._meta
+        columns = ', '.join(
+            '%s = %%s' % qn(meta.get_field(field).column)
+            for field in COLUMNS + ('packed_nutrients',))
+        cursor.executemany('UPDATE %s SET %s WHERE %s = %%s' % (
+            qn(meta.db_table), columns, qn(meta.pk.column)), nutrition_rows)
+    if empty:
+        NutritionRollup.objects.filter(pk__in=empty).delete()
+    transaction.commit_unless_managed()
+
+
+def _meal_changes(meals):
+    """Given ``(date, kind, recipe_id)`` meals, return the changes adding them
+    to their rollups.
+    """
+    changes = []
+    for batch in batches(meals, BATCH_SIZE):
+        vectors = recipe_vectors(set(recipe_id for day, kind, recipe_id in batch))
+        changes.extend(
+            (day, kind, 1, vectors.get(recipe_id, NutritionVector()))
+            for day, kind, recipe_id in batch)
+    return changes
+
+
+def rebuild_rollups():
+    """Sum all rollups from scratch from the meals, and return the number of
+    meals. Callers should run it in a transaction, so the rollups are never
+    seen half rebuilt.
+    """
+    NutritionRollup.objects.all().delete()
+    meals = list(Meal.objects.values_list('date', 'kind', 'recipe'))
+    apply_changes(_meal_changes(meals))
+    return len(meals)
+
+
+def intake(period, start, end, kind=None):
+    """Return a list of ``(start, meals, NutritionVector)`` for each `period`
+    (``'day'``, ``'week'`` or ``'month'``) from the one `start` falls in to the
+    one `end` falls in, with the meals of the given `kind` (or of all kinds)
+    eaten in it. Periods with no meals are left out.
+    """
+    rollups = NutritionRollup.objects.filter(
+        period=period,
+        start__gte=period_start(period, start),
+        start__lte=period_start(period, end))
+    if kind:
+        rollups = rollups.filter(kind=kind)
+    totals = {}
+    for row in rollups.values_list('start', 'meals', 'packed_nutrients', *COLUMNS):
+        meals, vector = totals.get(row[0], (0, NutritionVector()))
+        totals[row[0]] = (meals + row[1],
+                          vector + NutritionVector.from_columns(row[3:], row[2]))
+    return [(day, meals, vector) for day, (meals, vector) in sorted(totals.items())]
+
+
+def _recipes_changing(vectors):
+    """Add the difference between the nutrition about to be saved for recipes,
+    given as ``{recipe_id: NutritionVector}``, and their current nutrition to
+    the rollups of all meals using them.
+    """
+    meals = list(Meal.objects.filter(recipe__in=vectors.keys())
+                 .values_list('date', 'kind', 'recipe'))
+    if not meals:
+        return
+    old = recipe_vectors(set(recipe_id for day, kind, recipe_id in meals))
+    changes = []
+    for day, kind, recipe_id in meals:
+        difference = vectors[recipe_id] + old.get(recipe_id, NutritionVector()) * -1
+        if not difference.is_empty():
+            changes.append((day, kind, 0, difference))
+    apply_changes(changes)
+
+
+# Signals
+
+@receiver(models.signals.pre_save, sender=Meal)
+def meal_saving(sender, instance, **kwargs):
+    """Before a `Meal` is edited, remember what it was.
+    """
+    instance._rollup_old = None
+    if instance.pk and not kwargs.get('raw'):
+        old = list(Meal.objects.filter(pk=instance.pk).values_list('date', 'kind', 'recipe'))
+        if old:
+            instance._rollup_old = old[0]
+
+
+@receiver(models.signals.post_save, sender=Meal)
+def meal_saved(sender, instance, **kwargs):
+    """After a `Meal` is added or edited, move it into the rollups for its
+    date and kind.
+    """
+    if kwargs.get('raw'):
+        return
+    new = (instance.date, instance.kind, instance.recipe_id)
+    old = getattr(instance, '_rollup_old', None)
+    if old == new:
+        return
+    vectors = recipe_vectors([new[2]] + ([old[2]] if old else []))
+    changes = [(new[0], new[1], 1, vectors.get(new[2], NutritionVector()))]
+    if old:
+        changes.append((old[0], old[1], -1, vectors.get(old[2], NutritionVector()) * -1))
+    apply_changes(changes)
+
+
+@receiver(models.signals.pre_delete, sender=Meal)
+def meal_deleting(sender, instance, **kwargs):
+    """Before a `Meal` is deleted, load its nutrition, since its recipe's may
+    be deleted along with it.
+    """
+    instance._rollup_vector = recipe_vectors([instance.recipe_id]).get(
+        instance.recipe_id, NutritionVector())
+
+
+@receiver(models.signals.post_delete, sender=Meal)
+def meal_deleted(sender, instance, **kwargs):
+    """After a `Meal` is deleted, take it out of its rollups.
+    """
+    vector = getattr(instance, '_rollup_vector', NutritionVector())
+    apply_changes([(instance.date, instance.kind, -1, vector * -1)])
+
+
+@receiver(catalog_imported)
+def meals_imported(sender, loaded, **kwargs):
+    """After a catalog is imported, add the meals in it (saved without
+    updating any rollups) to their rollups.
+    """
+    meals = []
+    for batch in batches(loaded.get(Meal, []), BATCH_SIZE):
+        meals.extend(Meal.objects.filter(pk__in=batch).values_list('date', 'kind', 'recipe'))
+    apply_changes(_meal_changes(meals))
+
+
+@receiver(models.signals.pre_save, sender=RecipeNutritionInfo)
+def recipe_nutrition_saving(sender, instance, **kwargs):
+    """Before a recipe's nutrition is changed, update the rollups of the meals
+    using it.
+    """
+    if instance.pk and not kwargs.get('raw'):
+        _recipes_changing({instance.recipe_id: instance.vector()})
+
+
+@receiver(recipe_nutrition_changing)
+def recipes_recalculating(sender, vectors, **kwargs):
+    """Before the nutrition of many recipes is written at once, update the
+    rollups of the meals using them.
+    """
+    _recipes_changing(vectors)
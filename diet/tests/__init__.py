@@ -1,3 +1,7 @@
 from view import *
 from formatting import *
 
+from meal_calendar import *
+from rollups import *
+from compliance import *
+from planner import *
@@ -0,0 +1,86 @@
+from datetime import date
+from django.test import TestCase
+from django.utils import simplejson
+from core.models import Food, FoodGroup, Unit
+from cookbook.models import Recipe
+from nutrition.vector import NutritionVector
+from diet.models import Meal, DietPlan, DietPlanNutritionInfo, TargetServing
+from diet.compliance import compliance
+
+class ComplianceTest (TestCase):
+    fixtures = [
+        'test_food',
+        'test_unit',
+        'test_equivalence',
+        'test_food_nutrition_info',
+        'test_nutrition_info',
+        'test_recipe',
+    ]
+    def setUp(self):
+        grains = FoodGroup.objects.create(name='Grains')
+        flours = FoodGroup.objects.create(name='Flours', parent=grains)
+        flour = Food.objects.get(name='all-purpose flour')
+        flour.food_group = flours
+        flour.save()
+        cup = Unit.objects.get(name='cup')
+        ml = Unit.objects.get(name='milliliter')
+
+        self.bread = Recipe.objects.create(name='Bread', num_portions=2)
+        self.bread.ingredients.create(quantity=1, unit=cup, food=flour)
+        self.bread.ingredients.create(quantity=2, food=Food.objects.get(name='egg'))
+        self.bread.nutrition_info.set_equal(NutritionVector(calories=500, fat=10))
+        self.roux = Recipe.objects.create(name='Roux')
+        self.roux.ingredients.create(quantity=473.2, unit=ml, food=flour)
+        self.roux.nutrition_info.set_equal(NutritionVector(calories=1000))
+
+        self.plan = DietPlan.objects.create(name='Plan')
+        DietPlanNutritionInfo.objects.create(diet_plan=self.plan, calories=2000)
+        self.target = TargetServing.objects.create(
+            diet_plan=self.plan, food_group=grains, quantity=3, unit=cup)
+
+        Meal.objects.create(date=date(2011, 6, 1), kind='breakfast', recipe=self.bread)
+        Meal.objects.create(date=date(2011, 6, 3), kind='breakfast', recipe=self.bread)
+        Meal.objects.create(date=date(2011, 6, 3), kind='dinner', recipe=self.roux)
+        Meal.objects.create(date=date(2011, 7, 1), kind='dinner', recipe=self.roux)
+
+
+    def test_compliance(self):
+        """Each day's nutrients and servings are compared with the targets.
+        """
+        result = compliance(self.plan, date(2011, 6, 1), date(2011, 6, 4))
+        self.assertEqual(result.days[0], date(2011, 6, 1))
+        self.assertEqual(len(result.days), 4)
+        # Only nutrients with targets
+        self.assertEqual(len(result.nutrients), 1)
+        nutrient, target, actual = result.nutrients[0]
+        self.assertEqual((nutrient.name, target), ('calories', 2000))
+        self.assertEqual(list(actual), [500, 0, 1500, 0])
+
+        # Flour counts as grains; a pint of it is 2 cups
+        target, actual = result.servings[0]
+        self.assertEqual(target, self.target)
+        self.assertEqual([round(value, 2) for value in actual], [0.5, 0, 2.5, 0])
+
+
+    def test_queries(self):
+        """The whole range takes a fixed number of queries.
+        """
+        compliance(self.plan, date(2011, 1, 1), date(2011, 12, 31))
+        # Targets, rollups, servings, meals, ingredients and food groups
+        self.assertNumQueries(6, lambda: compliance(
+            self.plan, date(2011, 1, 1), date(2011, 12, 31)))
+
+
+    def test_view(self):
+        """Compliance is served as JSON for charts.
+        """
+        url = '/diet/plans/%d/compliance/' % self.plan.id
+        response = self.client.get(url, {'start': '2011-06-01', 'end': '2011-06-03'})
+        data = simplejson.loads(response.content)
+        self.assertEqual(data['days'], ['2011-06-01', '2011-06-02', '2011-06-03'])
+        self.assertEqual(data['nutrients'][0]['actual'], [500, 0, 1500])
+        self.assertEqual(data['servings'][0]['food_group'], 'Grains')
+        response = self.client.get(url, {'start': '2011-06-03', 'end': '2011-06-01'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(url, {'start': 'June'})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,82 @@
+from datetime import date
+from django.test import TestCase
+from django.core.cache import cache
+from cookbook.models import Recipe
+from diet.models import Meal
+from core.models import CacheGeneration
+from diet.meal_calendar import month_context, GENERATION
+from diet.templatetags.month_calendar import month_cal
+
+class MealCalendarTest (TestCase):
+    fixtures = [
+        'test_food',
+        'test_unit',
+        'test_equivalence',
+        'test_food_nutrition_info',
+        'test_nutrition_info',
+        'test_recipe',
+    ]
+    def setUp(self):
+        cache.clear()
+        self.omelet = Recipe.objects.create(name='Omelet')
+        self.toast = Recipe.objects.create(name='Toast')
+        Meal.objects.create(date=date(2011, 6, 1), kind='breakfast', recipe=self.omelet)
+        Meal.objects.create(date=date(2011, 6, 1), kind='lunch', recipe=self.toast)
+        Meal.objects.create(date=date(2011, 6, 30), kind='dinner', recipe=self.omelet)
+        # In July, but shown in June's last week
+        Meal.objects.create(date=date(2011, 7, 1), kind='dinner', recipe=self.toast)
+
+
+    def test_month_context(self):
+        """Meals are placed on their days, with recipes loaded in one query.
+        """
+        with self.assertNumQueries(1):
+            context = month_context(2011, 6)
+            events = dict((day['day'], [meal.recipe.name for meal in day['events']])
+                          for week in context['calendar'] for day in week)
+        self.assertEqual(events[date(2011, 6, 1)], [u'Omelet', u'Toast'])
+        self.assertEqual(events[date(2011, 6, 30)], [u'Omelet'])
+        self.assertEqual(events[date(2011, 7, 1)], [])
+        self.assertEqual(context['headers'][0], 'Mon')
+        self.assertEqual(len(context['calendar']), 5)
+
+
+    def test_cached_past_month(self):
+        """Calendars of past months are cached until a meal or recipe changes.
+        """
+        html = month_cal(2011, 6)
+        self.assertTrue('Omelet' in html)
+        # Only the cache generation is checked
+        self.assertNumQueries(1, lambda: month_cal(2011, 6))
+
+        Meal.objects.create(date=date(2011, 6, 15), kind='dinner', recipe=self.toast)
+        self.assertEqual(month_cal(2011, 6).count('Toast'), 4)
+        self.omelet.name = 'Frittata'
+        self.omelet.save()
+        html = month_cal(2011, 6)
+        self.assertTrue('Frittata' in html and 'Omelet' not in html)
+
+
+    def test_recipe_changes(self):
+        """Only renaming a recipe with meals, or deleting one, changes the
+        cached calendars.
+        """
+        generation = CacheGeneration.current(GENERATION)
+        self.omelet.save()
+        unused = Recipe.objects.create(name='Waffles')
+        unused.name = 'Belgian waffles'
+        unused.save()
+        self.assertEqual(CacheGeneration.current(GENERATION), generation)
+
+        self.assertEqual(month_cal(2011, 6).count('Toast'), 2)
+        self.toast.delete()
+        self.assertTrue(CacheGeneration.current(GENERATION) > generation)
+        self.assertTrue('Toast' not in month_cal(2011, 6))
+
+
+    def test_current_month(self):
+        """The calendar of the current month is not cached.
+        """
+        today = date.today()
+        month_cal(today.year, today.month)
+        self.assertNumQueries(1, lambda: month_cal(today.year, today.month))
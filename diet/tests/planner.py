@@ -0,0 +1,124 @@
+from datetime import date
+from StringIO import StringIO
+from django.test import TestCase, TransactionTestCase
+from django.db.models.signals import post_save
+from django.core import management
+from django.core.management.base import CommandError
+from cookbook.models import Recipe, RecipeNutritionInfo
+from nutrition.vector import NutritionVector
+from diet.models import Meal, DietPlan, DietPlanNutritionInfo
+from diet.planner import plan_week
+
+class MealPlannerTest (TestCase):
+    fixtures = [
+        'test_food',
+        'test_unit',
+        'test_equivalence',
+        'test_food_nutrition_info',
+        'test_nutrition_info',
+        'test_recipe',
+    ]
+    def setUp(self):
+        self.plan = DietPlan.objects.create(name='Plan')
+        DietPlanNutritionInfo.objects.create(diet_plan=self.plan, calories=2000, protein=60)
+        self.recipes = []
+        for i in range(30):
+            recipe = Recipe.objects.create(name='Recipe %d' % i)
+            recipe.nutrition_info.set_equal(
+                NutritionVector(calories=100 + 50 * i, protein=5 + (i % 7) * 4))
+            self.recipes.append(recipe)
+        self.start = date(2011, 6, 6)
+
+
+    def day_calories(self):
+        calories = dict(RecipeNutritionInfo.objects.values_list('recipe', 'calories'))
+        totals = {}
+        for day, recipe_id in Meal.objects.values_list('date', 'recipe'):
+            totals[day] = totals.get(day, 0) + calories[recipe_id]
+        return totals
+
+
+    def test_plan_week(self):
+        """A week of meals is planned and saved, near the targets, with no
+        recipe repeated.
+        """
+        plan = plan_week(self.plan, self.start, seconds=5, seed=1)
+        self.assertTrue(plan.finished)
+        self.assertEqual(Meal.objects.count(), 21)
+        recipe_ids = Meal.objects.values_list('recipe', flat=True)
+        self.assertEqual(len(set(recipe_ids)), 21)
+        self.assertEqual(set(Meal.objects.values_list('kind', flat=True)),
+                         set(['breakfast', 'lunch', 'dinner']))
+        for day, calories in self.day_calories().items():
+            self.assertTrue(1500 <= calories <= 2500, (day, calories))
+
+
+    def test_existing_meals(self):
+        """Meals already planned are kept, and count towards their days.
+        """
+        Meal.objects.create(date=self.start, kind='dinner', recipe=self.recipes[-1])
+        plan = plan_week(self.plan, self.start, kinds=['lunch', 'dinner'],
+                         save=False, seed=1)
+        self.assertEqual(len(plan.meals), 13)
+        self.assertFalse(self.recipes[-1].id in [meal.recipe_id for meal in plan.meals])
+        self.assertEqual(Meal.objects.count(), 1)
+
+
+    def test_time_budget(self):
+        """When out of time, the plan found so far is returned.
+        """
+        plan = plan_week(self.plan, self.start, seconds=0, save=False)
+        self.assertFalse(plan.finished)
+        self.assertEqual(len(plan.meals), 21)
+
+
+    def test_command(self):
+        """Plan meals with the management command.
+        """
+        output = StringIO()
+        management.call_command('plan_meals', str(self.plan.id), '2011-06-06',
+            kinds='dinner', seconds=1.0, dry_run=True, stdout=output)
+        self.assertTrue('Planned 7 meals' in output.getvalue())
+        self.assertEqual(Meal.objects.count(), 0)
+
+
+    def test_unknown_kinds(self):
+        """Kinds of meal that don't exist are rejected before anything is
+        planned.
+        """
+        # call_command exits on errors, so call the command directly
+        from diet.management.commands.plan_meals import Command
+        self.assertRaises(CommandError, Command().handle, str(self.plan.id), '2011-06-06',
+            kinds='dinner,brunch', seconds=1.0, dry_run=False, verbosity=0)
+        self.assertRaises(ValueError, plan_week, self.plan, self.start, kinds=['brunch'])
+        self.assertEqual(Meal.objects.count(), 0)
+
+
+class PlanWeekTransactionTest (TransactionTestCase):
+    def tearDown(self):
+        # Nothing is rolled back after these tests
+        management.call_command('flush', verbosity=0, interactive=False)
+
+
+    def test_failed_save(self):
+        """When saving a meal fails, none of the week's meals are saved.
+        """
+        plan = DietPlan.objects.create(name='Plan')
+        DietPlanNutritionInfo.objects.create(diet_plan=plan, calories=600)
+        for i in range(10):
+            recipe = Recipe.objects.create(name='Recipe %d' % i)
+            recipe.nutrition_info.set_equal(NutritionVector(calories=500 + 20 * i))
+
+        saved = []
+        def fail_fifth(sender, instance, **kwargs):
+            saved.append(instance)
+            if len(saved) == 5:
+                raise RuntimeError("Failed partway through")
+        post_save.connect(fail_fifth, sender=Meal)
+        try:
+            self.assertRaises(RuntimeError, plan_week, plan, date(2011, 6, 6),
+                              kinds=['dinner'], seconds=0)
+        finally:
+            post_save.disconnect(fail_fifth, sender=Meal)
+        self.assertEqual(len(saved), 5)
+        self.assertEqual(Meal.objects.count(), 0)
@@ -0,0 +1,166 @@
+from datetime import date
+from StringIO import StringIO
+from django.test import TestCase, TransactionTestCase
+from django.db import transaction
+from django.core import management
+from core.models import Food
+from cookbook.models import Recipe, RecipeNutritionInfo
+from cookbook.recalculation import recalculate_recipes
+from nutrition.vector import NutritionVector
+from diet.models import Meal, NutritionRollup
+from nutrition.models import NutritionInfo
+from diet.rollups import intake, rebuild_rollups, apply_changes, _create_rollups
+
+class NutritionRollupTest (TestCase):
+    fixtures = [
+        'test_food',
+        'test_unit',
+        'test_equivalence',
+        'test_food_nutrition_info',
+        'test_nutrition_info',
+        'test_recipe',
+        'test_recipe_nutrition_info',
+    ]
+    def setUp(self):
+        self.omelet = Recipe.objects.create(name='Omelet')
+        self.omelet.nutrition_info.set_equal(NutritionVector(calories=300, fat=20))
+        self.toast = Recipe.objects.create(name='Toast')
+        self.toast.nutrition_info.set_equal(NutritionVector(calories=100, fat=2))
+
+
+    def rollups(self, period='day'):
+        return [(rollup.start, rollup.kind, rollup.meals, rollup.calories, rollup.fat)
+                for rollup in NutritionRollup.objects.filter(period=period)]
+
+
+    def test_add_meals(self):
+        """Meals are added to the rollups for their day, week and month.
+        """
+        Meal.objects.create(date=date(2011, 6, 1), kind='breakfast', recipe=self.omelet)
+        Meal.objects.create(date=date(2011, 6, 1), kind='breakfast', recipe=self.toast)
+        Meal.objects.create(date=date(2011, 6, 2), kind='lunch', recipe=self.toast)
+        self.assertEqual(self.rollups('day'), [
+            (date(2011, 6, 1), u'breakfast', 2, 400, 22),
+            (date(2011, 6, 2), u'lunch', 1, 100, 2),
+        ])
+        # The week starts on Monday
+        self.assertEqual(self.rollups('week'), [
+            (date(2011, 5, 30), u'breakfast', 2, 400, 22),
+            (date(2011, 5, 30), u'lunch', 1, 100, 2),
+        ])
+        self.assertEqual(self.rollups('month')[1], (date(2011, 6, 1), u'lunch', 1, 100, 2))
+
+
+    def test_edit_and_delete_meals(self):
+        """Edited meals move between rollups; deleted ones leave them.
+        """
+        meal = Meal.objects.create(date=date(2011, 6, 1), kind='breakfast',
+                                   recipe=self.omelet)
+        Meal.objects.create(date=date(2011, 6, 1), kind='breakfast', recipe=self.toast)
+        meal.date = date(2011, 7, 1)
+        meal.kind = 'dinner'
+        meal.recipe = self.toast
+        meal.save()
+        self.assertEqual(self.rollups('day'), [
+            (date(2011, 6, 1), u'breakfast', 1, 100, 2),
+            (date(2011, 7, 1), u'dinner', 1, 100, 2),
+        ])
+        self.assertEqual(len(self.rollups('month')), 2)
+        meal.delete()
+        self.assertEqual(self.rollups('day'), [(date(2011, 6, 1), u'breakfast', 1, 100, 2)])
+        self.assertEqual(len(self.rollups('month')), 1)
+        # Deleting a recipe deletes its meals, and their nutrition
+        self.toast.delete()
+        self.assertEqual(NutritionRollup.objects.count(), 0)
+
+
+    def test_recipe_nutrition_changes(self):
+        """A change in a recipe's nutrition changes the rollups of its meals.
+        """
+        Meal.objects.create(date=date(2011, 6, 1), kind='breakfast', recipe=self.omelet)
+        Meal.objects.create(date=date(2011, 6, 8), kind='breakfast', recipe=self.omelet)
+        self.omelet.nutrition_info.set_equal(NutritionVector(calories=250, fat=20))
+        self.assertEqual([row[3] for row in self.rollups('week')], [250, 250])
+        self.assertEqual(self.rollups('month'), [(date(2011, 6, 1), u'breakfast', 2, 500, 40)])
+
+        # And when recalculated in bulk
+        pancakes = Recipe.objects.get(name='Pancakes')
+        pancakes.ingredients.create(quantity=2, food=Food.objects.get(name='egg'))
+        RecipeNutritionInfo.objects.filter(recipe=pancakes).update(calories=0)
+        Meal.objects.create(date=date(2011, 6, 1), kind='lunch', recipe=pancakes)
+        recalculate_recipes([pancakes])
+        calories = RecipeNutritionInfo.objects.get(recipe=pancakes).calories
+        self.assertTrue(calories > 0)
+        self.assertEqual(self.rollups('day')[1][3], calories)
+
+
+    def test_rollup_created_elsewhere(self):
+        """A rollup created by another process at the same time is added to,
+        rather than failing the save.
+        """
+        key = ('day', date(2011, 6, 1), 'breakfast')
+        _create_rollups([key])
+        infos = NutritionInfo.objects.count()
+        # As if another process created it after this one looked
+        _create_rollups([key])
+        self.assertEqual(NutritionInfo.objects.count(), infos)
+
+        apply_changes([(date(2011, 6, 1), 'breakfast', 2, NutritionVector(calories=50))])
+        apply_changes([(date(2011, 6, 1), 'breakfast', 1, NutritionVector(calories=25))])
+        self.assertEqual(self.rollups('day'), [(date(2011, 6, 1), u'breakfast', 3, 75, 0)])
+        apply_changes([(date(2011, 6, 1), 'breakfast', -3, NutritionVector(calories=-75))])
+        self.assertEqual(self.rollups('day'), [])
+
+
+    def test_intake(self):
+        """Intake is read from the rollups, over all kinds or just one.
+        """
+        Meal.objects.create(date=date(2011, 6, 1), kind='breakfast', recipe=self.omelet)
+        Meal.objects.create(date=date(2011, 6, 30), kind='dinner', recipe=self.toast)
+        Meal.objects.create(date=date(2011, 7, 4), kind='dinner', recipe=self.toast)
+        with self.assertNumQueries(1):
+            months = intake('month', date(2011, 6, 15), date(2011, 7, 15))
+        self.assertEqual([(start, meals, vector.calories) for start, meals, vector in months],
+                         [(date(2011, 6, 1), 2, 400), (date(2011, 7, 1), 1, 100)])
+        weeks = intake('week', date(2011, 6, 1), date(2011, 7, 31), kind='dinner')
+        self.assertEqual([start for start, meals, vector in weeks],
+                         [date(2011, 6, 27), date(2011, 7, 4)])
+
+
+    def test_rebuild(self):
+        """Rebuilding gives the same rollups as keeping them up to date.
+        """
+        Meal.objects.create(date=date(2011, 6, 1), kind='breakfast', recipe=self.omelet)
+        Meal.objects.create(date=date(2011, 6, 1), kind='breakfast', recipe=self.toast)
+        Meal.objects.create(date=date(2011, 6, 9), kind='lunch', recipe=self.toast)
+        expected = [self.rollups(period) for period in ('day', 'week', 'month')]
+        NutritionRollup.objects.all().delete()
+        self.assertEqual(rebuild_rollups(), 3)
+        self.assertEqual([self.rollups(period) for period in ('day', 'week', 'month')],
+                         expected)
+
+        output = StringIO()
+        management.call_command('rebuild_nutrition_rollups', stdout=output)
+        self.assertTrue('Rolled up 3 meals' in output.getvalue())
+
+
+class RollupTransactionTest (TransactionTestCase):
+    def tearDown(self):
+        # Nothing is rolled back after these tests
+        management.call_command('flush', verbosity=0, interactive=False)
+
+
+    def test_failed_save_rolls_back(self):
+        """Rollups are updated in the caller's transaction, so they are rolled
+        back with meals whose save fails partway through.
+        """
+        omelet = Recipe.objects.create(name='Omelet')
+        omelet.nutrition_info.set_equal(NutritionVector(calories=300))
+
+        def save_meals():
+            Meal.objects.create(date=date(2011, 6, 1), kind='breakfast', recipe=omelet)
+            Meal.objects.create(date=date(2011, 6, 2), kind='breakfast', recipe=omelet)
+            raise RuntimeError("Failed partway through")
+        self.assertRaises(RuntimeError, transaction.commit_on_success(save_meals))
+        self.assertEqual(Meal.objects.count(), 0)
+        self.assertEqual(NutritionRollup.objects.count(), 0)
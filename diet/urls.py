@@ -9,6 +9,8 @@ urlpatterns = patterns(
     url(r'^meals/$', 'meal_calendar', {}, 'diet_meal_calendar'),
     url(r'^meals/(?P<yyyy_mm>\d{4}-\d{2})/$', 'meal_calendar', {}, 'diet_meal_calendar'),
     url(r'^meals/(?P<yyyy_mm_dd>\d{4}-\d{2}-\d{2})/add/$', 'add_meal', {}, 'diet_meal_add'),
+    url(r'^plans/(?P<plan_id>\d+)/compliance/$', 'plan_compliance', {},
+        'diet_plan_compliance'),
 )
 
 # Experiments
@@ -1,11 +1,18 @@
 from datetime import datetime
-from django.shortcuts import render_to_response
-from django.http import HttpResponseRedirect
+from django.shortcuts import render_to_response, get_object_or_404
+from django.http import HttpResponse, HttpResponseRedirect, HttpResponseBadRequest
+from django.utils import simplejson
 from diet.forms import MealForm
+from diet.models import DietPlan
+from diet.compliance import compliance
+
+# Most days that may be compared with a plan at once
+MAX_COMPLIANCE_DAYS = 3 * 366
 
 def index(request):
     vars = {
-        'this_month': datetime.today()
+        'this_month': datetime.today(),
+        'today': datetime.today(),
     }
     return render_to_response('diet/index.html', vars)
 
@@ -41,3 +48,40 @@ def add_meal(request, yyyy_mm_dd):
     return render_to_response('diet/add_meal.html', vars)
 
 
+
+
+def plan_compliance(request, plan_id):
+    """Return the daily intake from ``start`` to ``end`` (``YYYY-MM-DD``)
+    compared with a diet plan's targets, as JSON::
+
+        {"days": ["2011-06-01", ...],
+         "nutrients": [{"name": "calories", "label": "Calories", "unit": "",
+                        "target": 2000.0, "actual": [1850.0, ...]}, ...],
+         "servings": [{"food_group": "Vegetables", "unit": "cup",
+                       "target": 2.5, "actual": [1.5, ...]}, ...]}
+    """
+    diet_plan = get_object_or_404(DietPlan, pk=plan_id)
+    try:
+        start = datetime.strptime(request.GET.get('start', ''), '%Y-%m-%d').date()
+        end = datetime.strptime(request.GET.get('end', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return HttpResponseBadRequest("start and end must be dates (YYYY-MM-DD)")
+    if not 0 <= (end - start).days < MAX_COMPLIANCE_DAYS:
+        return HttpResponseBadRequest(
+            "end must be after start, and at most %d days later" % MAX_COMPLIANCE_DAYS)
+
+    result = compliance(diet_plan, start, end)
+    data = {
+        'days': [day.strftime('%Y-%m-%d') for day in result.days],
+        'nutrients': [
+            {'name': nutrient.name, 'label': nutrient.label, 'unit': nutrient.unit,
+             'target': target, 'actual': actual.tolist()}
+            for nutrient, target, actual in result.nutrients
+        ],
+        'servings': [
+            {'food_group': target.food_group.name, 'unit': target.unit.name,
+             'target': target.quantity, 'actual': actual.tolist()}
+            for target, actual in result.servings
+        ],
+    }
+    return HttpResponse(simplejson.dumps(data), mimetype='application/json')
@@ -0,0 +1,237 @@
+"""
+Finding the recipes that can be made from the provisions on hand.
+
+Amounts of a food are compared in grams wherever their units allow (weights
+directly, volumes through the food's density); amounts in units that cannot
+be converted to grams, or with no unit, are only compared with amounts in the
+same unit. An amount is kept as a dict of ``{unit: quantity}``, where `unit`
+is `GRAMS` or the id of such an unconvertible unit (or None).
+
+Rather than checking every recipe, :py:func:`match_recipes` walks an inverted
+index from each food to the recipes needing it (:py:class:`RecipeFoodIndex`),
+only for the foods on hand, counting for each recipe how many of its
+ingredients are covered. Optional ingredients are left out entirely. The index
+is built with one query and cached per process until ingredients, foods or
+units change. Other processes learn of ingredient changes once per request
+(see :py:mod:`core.middleware`), however many ingredients were saved;
+outside of a request, call ``recipe_food_index.announce()``.
+"""
+
+from django.db import models
+from django.dispatch import receiver
+from django.core.signals import request_started
+from core.helpers import amounts_to_grams
+from core.middleware import after_request
+from core.models import CacheGeneration, Food, Unit, Equivalence
+from core.conversion_table import GENERATION as CONVERSIONS
+from cookbook.models import Recipe, Ingredient
+from cookbook.importer import catalog_imported
+from inventory.models import Provision
+
+# Key for amounts measured in grams
+GRAMS = 'g'
+
+# Name of the CacheGeneration bumped whenever any Ingredient changes
+GENERATION = 'ingredients'
+
+# Allowance for rounding when comparing amounts
+TOLERANCE = 1e-6
+
+
+def amounts(rows):
+    """Given ``(food_id, quantity, unit_id, density)`` rows, return a dict
+    of ``{food_id: amount}`` with the total of each food's rows, converting
+    all the units that can be converted to grams.
+    """
+    rows = list(rows)
+    grams, valid = amounts_to_grams(
+        [row[1] for row in rows], [row[2] for row in rows], [row[3] for row in rows])
+    totals = {}
+    for (food_id, quantity, unit_id, density), gram, ok in zip(rows, grams, valid):
+        amount = totals.setdefault(food_id, {})
+        if ok:
+            amount[GRAMS] = amount.get(GRAMS, 0.0) + gram
+        else:
+            amount[unit_id] = amount.get(unit_id, 0.0) + quantity
+    return totals
+
+
+def covers(have, need):
+    """Return True if the amount `have` is at least the amount `need`.
+    """
+    for unit, quantity in need.iteritems():
+        if have.get(unit, 0.0) < quantity - TOLERANCE:
+            return False
+    return True
+
+
+def on_hand():
+    """Return a dict of ``{food_id: amount}`` for all provisions.
+    """
+    return amounts(Provision.objects.values_list(
+        'food', 'quantity', 'unit', 'food__grams_per_ml'))
+
+
+class RecipeFoodIndex (object):
+    """Inverted index from each food to the recipes needing it.
+    """
+    def __init__(self):
+        self._generation = None
+        self._checked = False
+        self._unannounced = False
+        self.postings = {}
+        self.required = {}
+
+
+    def expire(self):
+        """Check the index against other processes' changes on next use.
+        """
+        self._checked = False
+
+
+    def invalidate(self):
+        """Rebuild the index on next use.
+        """
+        self._generation = None
+        self._checked = False
+
+
+    def ingredients_changed(self):
+        """Rebuild the index on next use, and tell other processes to do the
+        same at the next :py:meth:`announce`.
+        """
+        self.invalidate()
+        self._unannounced = True
+
+
+    def announce(self):
+        """Tell other processes to rebuild their index, if ingredients have
+        changed since the last call.
+        """
+        if self._unannounced:
+            self._unannounced = False
+            CacheGeneration.bump(GENERATION)
+            # This process may have rebuilt its index since
+            self.invalidate()
+
+
+    def _load(self):
+        """Rebuild the index if ingredients, foods or units have changed.
+        """
+        if self._checked:
+            return
+        generation = sorted(CacheGeneration.objects.filter(
+            name__in=[CONVERSIONS, GENERATION]).values_list('name', 'value'))
+        if generation != self._generation:
+            self._build()
+            self._generation = generation
+        self._checked = True
+
+
+    def _build(self):
+        """Load the required (not optional) ingredients of all recipes.
+        `postings` maps each food id to a list of ``(recipe_id, amount)``,
+        and `required` maps each recipe id to its number of distinct foods.
+        """
+        rows = Ingredient.objects.filter(optional=False).values_list(
+            'recipe', 'food', 'quantity', 'unit', 'food__grams_per_ml')
+        # Sum up each food's amount within each recipe
+        needed = amounts(((recipe_id, food_id), quantity, unit_id, density)
+                         for recipe_id, food_id, quantity, unit_id, density in rows)
+        self.postings = {}
+        self.required = {}
+        for (recipe_id, food_id), amount in needed.iteritems():
+            self.postings.setdefault(food_id, []).append((recipe_id, amount))
+            self.required[recipe_id] = self.required.get(recipe_id, 0) + 1
+
+
+    def scores(self, provisions):
+        """Return a dict of ``{recipe_id: covered}``, the number of each
+        recipe's required foods covered by `provisions`, a dict of
+        ``{food_id: amount}``. Recipes covering none are left out.
+        """
+        self._load()
+        covered = {}
+        for food_id, have in provisions.iteritems():
+            for recipe_id, need in self.postings.get(food_id, ()):
+                if covers(have, need):
+                    covered[recipe_id] = covered.get(recipe_id, 0) + 1
+        return covered
+
+
+# Process-wide index, invalidated by the signals below
+recipe_food_index = RecipeFoodIndex()
+
+def match_recipes(provisions=None, limit=20):
+    """Return a list of up to `limit` ``(recipe, covered, required)`` for the
+    recipes best covered by `provisions` (by default, all `Provision`\s on
+    hand): `covered` of the recipe's `required` foods are on hand in at least
+    the amounts needed. Recipes are ranked by the fraction covered, then by
+    how few foods are missing.
+    """
+    if provisions is None:
+        provisions = on_hand()
+    covered = recipe_food_index.scores(provisions)
+    required = recipe_food_index.required
+    ranked = sorted(covered, key=lambda recipe_id: (
+        -float(covered[recipe_id]) / required[recipe_id],
+        required[recipe_id] - covered[recipe_id],
+        recipe_id,
+    ))[:limit]
+    recipes = Recipe.objects.select_related('category', 'portion').in_bulk(ranked)
+    return [
+        (recipes[recipe_id], covered[recipe_id], required[recipe_id])
+        for recipe_id in ranked if recipe_id in recipes
+    ]
+
+
+# Signals
+
+@receiver(models.signals.post_save, sender=Ingredient)
+@receiver(models.signals.post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    """After an `Ingredient` is saved or deleted, rebuild the index here, and
+    note that other processes must too.
+    """
+    if kwargs.get('raw'):
+        recipe_food_index.invalidate()
+        CacheGeneration.bump_after_load(GENERATION)
+    else:
+        recipe_food_index.ingredients_changed()
+
+
+@receiver(catalog_imported)
+def catalog_loaded(sender, **kwargs):
+    """After a catalog is imported, rebuild the index here and in other
+    processes.
+    """
+    recipe_food_index.ingredients_changed()
+    recipe_food_index.announce()
+
+
+@after_request
+def announce_changes():
+    """At the end of a request, tell other processes about the ingredients it
+    changed.
+    """
+    recipe_food_index.announce()
+
+
+@receiver(models.signals.post_save, sender=Food)
+@receiver(models.signals.post_delete, sender=Food)
+@receiver(models.signals.post_save, sender=Unit)
+@receiver(models.signals.post_delete, sender=Unit)
+@receiver(models.signals.post_save, sender=Equivalence)
+@receiver(models.signals.post_delete, sender=Equivalence)
+def conversions_changed(sender, **kwargs):
+    """After a food density or unit conversion may have changed, rebuild the
+    index. Other processes see the change through `CacheGeneration`.
+    """
+    recipe_food_index.invalidate()
+
+
+@receiver(request_started)
+def expire_recipe_food_index(sender, **kwargs):
+    """Check the index against other processes' changes once per request.
+    """
+    recipe_food_index.expire()
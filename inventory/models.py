@@ -22,3 +22,9 @@ class Provision (ModelWrapper):
     def __unicode__(self):
         return format_food_unit(self.quantity, self.unit, self.food)
 
+
+# Signals
+
+# Recipes are matched to provisions through an index that is rebuilt when
+# ingredients change; see `inventory.matching`.
+from inventory import matching
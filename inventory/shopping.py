@@ -0,0 +1,122 @@
+"""
+Building one consolidated shopping list for a set of recipes or meals.
+
+All the ingredients needed are loaded with a single query, and summed per
+food as :py:func:`core.helpers.add_amount` would: each food's total is given
+in the unit it first appears in, with every other amount converted to that
+unit (through grams, using the food's density where weights and volumes
+meet). Amounts in units that cannot be converted, or with no unit, are summed
+separately per unit. The provisions on hand are then subtracted in the same
+way as :py:func:`core.helpers.subtract_amount`, leaving only what is still to
+be bought.
+
+Every conversion is done in memory with the bulk helpers, so a week of meals
+takes the same handful of queries as a single recipe.
+"""
+
+from core.helpers import amounts_to_grams
+from core.models import Food, Unit
+from core.utils import format_food_unit
+from cookbook.models import Ingredient
+from diet.models import Meal
+from inventory.matching import GRAMS, TOLERANCE, amounts, on_hand
+
+
+class ShoppingItem (object):
+    """A quantity of food to buy.
+    """
+    def __init__(self, quantity, unit, food):
+        self.quantity = quantity
+        self.unit = unit
+        self.food = food
+
+
+    def __unicode__(self):
+        return format_food_unit(self.quantity, self.unit, self.food)
+
+
+def meal_recipe_ids(start, end):
+    """Return a list of the recipe ids of all meals from `start` to `end`
+    (inclusive), once for each meal.
+    """
+    return list(Meal.objects.filter(date__gte=start, date__lte=end)
+                .values_list('recipe', flat=True))
+
+
+def needed(recipe_ids, optional=False):
+    """Return ``(totals, units)`` for the ingredients of the recipes with the
+    given ids; a recipe listed more than once is needed that many times.
+    `totals` is a dict of ``{food_id: amount}``, as in
+    :py:func:`inventory.matching.amounts`, and `units` a dict of ``{food_id:
+    [unit_id, ...]}`` with the units each food is used in, in order of first
+    appearance. Optional ingredients are left out unless `optional` is True.
+    """
+    times = {}
+    for recipe_id in recipe_ids:
+        times[recipe_id] = times.get(recipe_id, 0) + 1
+    ingredients = Ingredient.objects.filter(recipe__in=times.keys())
+    if not optional:
+        ingredients = ingredients.filter(optional=False)
+    rows = []
+    units = {}
+    for recipe_id, food_id, quantity, unit_id, density in ingredients.order_by('pk') \
+            .values_list('recipe', 'food', 'quantity', 'unit', 'food__grams_per_ml'):
+        rows.append((food_id, quantity * times[recipe_id], unit_id, density))
+        food_units = units.setdefault(food_id, [])
+        if unit_id not in food_units:
+            food_units.append(unit_id)
+    return amounts(rows), units
+
+
+def _grams_per_unit(units, densities):
+    """Return a dict of ``{(food_id, unit_id): grams}`` for every food and the
+    units it is used in that can be converted to grams.
+    """
+    pairs = [(food_id, unit_id)
+             for food_id, unit_ids in units.iteritems() for unit_id in unit_ids]
+    grams, valid = amounts_to_grams([1.0] * len(pairs),
+                                    [unit_id for food_id, unit_id in pairs],
+                                    [densities.get(food_id) for food_id, unit_id in pairs])
+    return dict((pair, gram) for pair, gram, ok in zip(pairs, grams, valid) if ok)
+
+
+def shopping_list(recipe_ids=(), start=None, end=None, optional=False,
+                  subtract_on_hand=True):
+    """Return a list of `ShoppingItem`\s, ordered by food name, for the
+    recipes with the given ids and the meals from `start` to `end` (if
+    given). What is on hand as `Provision`\s is subtracted unless
+    `subtract_on_hand` is False.
+    """
+    recipe_ids = list(recipe_ids)
+    if start and end:
+        recipe_ids += meal_recipe_ids(start, end)
+    if not recipe_ids:
+        return []
+    totals, units = needed(recipe_ids, optional)
+
+    if subtract_on_hand:
+        have = on_hand()
+        for food_id, amount in totals.iteritems():
+            for unit, quantity in have.get(food_id, {}).iteritems():
+                if unit in amount:
+                    amount[unit] -= quantity
+
+    foods = Food.objects.in_bulk(totals.keys())
+    densities = dict((food_id, food.grams_per_ml) for food_id, food in foods.iteritems())
+    grams_per_unit = _grams_per_unit(units, densities)
+    unit_objects = Unit.objects.in_bulk(
+        [unit_id for unit_ids in units.values() for unit_id in unit_ids if unit_id])
+
+    items = []
+    for food_id, amount in totals.iteritems():
+        for unit, quantity in amount.iteritems():
+            if quantity <= TOLERANCE:
+                continue
+            if unit == GRAMS:
+                # In the first unit the food is used in that has a weight
+                unit = [unit_id for unit_id in units[food_id]
+                        if (food_id, unit_id) in grams_per_unit][0]
+                quantity /= grams_per_unit[(food_id, unit)]
+            items.append(ShoppingItem(quantity, unit_objects.get(unit), foods[food_id]))
+    items.sort(key=lambda item: (item.food.name, item.unit and item.unit.name))
+    return items
@@ -21,3 +21,209 @@ Another way to test that 1 + 1 is equal to 2.
 True
 """}
 
+
+
+from core.models import Food, Unit, CacheGeneration
+from cookbook.models import Recipe
+from inventory.models import Provision
+from inventory.matching import match_recipes, announce_changes, GENERATION
+
+class MatchRecipesTest (TestCase):
+    fixtures = [
+        'test_food',
+        'test_unit',
+        'test_equivalence',
+        'test_food_nutrition_info',
+        'test_nutrition_info',
+        'test_recipe',
+    ]
+    def setUp(self):
+        self.egg = Food.objects.get(name='egg')
+        self.flour = Food.objects.get(name='all-purpose flour')
+        self.butter = Food.objects.get(name='butter')
+        self.cup = Unit.objects.get(name='cup')
+        self.ml = Unit.objects.get(name='milliliter')
+        Recipe.objects.all().delete()
+        self.omelet = Recipe.objects.create(name='Omelet')
+        self.omelet.ingredients.create(quantity=3, food=self.egg)
+        self.omelet.ingredients.create(quantity=1, unit=self.cup, food=self.butter,
+                                       optional=True)
+        self.bread = Recipe.objects.create(name='Egg Bread')
+        self.bread.ingredients.create(quantity=2, food=self.egg)
+        self.bread.ingredients.create(quantity=0.5, unit=self.cup, food=self.flour)
+
+
+    def matches(self):
+        return [(recipe.id, covered, required)
+                for recipe, covered, required in match_recipes()]
+
+
+    def test_ranking(self):
+        """Recipes are ranked by the fraction of their foods on hand, leaving
+        out optional ingredients and recipes with nothing on hand.
+        """
+        self.assertEqual(self.matches(), [])
+        Provision.objects.create(quantity=6, food=self.egg)
+        self.assertEqual(self.matches(), [(self.omelet.id, 1, 1), (self.bread.id, 1, 2)])
+
+
+    def test_quantities(self):
+        """A food is only covered by at least the amount needed, in any unit
+        that can be converted.
+        """
+        Provision.objects.create(quantity=2, food=self.egg)
+        flour = Provision.objects.create(quantity=200, unit=self.ml, food=self.flour)
+        self.assertEqual(self.matches(), [(self.bread.id, 2, 2)])
+        flour.quantity = 50
+        flour.save()
+        self.assertEqual(self.matches(), [(self.bread.id, 1, 2)])
+        # A unit-less amount can't be compared with a cup of flour
+        flour.unit = None
+        flour.quantity = 10
+        flour.save()
+        self.assertEqual(self.matches(), [(self.bread.id, 1, 2)])
+
+
+    def test_ingredient_changes(self):
+        """Changed ingredients are matched without restarting.
+        """
+        Provision.objects.create(quantity=6, food=self.egg)
+        self.assertEqual(self.matches(), [(self.omelet.id, 1, 1), (self.bread.id, 1, 2)])
+        self.omelet.ingredients.create(quantity=1, unit=self.cup, food=self.flour)
+        self.bread.ingredients.filter(food=self.flour).delete()
+        self.assertEqual(self.matches(), [(self.bread.id, 1, 1), (self.omelet.id, 1, 2)])
+
+
+    def test_changes_announced_once(self):
+        """Other processes are told of changed ingredients once per request,
+        and once per load of fixtures.
+        """
+        announce_changes()
+        generation = CacheGeneration.current(GENERATION)
+        for i in range(3):
+            self.omelet.ingredients.create(quantity=1, unit=self.cup, food=self.flour)
+        self.assertEqual(CacheGeneration.current(GENERATION), generation)
+        announce_changes()
+        announce_changes()
+        self.assertEqual(CacheGeneration.current(GENERATION), generation + 1)
+
+        # As when loading fixtures
+        for ingredient in self.omelet.ingredients.all():
+            ingredient.save_base(raw=True)
+        announce_changes()
+        self.assertEqual(CacheGeneration.current(GENERATION), generation + 1)
+        CacheGeneration.bump_loaded()
+        self.assertEqual(CacheGeneration.current(GENERATION), generation + 2)
+
+
+    def test_queries(self):
+        """Once the index is built, matching takes a fixed number of queries.
+        """
+        Provision.objects.create(quantity=6, food=self.egg)
+        match_recipes()
+        # Provisions and recipes; the index is checked once per request
+        self.assertNumQueries(2, match_recipes)
+
+
+    def test_view(self):
+        """The page lists the recipes that can be made.
+        """
+        Provision.objects.create(quantity=6, food=self.egg)
+        response = self.client.get('/inventory/cook/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Omelet')
+        self.assertContains(response, '1 of 2 ingredients on hand')
+
+
+from datetime import date
+from diet.models import Meal
+from inventory.shopping import shopping_list
+
+class ShoppingListTest (TestCase):
+    fixtures = [
+        'test_food',
+        'test_unit',
+        'test_equivalence',
+        'test_food_nutrition_info',
+        'test_nutrition_info',
+        'test_recipe',
+    ]
+    def setUp(self):
+        self.egg = Food.objects.get(name='egg')
+        self.flour = Food.objects.get(name='all-purpose flour')
+        self.butter = Food.objects.get(name='butter')
+        self.cup = Unit.objects.get(name='cup')
+        self.ml = Unit.objects.get(name='milliliter')
+        self.pint = Unit.objects.get(name='pint')
+        self.omelet = Recipe.objects.create(name='Omelet')
+        self.omelet.ingredients.create(quantity=3, food=self.egg)
+        self.omelet.ingredients.create(quantity=1, unit=self.cup, food=self.butter,
+                                       optional=True)
+        self.bread = Recipe.objects.create(name='Egg Bread')
+        self.bread.ingredients.create(quantity=2, food=self.egg)
+        self.bread.ingredients.create(quantity=1, unit=self.cup, food=self.flour)
+        self.bread.ingredients.create(quantity=1, unit=self.pint, food=self.flour)
+
+
+    def items(self, *args, **kwargs):
+        return [(item.food.name, round(item.quantity, 2), item.unit and item.unit.name)
+                for item in shopping_list(*args, **kwargs)]
+
+
+    def test_consolidate(self):
+        """Amounts of the same food are summed in the first unit used.
+        """
+        self.assertEqual(self.items([self.omelet.id, self.bread.id]), [
+            (u'all-purpose flour', 3.0, u'cup'),
+            (u'egg', 5.0, None),
+        ])
+        # A recipe listed twice is needed twice; optional foods on request
+        self.assertEqual(self.items([self.omelet.id, self.omelet.id], optional=True), [
+            (u'butter', 2.0, u'cup'),
+            (u'egg', 6.0, None),
+        ])
+
+
+    def test_meals(self):
+        """Meals in the date range are shopped for.
+        """
+        Meal.objects.create(date=date(2011, 6, 1), kind='breakfast', recipe=self.omelet)
+        Meal.objects.create(date=date(2011, 6, 3), kind='breakfast', recipe=self.omelet)
+        Meal.objects.create(date=date(2011, 6, 9), kind='dinner', recipe=self.bread)
+        self.assertEqual(self.items(start=date(2011, 6, 1), end=date(2011, 6, 7)), [
+            (u'egg', 6.0, None),
+        ])
+
+
+    def test_subtract_on_hand(self):
+        """Provisions on hand are subtracted, in any convertible unit.
+        """
+        Provision.objects.create(quantity=4, food=self.egg)
+        Provision.objects.create(quantity=473.18, unit=self.ml, food=self.flour)
+        self.assertEqual(self.items([self.omelet.id, self.bread.id]), [
+            (u'all-purpose flour', 1.0, u'cup'),
+            (u'egg', 1.0, None),
+        ])
+        self.assertEqual(self.items([self.omelet.id]), [])
+        self.assertEqual(len(self.items([self.omelet.id], subtract_on_hand=False)), 1)
+
+
+    def test_queries(self):
+        """The list takes a fixed number of queries, however many recipes.
+        """
+        recipe_ids = [self.omelet.id, self.bread.id] * 20
+        shopping_list(recipe_ids)
+        # Ingredients, provisions, foods and units
+        self.assertNumQueries(4, lambda: shopping_list(recipe_ids))
+
+
+    def test_view(self):
+        """The shopping list page lists what to buy.
+        """
+        Meal.objects.create(date=date(2011, 6, 1), kind='breakfast', recipe=self.omelet)
+        response = self.client.get('/inventory/shopping/?start=2011-06-01')
+        self.assertContains(response, '3 eggs')
+        response = self.client.get('/inventory/shopping/?recipe=%d' % self.bread.id)
+        self.assertContains(response, 'cups all-purpose flour')
+        response = self.client.get('/inventory/shopping/?start=June')
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,7 @@
+from django.conf.urls.defaults import patterns, url
+
+urlpatterns = patterns(
+    'inventory.views',
+    url(r'^cook/$', 'what_can_i_cook', name='inventory_what_can_i_cook'),
+    url(r'^shopping/$', 'show_shopping_list', name='inventory_shopping_list'),
+)
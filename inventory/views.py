@@ -1 +1,37 @@
-# Create your views here.
+from datetime import datetime, timedelta
+from django.http import HttpResponseBadRequest
+from django.shortcuts import render_to_response
+from inventory.matching import match_recipes
+from inventory.shopping import shopping_list
+
+def what_can_i_cook(request):
+    """List the recipes best covered by the provisions on hand.
+    """
+    variables = {
+        'matches': match_recipes(),
+    }
+    return render_to_response('inventory/what_can_i_cook.html', variables)
+
+
+def show_shopping_list(request):
+    """List what to buy for the recipes given as the comma-separated
+    ``recipe`` ids, and for the meals from ``start`` to ``end``
+    (``YYYY-MM-DD``; by default, a week from ``start``).
+    """
+    try:
+        recipe_ids = [int(pk) for pk in request.GET.get('recipe', '').split(',') if pk]
+        start = end = None
+        if request.GET.get('start'):
+            start = datetime.strptime(request.GET['start'], '%Y-%m-%d').date()
+            end = start + timedelta(days=6)
+        if request.GET.get('end'):
+            end = datetime.strptime(request.GET['end'], '%Y-%m-%d').date()
+    except ValueError:
+        return HttpResponseBadRequest("Invalid recipe ids or dates")
+
+    variables = {
+        'items': shopping_list(recipe_ids, start, end),
+        'start': start,
+        'end': end,
+    }
+    return render_to_response('inventory/shopping_list.html', variables)
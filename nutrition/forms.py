@@ -0,0 +1,43 @@
+from django import forms
+from nutrition import nutrients
+
+# Nutrients stored in `NutritionInfo.packed_nutrients`, in registry order
+PACKED_NUTRIENTS = nutrients.NUTRIENTS[len(nutrients.COLUMNS):]
+
+# Form fields for the packed nutrients, for use in admin fieldsets
+PACKED_FIELDS = tuple(nutrient.name for nutrient in PACKED_NUTRIENTS)
+
+
+def _label(nutrient):
+    """Return the form label for `nutrient`, with its unit.
+    """
+    if nutrient.unit:
+        return u"%s (%s)" % (nutrient.label, nutrient.unit)
+    return nutrient.label
+
+
+class NutritionInfoForm (forms.ModelForm):
+    """Form for any `NutritionInfo` subclass, with a field for each packed
+    nutrient as well as those with their own columns.
+    """
+    def __init__(self, *args, **kwargs):
+        super(NutritionInfoForm, self).__init__(*args, **kwargs)
+        for name in PACKED_FIELDS:
+            if name in self.fields and name not in self.initial:
+                self.initial[name] = getattr(self.instance, name)
+
+
+    def save(self, commit=True):
+        # Validates the form first, if it hasn't been
+        if not self.errors:
+            for name in PACKED_FIELDS:
+                if name in self.fields:
+                    setattr(self.instance, name, self.cleaned_data.get(name) or 0.0)
+        return super(NutritionInfoForm, self).save(commit)
+
+# Declared after the class, since they come from the registry; subclasses
+# (such as those made for admin inlines) inherit `declared_fields`
+for _nutrient in PACKED_NUTRIENTS:
+    _field = forms.FloatField(label=_label(_nutrient), required=False, initial=0.0)
+    NutritionInfoForm.declared_fields[_nutrient.name] = _field
+    NutritionInfoForm.base_fields[_nutrient.name] = _field
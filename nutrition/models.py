@@ -1,4 +1,6 @@
 from django.db import models
+from nutrition import nutrients
+from nutrition.vector import NutritionVector
 #from core.models import ModelWrapper
 
 
@@ -12,6 +14,8 @@ class NutritionInfo (models.Model):
     sodium       = models.FloatField("Sodium (mg)", default=0)
     protein      = models.FloatField("Protein (g)", default=0)
     cholesterol  = models.FloatField("Cholesterol (mg)", default=0)
+    # All other nutrients, packed; see `nutrition.nutrients`
+    packed_nutrients = models.TextField(default='', blank=True, editable=False)
 
     class Meta:
         verbose_name_plural = "Nutrition information"
@@ -37,70 +41,73 @@ class NutritionInfo (models.Model):
     def is_empty(self):
         """Return True if this NutritionInfo is empty.
         """
-        return all([
-            self.calories     == 0,
-            self.fat_calories == 0,
-            self.fat          == 0,
-            self.carb         == 0,
-            self.sodium       == 0,
-            self.protein      == 0,
-            self.cholesterol  == 0,
-        ])
+        return self.vector().is_empty()
 
 
     def is_equal(self, other):
         """Return True if this `NutritionInfo` is equal to another,
         False otherwise.
         """
-        return all([
-            self.calories     == other.calories,
-            self.fat_calories == other.fat_calories,
-            self.fat          == other.fat,
-            self.carb         == other.carb,
-            self.sodium       == other.sodium,
-            self.protein      == other.protein,
-            self.cholesterol  == other.cholesterol,
-        ])
+        return self.vector().is_equal(other)
 
 
     def set_equal(self, other):
-        """Set this `NutritionInfo` equal to another, and save.
+        """Set this `NutritionInfo` equal to another (or to a
+        `NutritionVector`), and save.
         """
-        self.calories     = other.calories
-        self.fat_calories = other.fat_calories
-        self.fat          = other.fat
-        self.carb         = other.carb
-        self.sodium       = other.sodium
-        self.protein      = other.protein
-        self.cholesterol  = other.cholesterol
+        vector = NutritionVector.from_model(other)
+        for field, value in zip(nutrients.COLUMNS, vector.columns()):
+            setattr(self, field, value)
+        self.packed_nutrients = vector.packed()
         self.save()
 
 
+    def extra_nutrients(self):
+        """Return a list of ``(Nutrient, value)`` for each nonzero nutrient
+        other than those with their own columns.
+        """
+        columns = len(nutrients.COLUMNS)
+        return [
+            (nutrient, value)
+            for nutrient, value in zip(nutrients.NUTRIENTS[columns:],
+                                       nutrients.unpack(self.packed_nutrients))
+            if value
+        ]
+
+
+    def vector(self):
+        """Return this `NutritionInfo`'s values as a `NutritionVector`.
+        """
+        return NutritionVector.from_columns(
+            [getattr(self, field) for field in nutrients.COLUMNS], self.packed_nutrients)
+
+
     def __add__(self, other):
-        """Add this `NutritionInfo` to another, and return the sum.
+        """Add this `NutritionInfo` to another (or to a `NutritionVector`), and
+        return the sum as a `NutritionVector`.
         """
-        return NutritionInfo(
-            calories     = self.calories     + other.calories,
-            fat_calories = self.fat_calories + other.fat_calories,
-            fat          = self.fat          + other.fat,
-            carb         = self.carb         + other.carb,
-            sodium       = self.sodium       + other.sodium,
-            protein      = self.protein      + other.protein,
-            cholesterol  = self.cholesterol  + other.cholesterol,
-        )
+        return self.vector() + other
 
 
     def __mul__(self, factor):
-        """Multiply this `NutritionInfo` by `factor`, and return the product.
+        """Multiply this `NutritionInfo` by `factor`, and return the product as
+        a `NutritionVector`.
         """
-        return NutritionInfo(
-            calories     = factor * self.calories,
-            fat_calories = factor * self.fat_calories,
-            fat          = factor * self.fat,
-            carb         = factor * self.carb,
-            sodium       = factor * self.sodium,
-            protein      = factor * self.protein,
-            cholesterol  = factor * self.cholesterol
-        )
+        return self.vector() * factor
 
 
+
+def _packed_property(index):
+    """Return a property giving read and write access to the packed nutrient
+    at `index`.
+    """
+    def getter(self):
+        return nutrients.unpack(self.packed_nutrients)[index]
+    def setter(self, value):
+        values = nutrients.unpack(self.packed_nutrients)
+        values[index] = float(value)
+        self.packed_nutrients = nutrients.pack(values)
+    return property(getter, setter)
+
+for _index, _nutrient in enumerate(nutrients.NUTRIENTS[len(nutrients.COLUMNS):]):
+    setattr(NutritionInfo, _nutrient.name, _packed_property(_index))
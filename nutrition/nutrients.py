@@ -0,0 +1,127 @@
+"""
+Registry of the nutrients tracked by :py:class:`nutrition.models.NutritionInfo`.
+
+The first nutrients (`COLUMNS`) have their own database columns. All the rest
+are stored together in a single packed column: an array of floats, in registry
+order, encoded as text. New nutrients are added by appending a
+:py:func:`register` call to the list below; since packed values are read by
+position, nutrients must only ever be appended, never reordered or removed.
+Packed values written before a nutrient was registered read as zero for it.
+"""
+
+import sys
+import base64
+from array import array
+
+
+class Nutrient (object):
+    """A nutrient, with a human-readable `label` and the `unit` its amounts are
+    measured in.
+    """
+    __slots__ = ('name', 'label', 'unit')
+
+    def __init__(self, name, label, unit=''):
+        self.name = name
+        self.label = label
+        self.unit = unit
+
+    def __unicode__(self):
+        return self.label
+
+    def __repr__(self):
+        return 'Nutrient(%r)' % self.name
+
+
+# All nutrients, in storage order
+NUTRIENTS = []
+
+def register(name, label, unit=''):
+    """Add a nutrient to the end of the registry, and return it.
+    """
+    if name in [nutrient.name for nutrient in NUTRIENTS]:
+        raise ValueError("Nutrient '%s' is already registered" % name)
+    nutrient = Nutrient(name, label, unit)
+    NUTRIENTS.append(nutrient)
+    return nutrient
+
+
+# Nutrients stored in their own columns
+register('calories', 'Calories')
+register('fat_calories', 'Calories from Fat')
+register('fat', 'Fat', 'g')
+register('carb', 'Carbohydrate', 'g')
+register('sodium', 'Sodium', 'mg')
+register('protein', 'Protein', 'g')
+register('cholesterol', 'Cholesterol', 'mg')
+
+COLUMNS = tuple(nutrient.name for nutrient in NUTRIENTS)
+
+# Packed nutrients; append new ones at the end
+register('saturated_fat', 'Saturated Fat', 'g')
+register('trans_fat', 'Trans Fat', 'g')
+register('polyunsaturated_fat', 'Polyunsaturated Fat', 'g')
+register('monounsaturated_fat', 'Monounsaturated Fat', 'g')
+register('fiber', 'Dietary Fiber', 'g')
+register('sugars', 'Sugars', 'g')
+register('added_sugars', 'Added Sugars', 'g')
+register('potassium', 'Potassium', 'mg')
+register('calcium', 'Calcium', 'mg')
+register('iron', 'Iron', 'mg')
+register('magnesium', 'Magnesium', 'mg')
+register('phosphorus', 'Phosphorus', 'mg')
+register('zinc', 'Zinc', 'mg')
+register('copper', 'Copper', 'mg')
+register('manganese', 'Manganese', 'mg')
+register('selenium', 'Selenium', 'mcg')
+register('iodine', 'Iodine', 'mcg')
+register('vitamin_a', 'Vitamin A', 'mcg')
+register('vitamin_c', 'Vitamin C', 'mg')
+register('vitamin_d', 'Vitamin D', 'mcg')
+register('vitamin_e', 'Vitamin E', 'mg')
+register('vitamin_k', 'Vitamin K', 'mcg')
+register('thiamin', 'Thiamin', 'mg')
+register('riboflavin', 'Riboflavin', 'mg')
+register('niacin', 'Niacin', 'mg')
+register('vitamin_b6', 'Vitamin B6', 'mg')
+register('folate', 'Folate', 'mcg')
+register('vitamin_b12', 'Vitamin B12', 'mcg')
+register('pantothenic_acid', 'Pantothenic Acid', 'mg')
+register('biotin', 'Biotin', 'mcg')
+register('choline', 'Choline', 'mg')
+
+
+def names():
+    """Return the names of all registered nutrients, in storage order.
+    """
+    return [nutrient.name for nutrient in NUTRIENTS]
+
+
+def pack(values):
+    """Encode a sequence of packed-nutrient values (those after `COLUMNS`, in
+    registry order) as text. Trailing zeros are dropped.
+    """
+    values = list(values)
+    while values and not values[-1]:
+        values.pop()
+    if not values:
+        return ''
+    values = array('d', values)
+    # Always stored little-endian
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return base64.b64encode(values.tostring())
+
+
+def unpack(text):
+    """Decode text written by :py:func:`pack` into a list of values for every
+    registered packed nutrient.
+    """
+    size = len(NUTRIENTS) - len(COLUMNS)
+    if not text:
+        return [0.0] * size
+    values = array('d')
+    values.fromstring(base64.b64decode(text))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    values = values.tolist()[:size]
+    return values + [0.0] * (size - len(values))
@@ -1,4 +1,7 @@
 from formatting import *
 from add_mult import *
 from other import *
+from vector import *
+from nutrients import *
 
+from forms import *
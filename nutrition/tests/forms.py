@@ -0,0 +1,56 @@
+from django.test import TestCase
+from django.forms.models import modelform_factory
+from nutrition.models import NutritionInfo
+from nutrition.forms import NutritionInfoForm
+
+class NutritionInfoFormTest (TestCase):
+    def setUp(self):
+        self.form_class = modelform_factory(NutritionInfo, form=NutritionInfoForm)
+
+
+    def data(self, **values):
+        data = {
+            'calories': 100, 'fat_calories': 0, 'fat': 0, 'carb': 0,
+            'sodium': 0, 'protein': 0, 'cholesterol': 0,
+        }
+        data.update(values)
+        return data
+
+
+    def test_packed_nutrients_saved(self):
+        """Packed nutrients can be entered, and are saved with the others.
+        """
+        self.assertEqual(self.form_class.base_fields['fiber'].label, 'Dietary Fiber (g)')
+        form = self.form_class(self.data(fiber='4.5', iron=''))
+        self.assertTrue(form.is_valid())
+        info = NutritionInfo.objects.get(pk=form.save().pk)
+        self.assertEqual(info.calories, 100)
+        self.assertEqual(info.fiber, 4.5)
+        self.assertEqual(info.iron, 0.0)
+
+
+    def test_packed_nutrients_shown(self):
+        """Editing a `NutritionInfo` shows its packed nutrients.
+        """
+        info = NutritionInfo(calories=100)
+        info.vitamin_c = 12.0
+        info.save()
+        form = self.form_class(instance=info)
+        self.assertEqual(form.initial['vitamin_c'], 12.0)
+        self.assertTrue('value="12.0"' in unicode(form['vitamin_c']))
+
+        form = self.form_class(self.data(vitamin_c='15'), instance=info)
+        form.save()
+        self.assertEqual(NutritionInfo.objects.get(pk=info.pk).vitamin_c, 15.0)
+
+
+    def test_admin_inlines_valid(self):
+        """The admin inlines using the form refer only to fields it has.
+        """
+        from django.contrib.admin.validation import validate
+        from core.admin import FoodAdmin
+        from core.models import Food
+        from diet.admin import DietPlanAdmin
+        from diet.models import DietPlan
+        validate(FoodAdmin, Food)
+        validate(DietPlanAdmin, DietPlan)
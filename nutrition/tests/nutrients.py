@@ -0,0 +1,52 @@
+from django.test import TestCase
+from nutrition.models import NutritionInfo
+from nutrition.vector import NutritionVector
+from nutrition import nutrients
+
+
+class PackedNutrientTest (TestCase):
+    def test_pack_unpack(self):
+        """Pack and unpack nutrient values.
+        """
+        size = len(nutrients.NUTRIENTS) - len(nutrients.COLUMNS)
+        self.assertEqual(nutrients.pack([0.0] * size), '')
+        self.assertEqual(nutrients.unpack(''), [0.0] * size)
+
+        values = [1.5, 0.0, 2.25]
+        packed = nutrients.pack(values + [0.0] * (size - 3))
+        # Trailing zeros are not stored
+        self.assertEqual(packed, nutrients.pack(values))
+        self.assertEqual(nutrients.unpack(packed), values + [0.0] * (size - 3))
+
+
+    def test_packed_nutrient_attributes(self):
+        """Read and write packed nutrients as NutritionInfo attributes.
+        """
+        info = NutritionInfo(calories=100, fiber=3, vitamin_c=12.5)
+        self.assertEqual(info.fiber, 3)
+        self.assertEqual(info.vitamin_c, 12.5)
+        self.assertEqual(info.iron, 0)
+        info.save()
+
+        info = NutritionInfo.objects.get(pk=info.pk)
+        self.assertEqual(info.calories, 100)
+        self.assertEqual(info.fiber, 3)
+        self.assertEqual(info.vitamin_c, 12.5)
+        self.assertEqual([(n.name, value) for n, value in info.extra_nutrients()],
+                         [('fiber', 3), ('vitamin_c', 12.5)])
+
+
+    def test_packed_nutrient_math(self):
+        """Packed nutrients take part in arithmetic and comparison.
+        """
+        info = NutritionInfo(calories=100, fiber=3)
+        total = (info + NutritionVector(fiber=1, sugars=2)) * 2
+        self.assertEqual(total.calories, 200)
+        self.assertEqual(total.fiber, 8)
+        self.assertEqual(total.sugars, 4)
+        self.assertFalse(info.is_equal(NutritionInfo(calories=100)))
+        self.assertFalse(NutritionInfo(iron=1).is_empty())
+
+        other = NutritionInfo()
+        other.set_equal(total)
+        self.assertTrue(NutritionInfo.objects.get(pk=other.pk).is_equal(total))
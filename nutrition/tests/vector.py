@@ -0,0 +1,50 @@
+from django.test import TestCase
+from nutrition.models import NutritionInfo
+from nutrition.vector import NutritionVector
+
+
+class NutritionVectorTest (TestCase):
+    def setUp(self):
+        self.nutrient = NutritionInfo(
+            calories     = 50,
+            fat_calories = 20,
+            fat          = 5,
+            carb         = 3,
+            sodium       = 10,
+            protein      = 0,
+            cholesterol  = 40,
+        )
+
+
+    def test_vector_from_model(self):
+        """Convert NutritionInfo to NutritionVector and back.
+        """
+        vector = self.nutrient.vector()
+        self.assertEqual(vector.calories, 50)
+        self.assertEqual(vector.cholesterol, 40)
+        self.assertTrue(vector.is_equal(self.nutrient))
+        self.assertTrue(NutritionInfo(**vector.fields()).is_equal(self.nutrient))
+
+
+    def test_vector_math(self):
+        """Add and multiply NutritionVectors.
+        """
+        vector = NutritionVector(calories=10, sodium=5)
+        total = vector + self.nutrient
+        self.assertTrue(isinstance(total, NutritionVector))
+        self.assertEqual(total.calories, 60)
+        self.assertEqual(total.sodium, 15)
+        self.assertEqual(total.fat, 5)
+
+        double = 2 * vector
+        self.assertTrue(double.is_equal(NutritionVector(calories=20, sodium=10)))
+        self.assertTrue(sum([vector, vector]).is_equal(double))
+
+
+    def test_vector_sum(self):
+        """Sum many NutritionVectors and NutritionInfos at once.
+        """
+        total = NutritionVector.sum([self.nutrient] * 3 + [NutritionVector(fat=1)])
+        self.assertTrue(total.is_equal((self.nutrient * 3) + NutritionVector(fat=1)))
+        self.assertTrue(NutritionVector.sum([]).is_empty())
+        self.assertFalse(total.is_empty())
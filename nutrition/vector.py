@@ -0,0 +1,129 @@
+"""
+Lightweight nutrition values for in-memory arithmetic.
+
+Adding or scaling :py:class:`nutrition.models.NutritionInfo` instances yields a
+:py:class:`NutritionVector` rather than a new model instance; convert back with
+:py:meth:`NutritionVector.fields` (or `NutritionInfo.set_equal`) only when the
+result needs to be saved.
+"""
+
+from itertools import izip
+from nutrition import nutrients
+
+# Nutrient names, in the order they are stored in a NutritionVector
+FIELDS = tuple(nutrients.names())
+
+
+def _values(other):
+    """Return the list of nutrient values for a `NutritionVector` or any object
+    with nutrient attributes (such as a `NutritionInfo`).
+    """
+    if isinstance(other, NutritionVector):
+        return other.values
+    if hasattr(other, 'vector'):
+        return other.vector().values
+    return [getattr(other, field, 0.0) for field in FIELDS]
+
+
+class NutritionVector (object):
+    """A list of nutrient values, one per registered nutrient (see
+    :py:mod:`nutrition.nutrients`), which may be read as attributes
+    (``vector.calories``, ``vector.fiber``) like those of a `NutritionInfo`.
+    """
+    __slots__ = ('values',)
+
+    def __init__(self, values=None, **fields):
+        if values is None:
+            values = [float(fields.get(field, 0)) for field in FIELDS]
+        self.values = list(values)
+        if len(self.values) < len(FIELDS):
+            self.values.extend([0.0] * (len(FIELDS) - len(self.values)))
+
+
+    @classmethod
+    def from_model(cls, nutrition_info):
+        """Return a `NutritionVector` with the values of `nutrition_info`.
+        """
+        return cls(_values(nutrition_info))
+
+
+    @classmethod
+    def from_columns(cls, columns, packed):
+        """Return a `NutritionVector` from the values of the nutrient columns
+        (in `nutrients.COLUMNS` order) and the text of the packed nutrients.
+        """
+        return cls(list(columns) + nutrients.unpack(packed))
+
+
+    def columns(self):
+        """Return the values of the nutrients stored in their own columns.
+        """
+        return self.values[:len(nutrients.COLUMNS)]
+
+
+    def packed(self):
+        """Return the packed text of the remaining nutrients.
+        """
+        return nutrients.pack(self.values[len(nutrients.COLUMNS):])
+
+
+    @classmethod
+    def sum(cls, vectors):
+        """Return the sum of all the given vectors (or `NutritionInfo`\s) in one
+        pass, without creating any intermediate results.
+        """
+        totals = [0.0] * len(FIELDS)
+        for vector in vectors:
+            for index, value in enumerate(_values(vector)):
+                totals[index] += value
+        return cls(totals)
+
+
+    def fields(self):
+        """Return a dict of ``{field: value}``, suitable for passing as keyword
+        arguments to a `NutritionInfo` constructor.
+        """
+        return dict(izip(FIELDS, self.values))
+
+
+    def is_empty(self):
+        """Return True if all values are zero.
+        """
+        return not any(self.values)
+
+
+    def is_equal(self, other):
+        """Return True if this vector has the same values as `other`.
+        """
+        return self.values == _values(other)
+
+
+    def __add__(self, other):
+        """Add this vector to another (or to a `NutritionInfo`).
+        """
+        return NutritionVector([a + b for a, b in izip(self.values, _values(other))])
+
+    def __radd__(self, other):
+        # Allow use of the builtin sum(), which starts from 0
+        if other == 0:
+            return self
+        return self + other
+
+
+    def __mul__(self, factor):
+        """Multiply all values by `factor`.
+        """
+        return NutritionVector([factor * value for value in self.values])
+
+    __rmul__ = __mul__
+
+
+    def __repr__(self):
+        return 'NutritionVector(%r)' % self.fields()
+
+
+def _field_property(index):
+    return property(lambda self: self.values[index])
+
+for _index, _field in enumerate(FIELDS):
+    setattr(NutritionVector, _field, _field_property(_index))
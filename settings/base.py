@@ -98,6 +98,7 @@ MIDDLEWARE_CLASSES = (
     #'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'core.middleware.AfterRequestMiddleware',
 )
 
 ROOT_URLCONF = 'vittles.urls'
@@ -149,12 +150,28 @@ INSTALLED_APPS = (
     'inventory',
     'nutrition',
     'diet',
+    'api',
 
     # Add-ons
     #'south',
     'django_nose',
 )
 
+# Unit conversion factors shared between worker processes through a
+# memory-mapped file (see core/conversion_table.py). Leave as None to have
+# each process compute its own.
+# Example: os.path.join(PROJECT_ROOT, 'db', 'vittles_conversions.bin')
+CONVERSION_TABLE_PATH = None
+
+# Rendered recipe pages are cached here (see cookbook/page_cache.py). With more
+# than one server process, use a shared backend such as memcached so that all
+# processes see the same pages.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 SERIALIZATION_MODULES = {
     'yaml': 'core.better_yaml',
 }
@@ -165,6 +182,6 @@ TEST_RUNNER = 'django_nose.NoseTestSuiteRunner'
 NOSE_ARGS = [
     '--with-coverage',
     '--cover-html',
-    '--cover-package=core,cookbook,inventory,nutrition,diet',
+    '--cover-package=core,cookbook,inventory,nutrition,diet,api',
 ]
 
@@ -1,13 +1,153 @@
+// Nutrition summaries fetched so far, by element id (like `recipe_12`). An
+// entry is null while its summary is being fetched.
+var nutrition_summaries = {};
+
+// Most summaries fetched per request (`MAX_NUTRITION_SUMMARIES` in
+// `cookbook.views`)
+var NUTRITION_CHUNK_SIZE = 500;
+
 // Create a popup displayed when hovering over the given selector.
 //
-// `selector` must have an `id` attribute, as well as a child element with
-// `class='popup'`. The content of the `popup` class is displayed when hovering
-// over elements matching `selector`.
-function add_popup(selector) {
+// Elements matching `selector` must have an `id` attribute naming the kind of
+// thing and its id, like `recipe_12` or `ingredient_5`. When one of them whose
+// summary has not been fetched is hovered over, its summary is fetched from
+// `url` (see `cookbook.views.nutrition_summaries`) along with those of other
+// elements not fetched yet, up to `NUTRITION_CHUNK_SIZE` in one request, and
+// kept for later popups. If the summary arrives after the pointer has left the
+// element (or the element is gone from the page), no popup is shown.
+function add_popup(selector, url) {
   $(selector).mouseover(function(event) {
-    $('#' + this.id + ' .popup').show();
+    var element = this;
+    $(element).data('hovered', true);
+    load_nutrition(selector, url, element, function() {
+      var summary = nutrition_summaries[element.id];
+      if (!summary || !$(element).data('hovered') ||
+          !$.contains(document.documentElement, element)) {
+        return;
+      }
+      var popup = $(element).children('.popup');
+      if (!popup.length) {
+        popup = $('<div class="popup"/>').html(summary).appendTo(element);
+      }
+      popup.show();
+    });
   }).mouseout(function() {
-    $('#' + this.id + ' .popup').hide();
+    $(this).data('hovered', false);
+    $(this).children('.popup').hide();
+  });
+}
+
+// Fetch the nutrition summary for `element`, and those of up to
+// `NUTRITION_CHUNK_SIZE` other elements matching `selector` that have not been
+// fetched yet, then call `done`. If the request fails, they are fetched again
+// on the next hover.
+function load_nutrition(selector, url, element, done) {
+  if (element.id in nutrition_summaries) {
+    done();
+    return;
+  }
+  var chunk = [element.id];
+  $(selector).each(function() {
+    if (chunk.length >= NUTRITION_CHUNK_SIZE) {
+      return false;
+    }
+    if (this !== element && !(this.id in nutrition_summaries)) {
+      chunk.push(this.id);
+    }
+  });
+
+  var ids = {};
+  $.each(chunk, function(i, id) {
+    var parts = id.split('_');
+    ids[parts[0]] = (ids[parts[0]] ? ids[parts[0]] + ',' : '') + parts[1];
+    nutrition_summaries[id] = null;
+  });
+  $.getJSON(url, ids, function(data) {
+    $.each(data.summaries, function(kind, summaries) {
+      $.each(summaries, function(id, values) {
+        nutrition_summaries[kind + '_' + id] =
+          format_nutrition(data.nutrients, values);
+      });
+    });
+    done();
+  }).fail(function() {
+    $.each(chunk, function(i, id) {
+      delete nutrition_summaries[id];
+    });
+  });
+}
+
+// Return HTML summarizing nutrient `values`, given the `[name, label, unit]`
+// of each nutrient.
+function format_nutrition(nutrients, values) {
+  var parts = [];
+  $.each(nutrients, function(i, nutrient) {
+    // Like Django's `floatformat`: one decimal place, if there is one
+    var value = Math.round(values[i] * 10) / 10;
+    var unit = nutrient[2] ? nutrient[2] + ' ' : '';
+    parts.push('<b>' + value + '</b> ' + unit + nutrient[1].toLowerCase());
   });
+  return parts.join(', ');
 }
 
+// Search recipes on the server as the user types into `input`.
+//
+// Ranked results are fetched from `url` (see `cookbook.views.search_recipes`)
+// and listed in `results`, which is shown in place of `listing` whenever there
+// is a search query.
+function recipe_search(input, results, listing, url) {
+  var timer = null;
+  var current = '';
+
+  function show(query, page) {
+    $.getJSON(url, {q: query, page: page}, function(data) {
+      // Ignore results for a query that has since been changed
+      if (data.query != current) {
+        return;
+      }
+      var list = $('<ul/>');
+      $.each(data.results, function(i, recipe) {
+        var link = $('<a/>').attr('href', recipe.url);
+        link.append($('<span class="recipe-name"/>').text(recipe.name));
+        link.append($('<span class="recipe-info"/>').text(
+          ' (' + recipe.servings + ')' +
+          (recipe.source ? ' from ' + recipe.source : '')));
+        list.append($('<li class="recipe"/>').append(link));
+      });
+
+      var nav = $('<p class="pages"/>');
+      nav.text(data.count + ' recipes found');
+      if (data.page > 1) {
+        nav.append(' ', $('<a href="#">Previous</a>').click(function() {
+          show(query, data.page - 1);
+          return false;
+        }));
+      }
+      if (data.page < data.num_pages) {
+        nav.append(' ', $('<a href="#">Next</a>').click(function() {
+          show(query, data.page + 1);
+          return false;
+        }));
+      }
+
+      $(results).empty().append(list, nav).show();
+      $(listing).hide();
+    });
+  }
+
+  $(input).keyup(function() {
+    var query = $.trim($(this).val());
+    if (query == current) {
+      return;
+    }
+    current = query;
+    clearTimeout(timer);
+    if (!query) {
+      $(results).hide();
+      $(listing).show();
+      return;
+    }
+    // Wait for a pause in typing before searching
+    timer = setTimeout(function() { show(query, 1); }, 250);
+  });
+}
@@ -11,5 +11,7 @@ urlpatterns = patterns(
 
     (r'^cookbook/', include('cookbook.urls')),
     (r'^diet/', include('diet.urls')),
+    (r'^inventory/', include('inventory.urls')),
+    (r'^api/', include('api.urls')),
 )
 